@@ -0,0 +1,1347 @@
+# -*- coding: utf-8 -*-
+"""
+The acquisition loop and its helpers.
+Nothing in here touches Qt, so the loop can run in THREADFlow (a QThread)
+or in a dedicated child process (AcquisitionProcess).
+"""
+import itertools
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing import Pipe, Process, Queue, shared_memory
+
+import numpy as np
+import propar
+import serial.tools.list_ports
+
+from diagnostics import InstrumentedInstrument
+from event_log import DEBUG, configure, get_log
+
+_acquisition_log = get_log('acquisition')
+_safety_log = get_log('safety')
+_connection_log = get_log('connection')
+
+
+def percentile(values, q):
+    """
+    Returns the q-th percentile (0-100) of a sequence: the sorted value at
+    index round(q / 100 * (n - 1)), without interpolation.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = int(round(q / 100.0 * (len(ordered) - 1)))
+    return ordered[rank]
+
+
+def read_chained(instrument, parameters):
+    """
+    Reads several parameters in one propar request message.
+    parameters: propar parameter dicts (instrument.db.get_parameters).
+    Returns a dict {dde_nr: value}; a value is None if its read failed.
+    If the device rejects the chained message (not a timeout), falls back to
+    one request per parameter.
+    """
+    dde_numbers = [parm['dde_nr'] for parm in parameters]
+    # The library mutates the parameter objects, so pass copies.
+    response = instrument.read_parameters([dict(parm) for parm in parameters])
+    values = dict.fromkeys(dde_numbers)
+
+    if response is not None and len(response) == len(dde_numbers):
+        for dde_nr, parm in zip(dde_numbers, response):
+            if parm.get('status', propar.PP_STATUS_OK) == propar.PP_STATUS_OK:
+                values[dde_nr] = parm['data']
+    elif response and response[0].get('status') != propar.PP_STATUS_TIMEOUT_ANSWER:
+        values = {dde_nr: instrument.readParameter(dde_nr) for dde_nr in dde_numbers}
+
+    return values
+
+
+class PollScheduler:
+    """
+    Decides which parameters are read on each acquisition tick.
+
+    The loop ticks at the fastest rate (the base period). Every parameter gets
+    a rate class expressed as a whole number of base ticks, so parameters that
+    fall due on the same tick are always merged into one bus transaction.
+    """
+
+    def __init__(self, base_period, periods):
+        """
+        base_period: tick period in seconds (the fastest rate, e.g. pressure).
+        periods: dict {dde_nr: period in seconds}. Periods shorter than the
+                 base period are raised to it, others are rounded to a whole
+                 number of ticks.
+        """
+        self.base_period = float(base_period)
+        self.divisors = {}
+        for dde_nr, period in periods.items():
+            self.divisors[dde_nr] = max(1, int(round(float(period) / self.base_period)))
+        self.next_tick = dict.fromkeys(self.divisors, 0)
+
+    def period_of(self, dde_nr):
+        """Returns the effective polling period of a parameter in seconds."""
+        return self.divisors[dde_nr] * self.base_period
+
+    def due(self, tick):
+        """
+        Returns the list of DDE numbers to read on this tick.
+        A parameter whose slot was skipped (missed tick) is read on the next one.
+        """
+        due = []
+        for dde_nr, divisor in self.divisors.items():
+            if tick >= self.next_tick[dde_nr]:
+                due.append(dde_nr)
+                self.next_tick[dde_nr] = (tick // divisor + 1) * divisor
+        return due
+
+    def reset(self):
+        """Makes every parameter due on the next tick (e.g. after a reconnect)."""
+        self.next_tick = dict.fromkeys(self.divisors, 0)
+
+
+class SamplingClock:
+    """
+    Sampling clock based on absolute monotonic deadlines.
+
+    Deadlines sit on a fixed grid (anchor + n * period), so the time spent
+    reading never accumulates as drift. When a cycle overruns, the deadlines
+    already in the past are skipped and counted as missed instead of being
+    run back to back.
+
+    time.monotonic() is immune to NTP steps. Wall-clock timestamps for the
+    plot and logs are derived from it through a single anchor taken when the
+    clock is created.
+    """
+
+    def __init__(self, period, window=600):
+        """
+        period: grid period in seconds.
+        window: number of recent cycles kept for the jitter/latency percentiles.
+        """
+        self.period = float(period)
+        self.wall_anchor = time.time()
+        self.mono_anchor = time.monotonic()
+        self.tick = 0            # Grid index of the next deadline
+        self.missed = 0          # Deadlines skipped because a cycle overran
+        self.jitter = deque(maxlen=window)   # Wake-up lateness after each deadline (s)
+        self.latency = deque(maxlen=window)  # Duration of the work in each cycle (s)
+
+    def deadline(self, tick):
+        """Monotonic time of the given grid point."""
+        return self.mono_anchor + tick * self.period
+
+    def wait(self, idle=time.sleep):
+        """
+        Blocks until the next deadline and returns its grid index.
+        If the deadline has already passed by one period or more, the missed
+        grid points are skipped.
+        idle(timeout) is called to pass the time until the deadline; it may
+        return early (e.g. after serving a command) and is then called again.
+        """
+        now = time.monotonic()
+        target = self.deadline(self.tick)
+        if now < target:
+            while now < target:
+                idle(target - now)
+                now = time.monotonic()
+        else:
+            late_ticks = int((now - target) / self.period)
+            if late_ticks:
+                self.missed += late_ticks
+                self.tick += late_ticks
+                target = self.deadline(self.tick)
+
+        self.jitter.append(now - target)
+        tick = self.tick
+        self.tick += 1
+        return tick
+
+    def resync(self):
+        """
+        Moves the next deadline to the first grid point after now, without
+        counting the skipped ones as missed (used after a deliberate pause,
+        e.g. while the device is offline).
+        """
+        elapsed = time.monotonic() - self.mono_anchor
+        self.tick = max(self.tick, int(elapsed / self.period) + 1)
+
+    def record_latency(self, duration):
+        """Stores how long the work of one cycle took (seconds)."""
+        self.latency.append(duration)
+
+    def to_wall(self, mono_time):
+        """Converts a time.monotonic() value to seconds since the epoch."""
+        return self.wall_anchor + (mono_time - self.mono_anchor)
+
+    def stats(self):
+        """Returns the rolling timing statistics, times in milliseconds."""
+        jitter = list(self.jitter)
+        latency = list(self.latency)
+        return {
+            'cycles': self.tick,
+            'missed': self.missed,
+            'jitter_p50_ms': percentile(jitter, 50) * 1000.0,
+            'jitter_p99_ms': percentile(jitter, 99) * 1000.0,
+            'jitter_max_ms': max(jitter, default=0.0) * 1000.0,
+            'latency_p50_ms': percentile(latency, 50) * 1000.0,
+            'latency_p99_ms': percentile(latency, 99) * 1000.0,
+            'latency_max_ms': max(latency, default=0.0) * 1000.0,
+        }
+
+
+# One record per acquisition tick. Parameters not read on a tick are stored
+# as -1 (valve, status), the pressure is always present.
+SAMPLE_DTYPE = np.dtype([
+    ('time', 'f8'),       # Wall-clock timestamp (s since epoch)
+    ('measure', 'i4'),    # Raw measure, param 8 (0-32000)
+    ('pressure', 'f8'),   # Measure converted to bar
+    ('valve', 'i4'),      # Raw valve output, param 55
+    ('status', 'i4'),     # Alarm/status word, param 28
+])
+
+
+class SampleRing:
+    """
+    Fixed-size ring of acquisition samples with one writer and any number of
+    readers, each keeping its own cursor.
+
+    The writer stores the record first and only then advances the write
+    counter, so a reader never sees a half-written record. A reader that
+    falls more than `capacity` samples behind loses the oldest ones and is
+    told how many.
+
+    The header and records live in a single buffer, which may be a plain
+    bytearray or a shared-memory block mapped by another process.
+    """
+
+    HEADER = np.dtype([('count', 'u8'), ('capacity', 'u8')])
+
+    DEFAULT_CAPACITY = 4096
+
+    def __init__(self, capacity=None, buffer=None, readonly=False):
+        """
+        capacity: number of samples. When attaching to an existing buffer,
+                  leave it as None to use the capacity stored in its header.
+        buffer: memory to use (e.g. SharedMemory.buf); allocated if None.
+        readonly: map the records read-only (reader in another process).
+        """
+        if buffer is None:
+            capacity = capacity or self.DEFAULT_CAPACITY
+            buffer = bytearray(self.nbytes(capacity))
+        self.header = np.ndarray((1,), dtype=self.HEADER, buffer=buffer)
+        if capacity is not None:
+            # New ring: initialise the header
+            self.header['count'] = 0
+            self.header['capacity'] = capacity
+        else:
+            capacity = int(self.header['capacity'][0])
+        self.capacity = int(capacity)
+        self.records = np.ndarray((self.capacity,), dtype=SAMPLE_DTYPE, buffer=buffer,
+                                  offset=self.HEADER.itemsize)
+        if readonly:
+            # Reader-side view of a ring written by another process
+            self.header.flags.writeable = False
+            self.records.flags.writeable = False
+
+    @classmethod
+    def nbytes(cls, capacity):
+        """Buffer size needed for a ring of the given capacity."""
+        return cls.HEADER.itemsize + capacity * SAMPLE_DTYPE.itemsize
+
+    @property
+    def count(self):
+        """Total number of samples written since the ring was created."""
+        return int(self.header['count'][0])
+
+    def append(self, timestamp, measure, pressure, valve=-1, status=-1):
+        """Writes one sample (writer side only)."""
+        count = self.count
+        self.records[count % self.capacity] = (timestamp, measure, pressure, valve, status)
+        self.header['count'] = count + 1
+
+    def read_since(self, cursor):
+        """
+        Returns (records, new_cursor, lost): a copy of every sample written
+        since `cursor`, the cursor to pass next time, and how many samples
+        were overwritten before they could be read.
+        """
+        count = self.count
+        lost = 0
+        if count - cursor > self.capacity:
+            lost = count - self.capacity - cursor
+            cursor = count - self.capacity
+        if count == cursor:
+            return self.records[:0].copy(), cursor, lost
+
+        start = cursor % self.capacity
+        end = count % self.capacity
+        if start < end:
+            records = self.records[start:end].copy()
+        else:
+            records = np.concatenate((self.records[start:], self.records[:end]))
+
+        # The writer may have lapped us while copying: drop the torn records
+        overwritten = self.count - self.capacity - cursor
+        if overwritten > 0:
+            records = records[overwritten:]
+            lost += overwritten
+        return records, count, lost
+
+
+def propar_to_bar(propar_value, capacity):
+    """Converts a raw Propar value (0-32000) to the absolute unit (bar)."""
+    if propar_value is None or capacity == 0:
+        return 0.0
+    return (float(propar_value) / 32000.0) * capacity
+
+
+def bar_to_propar(bar_value, capacity):
+    """Converts an absolute unit (bar) to a raw Propar value (0-32000)."""
+    if bar_value is None or capacity == 0:
+        return 0
+    return int(max(0.0, min(32000.0, bar_value / capacity * 32000.0)))
+
+
+class ShadowRegister:
+    """
+    Last confirmed value of each parameter of one instrument (acknowledged
+    write or successful read), used to drop writes that would not change
+    anything. Only trusted between two invalidations: the loop clears it when
+    the device goes offline, and clears the values an alarm action may change.
+    """
+
+    # Writing these triggers an action on the device (7 init/reset mode,
+    # 114 alarm reset), so they are always sent
+    ACTION_PARAMETERS = (7, 114)
+
+    def __init__(self):
+        self.values = {}
+        self.hits = 0       # Writes to a parameter with a known value
+        self.skipped = 0    # ... of which the value was unchanged and not sent
+
+    def is_redundant(self, dde_nr, value):
+        if dde_nr in self.ACTION_PARAMETERS or dde_nr not in self.values:
+            return False
+        self.hits += 1
+        if self.values[dde_nr] == value:
+            self.skipped += 1
+            return True
+        return False
+
+    def record(self, dde_nr, value):
+        if value is None:
+            self.values.pop(dde_nr, None)
+        else:
+            self.values[dde_nr] = value
+
+    def invalidate(self, *dde_numbers):
+        """Forgets the given parameters, or everything if none are given."""
+        if not dde_numbers:
+            self.values.clear()
+        for dde_nr in dde_numbers:
+            self.values.pop(dde_nr, None)
+
+    def stats(self):
+        return {'shadow_hits': self.hits, 'shadow_skipped': self.skipped, 'shadow_size': len(self.values)}
+
+
+class _Command:
+    """One queued job of a CommandQueue."""
+
+    def __init__(self, steps, priority, sequence):
+        self.steps = list(steps)
+        self.priority = priority
+        self.sequence = sequence
+        self.position = 0          # Next step to run
+        self.not_before = 0.0      # Monotonic time the job may resume at (after a 'wait')
+        self.results = []
+        self.future = Future()
+
+
+class CommandQueue:
+    """
+    Prioritised queue of instrument commands, executed between two polling
+    ticks by the thread that owns the serial port, so the GUI never waits on
+    the bus.
+
+    A command is a list of steps run in order:
+        ('read', dde_nr)          -> the value (None if the read failed)
+        ('read_chained', dde_numbers) -> list of values, fetched with one
+                                     chained request
+        ('write', dde_nr, value)  -> what writeParameter returned, or True
+                                     without sending if `shadow` says the
+                                     device already holds the value
+        ('write', dde_nr, value, True) -> always sent
+        ('wait', seconds)         -> the rest of the command is postponed;
+                                     polling and other commands go on meanwhile
+        ('time',)                 -> time.perf_counter() when the step is
+                                     reached, i.e. once the steps before it
+                                     are acknowledged
+    submit() returns a concurrent.futures.Future resolved with the list of
+    step results ('wait' steps included, as None).
+
+    SAFETY commands run before every ROUTINE command, even when the next tick
+    is already due, and replace the routine writes of the same parameters that
+    are still queued (a late "back to PID" must not undo a valve close).
+    """
+
+    SAFETY = 0
+    ROUTINE = 1
+
+    def __init__(self):
+        self._commands = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        # Only touched by the thread that runs the commands
+        self.shadow = ShadowRegister()
+
+    def submit(self, steps, priority=ROUTINE):
+        command = _Command(steps, priority, next(self._sequence))
+        with self._condition:
+            if priority == self.SAFETY:
+                self._supersede(command)
+            self._commands.append(command)
+            self._condition.notify_all()
+        return command.future
+
+    def _supersede(self, safety_command):
+        written = {step[1] for step in safety_command.steps if step[0] == 'write'}
+        for command in self._commands:
+            if command.priority == self.SAFETY:
+                continue
+            for i in range(command.position, len(command.steps)):
+                step = command.steps[i]
+                if step[0] == 'write' and step[1] in written:
+                    _safety_log.info("Safety command replaces a queued write", param=step[1])
+                    command.steps[i] = ('skip', step[1])
+
+    def pending(self):
+        with self._condition:
+            return len(self._commands)
+
+    def next_delay(self):
+        """Seconds until a queued command can run (0 if one is ready), None if the queue is empty."""
+        with self._condition:
+            if not self._commands:
+                return None
+            return max(0.0, min(c.not_before for c in self._commands) - time.monotonic())
+
+    def wait(self, timeout):
+        """Blocks up to `timeout` seconds, or until a command is submitted or becomes ready."""
+        with self._condition:
+            if self._commands:
+                timeout = min(timeout, max(0.0, min(c.not_before for c in self._commands) - time.monotonic()))
+            if timeout > 0:
+                self._condition.wait(timeout)
+
+    def _next_ready(self, deadline):
+        now = time.monotonic()
+        ready = [c for c in self._commands
+                 if c.not_before <= now
+                 and (c.priority == self.SAFETY or deadline is None or now < deadline)]
+        if not ready:
+            return None
+        return min(ready, key=lambda c: (c.priority, c.sequence))
+
+    def run_ready(self, instrument, deadline=None):
+        """
+        Executes the commands that are ready, highest priority first. ROUTINE
+        commands are only started before `deadline` (monotonic time, None = no
+        limit) so they do not push back the next polling tick.
+        """
+        while True:
+            with self._condition:
+                command = self._next_ready(deadline)
+                if command is None:
+                    return
+                self._commands.remove(command)
+            # The bus is used outside the lock: submit() never waits on it
+            self._execute(instrument, command)
+
+    def _execute(self, instrument, command):
+        if command.position == 0 and not command.future.set_running_or_notify_cancel():
+            return
+        try:
+            while command.position < len(command.steps):
+                step = command.steps[command.position]
+                command.position += 1
+                if step[0] == 'read':
+                    value = instrument.readParameter(step[1])
+                    self.shadow.record(step[1], value)
+                    command.results.append(value)
+                elif step[0] == 'read_chained':
+                    values = read_chained(instrument, instrument.db.get_parameters(list(step[1])))
+                    for dde_nr in step[1]:
+                        self.shadow.record(dde_nr, values[dde_nr])
+                    command.results.append([values[dde_nr] for dde_nr in step[1]])
+                elif step[0] == 'write':
+                    dde_nr, value = step[1], step[2]
+                    forced = len(step) > 3 and step[3]
+                    if not forced and self.shadow.is_redundant(dde_nr, value):
+                        command.results.append(True)
+                        continue
+                    try:
+                        ok = instrument.writeParameter(dde_nr, value)
+                    except Exception:
+                        self.shadow.invalidate(dde_nr)
+                        raise
+                    # A write that was not acknowledged leaves the value unknown
+                    self.shadow.record(dde_nr, value if ok else None)
+                    command.results.append(ok)
+                elif step[0] == 'wait':
+                    command.results.append(None)
+                    command.not_before = time.monotonic() + step[1]
+                    with self._condition:
+                        self._commands.append(command)
+                    return
+                elif step[0] == 'skip':
+                    command.results.append(None)
+                elif step[0] == 'time':
+                    command.results.append(time.perf_counter())
+                else:
+                    raise ValueError(f"Unknown command step: {step[0]}")
+        except Exception as e:
+            command.future.set_exception(e)
+            return
+        command.future.set_result(command.results)
+
+    def drain(self, instrument, timeout=2.0):
+        """Runs what is still queued (waits included) for at most `timeout` seconds."""
+        end = time.monotonic() + timeout
+        while self.pending() and time.monotonic() < end:
+            self.run_ready(instrument)
+            self.wait(end - time.monotonic())
+
+
+class ReconnectEngine:
+    """
+    Brings the link back after the device stopped answering.
+
+    A cheap heartbeat parameter is probed with an exponential backoff (capped),
+    so a short glitch is recovered in tens of milliseconds while a long outage
+    does not flood the bus. The serial port is reopened when it is closed, when
+    the OS device disappeared and came back (USB-serial reset), or after
+    several unanswered probes. Every stage is reported with the time since the
+    link was lost.
+    """
+
+    def __init__(self, instrument, heartbeat_parameter=28, initial_delay=0.05, max_delay=2.0,
+                 reopen_after=5, mutex=None):
+        self.instrument = instrument
+        self.heartbeat_parameter = int(heartbeat_parameter)
+        self.initial_delay = float(initial_delay)
+        self.max_delay = max(float(max_delay), self.initial_delay)
+        self.reopen_after = int(reopen_after)
+        self.mutex = mutex
+        self.port = getattr(instrument, 'comport', None)
+        self.recoveries = 0
+        self.last_recovery_time = None
+
+    def _locked(self, function):
+        if self.mutex is not None:
+            self.mutex.lock()
+        try:
+            return function()
+        finally:
+            if self.mutex is not None:
+                self.mutex.unlock()
+
+    def port_present(self):
+        """False if the OS no longer lists the serial device (unplugged adapter)."""
+        if self.port is None:
+            return True
+        try:
+            if os.name == 'nt':
+                return any(port.device == self.port for port in serial.tools.list_ports.comports())
+            return os.path.exists(self.port)
+        except Exception:
+            return True
+
+    def port_open(self):
+        try:
+            return self.instrument.master.propar.serial.is_open
+        except AttributeError:
+            return True
+
+    def reopen(self):
+        """Closes and reopens the serial port of the propar master."""
+        provider = self.instrument.master.propar
+        self._locked(lambda: (provider.stop(), provider.start()))
+
+    def probe(self):
+        try:
+            return self._locked(lambda: self.instrument.readParameter(self.heartbeat_parameter)) is not None
+        except Exception:
+            return False
+
+    def recover(self, idle, report, should_stop, on_link_down=None):
+        """
+        Runs until the heartbeat answers. idle(timeout) passes the backoff
+        delays, report(message) receives each stage, on_link_down() is called
+        once the first probe failed too. Returns the recovery time in seconds,
+        or None if should_stop() became true first.
+        """
+        start = time.monotonic()
+        delay = self.initial_delay
+        probes = unanswered = 0
+        port_was_missing = False
+
+        def elapsed_ms():
+            return (time.monotonic() - start) * 1000.0
+
+        report(f"Link lost: probing parameter {self.heartbeat_parameter}, "
+               f"backoff {self.initial_delay * 1000:.0f} ms to {self.max_delay:.1f} s")
+        while not should_stop():
+            idle(delay)
+            if should_stop():
+                break
+            delay = min(delay * 2.0, self.max_delay)
+
+            # 1. The OS device itself
+            if not self.port_present():
+                if not port_was_missing:
+                    report(f"Serial port {self.port} disappeared (+{elapsed_ms():.0f} ms)")
+                    port_was_missing = True
+                continue
+
+            # 2. Our handle on it
+            if port_was_missing or not self.port_open() or unanswered >= self.reopen_after:
+                try:
+                    self.reopen()
+                    report(f"Serial port {self.port} reopened (+{elapsed_ms():.0f} ms)")
+                    port_was_missing = False
+                    unanswered = 0
+                except Exception as e:
+                    report(f"Reopening serial port {self.port} failed: {e} (+{elapsed_ms():.0f} ms)")
+                    continue
+
+            # 3. The device
+            probes += 1
+            if self.probe():
+                recovery_time = time.monotonic() - start
+                self.recoveries += 1
+                self.last_recovery_time = recovery_time
+                report(f"Link restored after {probes} probe(s) in {recovery_time * 1000.0:.0f} ms")
+                return recovery_time
+
+            unanswered += 1
+            if probes == 1:
+                report(f"Device not answering (+{elapsed_ms():.0f} ms), backing off")
+                if on_link_down is not None:
+                    on_link_down()
+            elif delay == self.max_delay and unanswered == self.reopen_after:
+                report(f"Still no answer after {probes} probes (+{elapsed_ms():.0f} ms), "
+                       f"probing every {self.max_delay:.1f} s")
+        return None
+
+
+class SafetySupervisor:
+    """
+    Over-pressure handling and purge, run by the thread that owns the port.
+
+    The device evaluates the deviation rule (tolerance 116, delay 182) and
+    raises bit 8 or 32 of the status word. On the status read that shows it,
+    the supervisor starts a purge: alarm disabled, setpoint to the purge
+    target, PID control, then the alarm reset. On every pressure sample of a
+    running purge it checks the target and the timeout, and closes the valve
+    when one is met. Its writes are SAFETY commands of the loop's queue, so
+    they go out before the next read without waiting for the GUI, which only
+    hears about it through 'purge' events:
+        {'state': 'started', 'reason': 'alarm' or 'manual', 'code', 'target_bar',
+         'timeout_s', 'latency_ms', 'trace_id', 'detected_at'}  once the purge
+         writes are acknowledged
+        {'state': 'finished', 'reason': 'target', 'timeout' or 'cancelled',
+         'elapsed_s', 'pressure_bar'}
+    latency_ms is the alarm-to-action time: from the status read that showed
+    the alarm to the acknowledged PID switch.
+
+    Every purge is traced: 'time' steps in its commands stamp each write as
+    it is acknowledged, and once the purge is over and all its commands are
+    done, a 'trace' event carries
+        {'id', 'time', 'reason', 'code', 'end', 'stages': {stage: ms}}
+    with the stages in milliseconds since the detection (see safety_journal).
+    detected_at is the perf_counter() time of the detection, for the stages
+    the GUI adds.
+    """
+
+    ALARM_BITS = 8 | 32
+
+    def __init__(self, commands, capacity, notify, target_bar=0.0, timeout=10.0, tolerance_bar=1.5,
+                 rearm_delay=3.0, window=200):
+        """
+        commands: the CommandQueue of the loop.
+        notify(kind, value): the loop's event callback.
+        target_bar / timeout: purge target and the time allowed to reach it
+        within tolerance_bar; the valve is closed on whichever comes first.
+        rearm_delay: alarms seen within this many seconds of the last one
+        acted upon are ignored (the reset takes a few reads to show).
+        window: number of alarm-to-action times kept for the percentiles.
+        """
+        self.commands = commands
+        self.capacity = capacity
+        self.notify = notify
+        self.target_bar = float(target_bar)
+        self.timeout = float(timeout)
+        self.tolerance_bar = float(tolerance_bar)
+        self.rearm_delay = float(rearm_delay)
+        self._lock = threading.Lock()
+        self.purge = None          # Running purge: reason, code, start time, sent, trace
+        self.last_alarm = None     # perf_counter() time of the last alarm acted upon
+        self._trace_ids = itertools.count(1)
+        self.alarms = 0
+        self.purges = 0
+        self.latency = deque(maxlen=window)   # Alarm-to-action times (s)
+
+    def on_status(self, status, read_time):
+        """Called with every status word read; read_time is when the read returned (perf_counter)."""
+        if not status & self.ALARM_BITS or self.purge is not None:
+            return
+        if self.last_alarm is not None and read_time - self.last_alarm < self.rearm_delay:
+            return
+        self.last_alarm = read_time
+        self.alarms += 1
+        _safety_log.warning("Over-pressure alarm, starting the safety purge", param=28, value=status)
+        self._start('alarm', read_time, status)
+
+    def on_pressure(self, pressure_bar, read_time):
+        """Called with every pressure sample: ends a running purge on its target or timeout."""
+        purge = self.purge
+        if purge is None or not purge['sent']:
+            return
+        elapsed = read_time - purge['start']
+        if abs(pressure_bar - self.target_bar) <= self.tolerance_bar:
+            self._finish(purge, 'target', elapsed, pressure_bar)
+        elif elapsed >= self.timeout:
+            self._finish(purge, 'timeout', elapsed, pressure_bar)
+
+    def start_purge(self):
+        """Starts a purge on request (purge button). May be called from any thread."""
+        self._start('manual', time.perf_counter())
+
+    def cancel_purge(self):
+        """Stops watching a running purge (manual mode change); the valve is left as it is."""
+        with self._lock:
+            purge, self.purge = self.purge, None
+        if purge is not None:
+            _safety_log.warning("Purge cancelled")
+            self._trace_update(purge['trace'], end='cancelled')
+            self.notify('purge', {'state': 'finished', 'reason': 'cancelled',
+                                  'elapsed_s': time.perf_counter() - purge['start'], 'pressure_bar': None})
+
+    def _start(self, reason, detected, code=None):
+        with self._lock:
+            if self.purge is not None:
+                return
+            now = time.perf_counter()
+            # 'pending' counts the commands whose stamps are still to come
+            trace = {'id': next(self._trace_ids), 'time': time.time() - (now - detected), 'reason': reason,
+                     'code': code, 'end': None, 'stages': {'detection': 0.0}, 'detected_at': detected,
+                     'pending': 2 if reason == 'alarm' else 1}
+            purge = self.purge = {'reason': reason, 'code': code, 'start': now, 'sent': False, 'trace': trace}
+        self.purges += 1
+        # Alarm off first so it cannot fire again on the way down
+        future = self.commands.submit([('write', 118, 0),
+                                       ('write', 9, bar_to_propar(self.target_bar, self.capacity)),
+                                       ('time',),
+                                       ('write', 12, 0),
+                                       ('time',)],
+                                      CommandQueue.SAFETY)
+        if reason == 'alarm':
+            # The reset pulse; its pauses are spent polling
+            reset = self.commands.submit([('write', 114, 0), ('wait', 0.1), ('write', 114, 2), ('time',),
+                                          ('wait', 0.1), ('write', 114, 0)], CommandQueue.SAFETY)
+            reset.add_done_callback(lambda f: self._stamp(trace, f, {'alarm_reset': 3}))
+        future.add_done_callback(lambda f: self._purge_sent(purge, f))
+
+    def _purge_sent(self, purge, future):
+        """Runs in the loop thread once the purge writes went out."""
+        trace = purge['trace']
+        results = self._stamp(trace, future, {'setpoint_write': 2, 'pid_switch': 4})
+        # Nothing else to try if they failed: the timeout still closes the valve
+        latency = (results[4] if results is not None else time.perf_counter()) - trace['detected_at']
+        purge['sent'] = True
+        if purge['reason'] == 'alarm':
+            self.latency.append(latency)
+        _safety_log.info("Purge started", reason=purge['reason'], target_bar=self.target_bar,
+                         timeout_s=self.timeout, latency_ms=latency * 1000.0)
+        if self.purge is purge:
+            self.notify('purge', {'state': 'started', 'reason': purge['reason'], 'code': purge['code'],
+                                  'target_bar': self.target_bar, 'timeout_s': self.timeout,
+                                  'latency_ms': latency * 1000.0, 'trace_id': trace['id'],
+                                  'detected_at': trace['detected_at']})
+
+    def _finish(self, purge, reason, elapsed, pressure_bar):
+        with self._lock:
+            if self.purge is not purge:
+                return
+            self.purge = None
+        trace = purge['trace']
+        self._trace_update(trace, pending=1, end=reason)
+        closed = self.commands.submit([('write', 12, 3, True), ('time',), ('write', 118, 0)], CommandQueue.SAFETY)
+        closed.add_done_callback(lambda f: self._stamp(trace, f, {'close': 1}))
+        _safety_log.info("Purge finished, closing the valve", reason=reason, elapsed_s=elapsed,
+                         pressure_bar=pressure_bar)
+        self.notify('purge', {'state': 'finished', 'reason': reason, 'elapsed_s': elapsed,
+                              'pressure_bar': pressure_bar})
+
+    def _stamp(self, trace, future, stages):
+        """
+        Done callback of a purge command: stores the results of its 'time'
+        steps ({stage: step index}) in the trace. Returns the step results,
+        None if the command failed.
+        """
+        try:
+            results = future.result()
+        except Exception as e:
+            _safety_log.error("Safety command failed: %s", e, stages=','.join(stages))
+            results = None
+        else:
+            for stage, index in stages.items():
+                trace['stages'][stage] = (results[index] - trace['detected_at']) * 1000.0
+        self._trace_update(trace, pending=-1)
+        return results
+
+    def _trace_update(self, trace, pending=0, end=None):
+        """Counts the commands a trace waits for and sets its end; sends it once both are settled."""
+        with self._lock:
+            trace['pending'] += pending
+            if end is not None:
+                trace['end'] = end
+            complete = trace['end'] is not None and trace['pending'] == 0
+        if complete:
+            self.notify('trace', {key: value for key, value in trace.items()
+                                  if key not in ('pending', 'detected_at')})
+
+    def stats(self):
+        """Alarm and purge counters with the alarm-to-action percentiles, times in milliseconds."""
+        latency = list(self.latency)
+        return {
+            'alarms': self.alarms,
+            'purges': self.purges,
+            'purging': self.purge is not None,
+            'alarm_action_p50_ms': percentile(latency, 50) * 1000.0,
+            'alarm_action_p99_ms': percentile(latency, 99) * 1000.0,
+            'alarm_action_max_ms': max(latency, default=0.0) * 1000.0,
+        }
+
+
+class AcquisitionLoop:
+    """
+    The polling loop: reads the due parameters on every tick of the sampling
+    clock and publishes them to a SampleRing.
+
+    Things the GUI must react to immediately are reported through
+    on_event(kind, value):
+        'offline'  None   - the device did not answer
+        'purge'    dict   - a purge started or finished (SafetySupervisor)
+        'trace'    dict   - stage times of a finished purge (SafetySupervisor)
+        'timing'   dict   - rolling SamplingClock statistics, once per second
+        'link'     str    - progress of a link recovery (ReconnectEngine stage)
+        'diagnostics' dict - link statistics snapshot, once per second
+
+    Every bus access goes through an InstrumentedInstrument, which records
+    latencies and error counters in `self.instrument.stats`.
+
+    Between ticks the loop executes the commands queued in `commands`.
+    Over-pressure alarms and purges are handled by `supervisor` on the
+    samples of this loop, without a round trip through the GUI.
+    """
+
+    # Parameters fetched by the loop (status, measure, valve output)
+    POLL_PARAMETERS = (28, 8, 55)
+
+    def __init__(self, instrument, capacity, scheduler, sample_ring, chained_reads=True,
+                 compare_cycles=0, timing_report_interval=60.0, mutex=None, on_event=None,
+                 commands=None, reconnect=None, idle=None, safety=None):
+        """
+        mutex: optional object with lock()/unlock() (QMutex) held around bus access.
+        commands: the CommandQueue served by this loop (a new one by default).
+        reconnect: keyword arguments of the ReconnectEngine (heartbeat_parameter,
+                   initial_delay, max_delay, reopen_after).
+        idle: idle(timeout) passes the time between ticks; by default it runs the
+              queued commands. The child process also serves its pipe in it.
+        safety: keyword arguments of the SafetySupervisor (target_bar, timeout,
+                tolerance_bar, rearm_delay).
+        """
+        if not isinstance(instrument, InstrumentedInstrument):
+            instrument = InstrumentedInstrument(instrument)
+        self.instrument = instrument
+        self.capacity = capacity
+        self.scheduler = scheduler
+        self.sample_ring = sample_ring
+        self.chained_reads = bool(chained_reads)
+        self.compare_cycles = int(compare_cycles)
+        self.timing_report_interval = float(timing_report_interval)
+        self.mutex = mutex
+        self.on_event = on_event
+        self.commands = commands if commands is not None else CommandQueue()
+        self.idle = idle if idle is not None else self.serve_commands
+        self.stop = False
+        self.reconnect = ReconnectEngine(instrument, mutex=mutex, **(reconnect or {}))
+        self.supervisor = SafetySupervisor(self.commands, capacity, self.notify, **(safety or {}))
+
+        # Monotonic deadline clock on the pressure (base) period
+        self.clock = SamplingClock(self.scheduler.base_period)
+
+        # Resolve the DDE numbers to propar parameter objects once, so the
+        # chained request does not hit the database on every cycle.
+        self.poll_parameters = dict(zip(self.POLL_PARAMETERS,
+                                        self.instrument.db.get_parameters(self.POLL_PARAMETERS)))
+
+    def notify(self, kind, value=None):
+        if self.on_event is not None:
+            self.on_event(kind, value)
+
+    def _lock(self):
+        if self.mutex is not None:
+            start = time.perf_counter()
+            self.mutex.lock()
+            self.instrument.stats.record_mutex_wait(time.perf_counter() - start)
+
+    def _unlock(self):
+        if self.mutex is not None:
+            self.mutex.unlock()
+
+    def diagnostics(self):
+        """Link statistics plus the write cache and recovery counters."""
+        snapshot = self.instrument.stats.snapshot()
+        snapshot['write_cache'] = self.commands.shadow.stats()
+        last = self.reconnect.last_recovery_time
+        snapshot['link_recovery'] = {'recoveries': self.reconnect.recoveries,
+                                     'last_recovery_ms': last * 1000.0 if last is not None else None}
+        snapshot['safety'] = self.supervisor.stats()
+        return snapshot
+
+    def report_link(self, message):
+        _connection_log.info(message)
+        self.notify('link', message)
+
+    def recover_link(self):
+        """Waits for the link to come back. The GUI only goes offline if the first probe fails too."""
+        # The device may come back reset: nothing written before can be trusted
+        self.commands.shadow.invalidate()
+        self.reconnect.recover(self.idle, self.report_link, lambda: self.stop,
+                               on_link_down=lambda: self.notify('offline'))
+        self.clock.resync()
+
+    def serve_commands(self, timeout):
+        """Default idle: executes queued commands for `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        while not self.stop:
+            self._lock()
+            try:
+                self.commands.run_ready(self.instrument, deadline)
+            finally:
+                self._unlock()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            self.commands.wait(remaining)
+
+    def read_poll_values(self, dde_numbers=POLL_PARAMETERS):
+        """
+        Reads the given subset of the poll parameters from the instrument.
+        Returns a dict {dde_nr: value}; a value is None if its read failed.
+        Must be called with the mutex held.
+        """
+        if not self.chained_reads or len(dde_numbers) == 1:
+            return {dde_nr: self.instrument.readParameter(dde_nr) for dde_nr in dde_numbers}
+
+        # One propar request message for the whole set
+        return read_chained(self.instrument, [self.poll_parameters[n] for n in dde_numbers])
+
+    def compare_read_modes(self, cycles):
+        """
+        Times `cycles` chained and `cycles` per-parameter read cycles and prints
+        the average cycle time of each, to confirm the throughput gain on a line.
+        """
+        chained_setting = self.chained_reads
+        results = {}
+        try:
+            for mode in (True, False):
+                self.chained_reads = mode
+                start = time.perf_counter()
+                for _ in range(cycles):
+                    if self.stop:
+                        return
+                    self._lock()
+                    try:
+                        self.read_poll_values()
+                    finally:
+                        self._unlock()
+                results[mode] = (time.perf_counter() - start) / cycles
+        except Exception as e:
+            _acquisition_log.warning("Read mode comparison failed: %s", e)
+            return
+        finally:
+            self.chained_reads = chained_setting
+
+        chained_ms = results[True] * 1000.0
+        single_ms = results[False] * 1000.0
+        gain = 100.0 * (single_ms - chained_ms) / single_ms if single_ms > 0 else 0.0
+        _acquisition_log.info("Read cycle time, chained vs per-parameter (%.0f%% faster)", gain,
+                              cycles=cycles, chained_ms=chained_ms, per_parameter_ms=single_ms)
+
+    def run(self):
+        last_alarm_status = 0  # Track changes
+        if self.compare_cycles > 0:
+            self.compare_read_modes(self.compare_cycles)
+
+        next_stats_time = time.monotonic() + 1.0
+        next_report_time = time.monotonic() + self.timing_report_interval
+        self.clock.resync()
+        while not self.stop:
+            # 1. Wait for the next deadline on the sampling grid
+            tick = self.clock.wait(self.idle)
+            if self.stop:
+                break
+            sample_time = time.monotonic()
+
+            try:
+                # ACQUIRE LOCK BEFORE READING
+                self._lock()
+
+                try:
+                    # --- Perform all reads ---
+                    # This is the "Work" that causes latency (e.g., takes 0.05s)
+                    # Only the parameters whose rate class is due on this tick,
+                    # merged into a single transaction
+                    values = self.read_poll_values(self.scheduler.due(tick))
+                finally:
+                    self._unlock()
+                # High resolution: it starts the trace of a safety event
+                read_time = time.perf_counter()
+                # Parameters not due on this tick come back as None and are skipped below
+                alarm_status = values.get(28)
+                raw_measure = values.get(8)
+                valve1_output = values.get(55)
+
+                # --- Offline Logic ---
+                # If critical read fails (None), device is disconnected.
+                if raw_measure is None:
+                    # Probe the link until it answers, then rejoin the grid
+                    self.recover_link()
+                    continue
+
+                # --- Status Logic ---
+                if alarm_status is not None:
+                    # Logged only when the status word changes
+                    if alarm_status != last_alarm_status:
+                        _safety_log.info("Status word changed", param=28, value=alarm_status)
+                        last_alarm_status = alarm_status
+
+                    # Safety alarms are acted upon here, not after the display batching
+                    if alarm_status & SafetySupervisor.ALARM_BITS:
+                        # The alarm action may have changed the setpoint and control mode
+                        self.commands.shadow.invalidate(9, 12)
+                    self.supervisor.on_status(alarm_status, read_time)
+
+                # --- Publish the sample ---
+                # The graph timestamp is the monotonic read time mapped to wall time
+                # through the clock anchor, so NTP steps cannot bend the time axis
+                timestamp = self.clock.to_wall(sample_time)
+                bar_measure = propar_to_bar(raw_measure, self.capacity)
+                self.sample_ring.append(
+                    timestamp, raw_measure, bar_measure,
+                    valve1_output if valve1_output is not None else -1,
+                    alarm_status if alarm_status is not None else -1)
+                self.supervisor.on_pressure(bar_measure, read_time)
+
+                # --- Timing Statistics ---
+                now = time.monotonic()
+                self.clock.record_latency(now - sample_time)
+                if _acquisition_log.enabled(DEBUG):
+                    _acquisition_log.debug("Sample", param=8, value=raw_measure,
+                                           latency_ms=(now - sample_time) * 1000.0)
+                if now >= next_stats_time:
+                    next_stats_time = now + 1.0
+                    stats = self.clock.stats()
+                    self.notify('timing', stats)
+                    self.notify('diagnostics', self.diagnostics())
+                    if self.timing_report_interval > 0 and now >= next_report_time:
+                        next_report_time = now + self.timing_report_interval
+                        _acquisition_log.info("Sampling", **stats)
+                        shadow = self.commands.shadow
+                        _acquisition_log.info("Write cache", hits=shadow.hits, skipped=shadow.skipped)
+
+            except Exception as e:
+                _connection_log.warning("Error reading from instrument: %s", e)
+                self.recover_link()
+
+        # Commands submitted before the stop (e.g. closing the valve on exit) still go out
+        self._lock()
+        try:
+            self.commands.drain(self.instrument)
+        finally:
+            self._unlock()
+        _acquisition_log.info("Measurement thread stopped")
+
+
+# --- Multiprocess acquisition ---
+
+class _EventWriter:
+    """Forwards print() output of the child process to the GUI log."""
+
+    def __init__(self, events):
+        self.events = events
+
+    def write(self, text):
+        if text:
+            self.events.put(('log', text))
+
+    def flush(self):
+        pass
+
+
+class RemoteInstrument:
+    """
+    Stands in for propar.instrument in the GUI process when the serial port
+    is owned by the acquisition process. Every call is sent over the command
+    pipe and executed by the child between two polling ticks.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def _call(self, *command):
+        self.conn.send(command)
+        ok, result = self.conn.recv()
+        if not ok:
+            raise result
+        return result
+
+    def readParameter(self, dde_nr, channel=None):
+        return self._call('read', dde_nr)
+
+    def writeParameter(self, dde_nr, data, channel=None):
+        return self._call('write', dde_nr, data)
+
+
+class RemoteSupervisor:
+    """
+    GUI-side SafetySupervisor of the acquisition process. Like
+    RemoteCommandQueue.submit(), the requests are only sent down the pipe:
+    the child reports their outcome as a 'supervisor' event carrying
+    (method, ok, error), so the GUI never waits for the polling loop.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def start_purge(self):
+        self.conn.send(('supervisor', 'start_purge'))
+
+    def cancel_purge(self):
+        self.conn.send(('supervisor', 'cancel_purge'))
+
+
+class RemoteCommandQueue:
+    """
+    GUI-side CommandQueue of the acquisition process. submit() only sends the
+    command down the pipe; the child queues and runs it between ticks and
+    reports the outcome as a 'command' event, which resolves the future.
+    """
+
+    SAFETY = CommandQueue.SAFETY
+    ROUTINE = CommandQueue.ROUTINE
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._ids = itertools.count()
+        self._futures = {}
+
+    def submit(self, steps, priority=ROUTINE):
+        future = Future()
+        future.set_running_or_notify_cancel()
+        command_id = next(self._ids)
+        self._futures[command_id] = future
+        self.conn.send(('submit', command_id, list(steps), priority))
+        return future
+
+    def resolve(self, command_id, ok, result):
+        future = self._futures.pop(command_id, None)
+        if future is None:
+            return
+        if ok:
+            future.set_result(result)
+        else:
+            future.set_exception(result)
+
+
+def _execute_command(instrument, command):
+    """Runs one command received from the GUI process. Returns (ok, result)."""
+    try:
+        if command[0] == 'read':
+            return True, instrument.readParameter(command[1])
+        if command[0] == 'write':
+            return True, instrument.writeParameter(command[1], command[2])
+        return False, ValueError(f"Unknown acquisition command: {command[0]}")
+    except Exception as e:
+        return False, e
+
+
+def acquisition_process_main(instrument_factory, com, shm_name, conn, events, log_levels=None):
+    """
+    Entry point of the acquisition process. Opens the port, then serves GUI
+    commands; once 'start' arrives, runs the polling loop and keeps serving
+    commands between ticks. 'stop' ends the loop, 'close' closes the port.
+    log_levels: {category: level} of the event logs (event_log.configure).
+    """
+    sys.stdout = _EventWriter(events)
+    if log_levels:
+        configure(log_levels)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    ring = SampleRing(buffer=shm.buf)
+    commands = CommandQueue()
+    loop = None
+    loop_settings = None
+    closing = False
+
+    try:
+        instrument = InstrumentedInstrument(instrument_factory(com))
+    except Exception as e:
+        conn.send((False, e))
+        shm.close()
+        return
+    conn.send((True, None))
+
+    def report(command_id, future):
+        try:
+            events.put(('command', (command_id, True, future.result())))
+        except Exception as e:
+            # Library exceptions are not always picklable
+            events.put(('command', (command_id, False, RuntimeError(str(e)))))
+
+    def handle(command):
+        nonlocal loop_settings, closing
+        if command[0] == 'submit':
+            # No reply on the pipe: the outcome comes back as an event
+            _, command_id, steps, priority = command
+            future = commands.submit(steps, priority)
+            future.add_done_callback(lambda f, command_id=command_id: report(command_id, f))
+            return
+        if command[0] == 'start':
+            loop_settings = command[1]
+        elif command[0] in ('stop', 'close'):
+            if loop is not None:
+                loop.stop = True
+            closing = closing or command[0] == 'close'
+        elif command[0] == 'supervisor' and command[1] in ('start_purge', 'cancel_purge'):
+            # No reply on the pipe either: the outcome comes back as an event
+            if loop is None:
+                events.put(('supervisor', (command[1], False, RuntimeError("The acquisition loop is not running."))))
+            else:
+                getattr(loop.supervisor, command[1])()
+                events.put(('supervisor', (command[1], True, None)))
+            return
+        else:
+            conn.send(_execute_command(instrument, command))
+            return
+        conn.send((True, None))
+
+    def serve(timeout):
+        """Runs queued commands and answers the GUI for `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        while not closing:
+            commands.run_ready(instrument, deadline)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            delay = commands.next_delay()
+            if conn.poll(remaining if delay is None else min(remaining, delay)):
+                handle(conn.recv())
+
+    try:
+        while not closing:
+            if loop_settings is not None:
+                loop = AcquisitionLoop(instrument, sample_ring=ring,
+                                       on_event=lambda kind, value: events.put((kind, value)),
+                                       commands=commands, idle=serve, **loop_settings)
+                loop_settings = None
+                loop.run()
+                loop = None
+            else:
+                serve(0.1)
+        commands.drain(instrument)
+    except (EOFError, OSError):
+        # The GUI process went away
+        pass
+    finally:
+        try:
+            instrument.master.propar.stop()
+        except Exception:
+            pass
+        del ring
+        shm.close()
+
+
+class AcquisitionProcess:
+    """
+    GUI-side handle of the acquisition process.
+
+    The child owns the serial port and publishes samples through a
+    shared-memory SampleRing that the GUI maps read-only. Blocking calls go
+    through `instrument`, a RemoteInstrument that forwards each call over a
+    command pipe; everything sent once polling runs goes through `commands`,
+    purge requests through `supervisor`.
+    """
+
+    def __init__(self, instrument_factory, com, ring_capacity=SampleRing.DEFAULT_CAPACITY, log_levels=None):
+        self.shm = shared_memory.SharedMemory(create=True, size=SampleRing.nbytes(ring_capacity))
+        SampleRing(ring_capacity, buffer=self.shm.buf)  # Initialise the header
+        self.ring = SampleRing(buffer=self.shm.buf, readonly=True)
+        self.events = Queue()
+        self.conn, child_conn = Pipe()
+        self.process = Process(target=acquisition_process_main,
+                               args=(instrument_factory, com, self.shm.name, child_conn, self.events, log_levels),
+                               daemon=True)
+        self.process.start()
+
+        # Wait for the child to open the port
+        ok, error = self.conn.recv()
+        if not ok:
+            self.close()
+            raise error
+        self.instrument = RemoteInstrument(self.conn)
+        self.commands = RemoteCommandQueue(self.conn)
+        self.supervisor = RemoteSupervisor(self.conn)
+
+    def start_polling(self, **loop_settings):
+        """Starts the polling loop in the child (AcquisitionLoop keyword arguments)."""
+        self.instrument._call('start', loop_settings)
+
+    def get_events(self):
+        """
+        Returns the events queued by the child since the last call.
+        'command' events carry (command_id, ok, result) for commands.resolve(),
+        'supervisor' events (method, ok, error) for the RemoteSupervisor requests.
+        """
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def stop_polling(self):
+        self.instrument._call('stop')
+
+    def close(self):
+        """Closes the port and ends the child process."""
+        try:
+            if self.process.is_alive():
+                self.conn.send(('close',))
+                self.conn.recv()
+        except (EOFError, OSError):
+            pass
+        self.process.join(timeout=2.0)
+        if self.process.is_alive():
+            self.process.terminate()
+        del self.ring
+        self.shm.close()
+        self.shm.unlink()
@@ -1,7 +1,15 @@
-from PyQt6.QtWidgets import QMainWindow, QApplication, QMessageBox
+from PyQt6.QtWidgets import (QMainWindow, QApplication, QMessageBox, QTabWidget, QWidget, QVBoxLayout,
+                             QHBoxLayout, QLabel, QPushButton, QTableWidget, QTableWidgetItem,
+                             QHeaderView, QFileDialog)
+from PyQt6.QtCore import QTimer
 from PyQt6 import uic
 import time
 
+from diagnostics import export_json
+from event_log import get_log
+
+_admin_log = get_log('admin')
+
 class AdminWindow(QMainWindow):
     def __init__(self, parent=None):
         super(AdminWindow, self).__init__(parent)
@@ -34,34 +42,136 @@ class AdminWindow(QMainWindow):
         # Read the current PID values when the window opens
         self.read_pid_parameters()
 
-    def read_pid_parameters(self):
-        """Reads the current PID values from the instrument and updates the UI."""
-        instrument = self.main_window.instrument
+        # --- Diagnostics tab (link statistics) ---
+        self._init_diagnostics_tab()
 
-        # 1. Initialize variables to None
-        # (Prevents "UnboundLocalError" if the try block crashes early)
-        p_gain = i_gain = d_gain = speed_gain = None
-        open_gain = norm_gain = stab_gain = hyster_gain = user_tag_raw = None
-        user_tag = "Unknown"
+    # Columns of the diagnostics table: (header, key in the parameter snapshot)
+    DIAGNOSTIC_COLUMNS = (('Param', None), ('Reads', 'reads'), ('Writes', 'writes'), ('None', 'none'),
+                          ('Timeouts', 'timeouts'), ('Retries', 'retries'), ('Write fail', 'write_failures'),
+                          ('Mean ms', 'mean_ms'), ('p50 ms', 'p50_ms'), ('p99 ms', 'p99_ms'),
+                          ('Max ms', 'max_ms'))
+
+    def _init_diagnostics_tab(self):
+        """Moves the PID controls into a tab and adds a tab with the serial link statistics."""
+        controls = self.takeCentralWidget()
+        self.control_size = self.size()
+
+        self.diagnostics_page = diagnostics = QWidget()
+        layout = QVBoxLayout(diagnostics)
+        self.diagnostics_summary = QLabel("Waiting for link statistics...")
+        self.diagnostics_summary.setWordWrap(True)
+        layout.addWidget(self.diagnostics_summary)
+
+        self.diagnostics_table = QTableWidget(0, len(self.DIAGNOSTIC_COLUMNS))
+        self.diagnostics_table.setHorizontalHeaderLabels([header for header, _ in self.DIAGNOSTIC_COLUMNS])
+        self.diagnostics_table.verticalHeader().setVisible(False)
+        self.diagnostics_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        layout.addWidget(self.diagnostics_table)
+
+        buttons = QHBoxLayout()
+        buttons.addStretch()
+        export_button = QPushButton("Export JSON...")
+        export_button.clicked.connect(self.export_diagnostics)
+        buttons.addWidget(export_button)
+        layout.addLayout(buttons)
+
+        self.tabs = QTabWidget()
+        self.tabs.addTab(controls, "Control")
+        self.tabs.addTab(diagnostics, "Diagnostics")
+        self.tabs.currentChanged.connect(self._on_tab_changed)
+        self.setCentralWidget(self.tabs)
+
+        # The acquisition loop publishes a snapshot once per second
+        self.diagnostics_timer = QTimer(self)
+        self.diagnostics_timer.timeout.connect(self.update_diagnostics)
+
+    def _on_tab_changed(self, index):
+        if self.tabs.widget(index) is self.diagnostics_page:
+            # The control page has a fixed size, the table needs room
+            self.setMaximumSize(16777215, 16777215)
+            self.resize(760, 420)
+            self.update_diagnostics()
+            self.diagnostics_timer.start(1000)
+        else:
+            self.diagnostics_timer.stop()
+            self.resize(self.control_size)
+            self.setMaximumSize(self.control_size)
+
+    def update_diagnostics(self):
+        """Fills the diagnostics tab from the latest snapshot of the main window."""
+        snapshot = self.main_window.link_diagnostics
+        if snapshot is None:
+            return
 
-        # 2. Hardware Read (LOCKED)
-        self.main_window.instrument_mutex.lock()
+        mutex = snapshot['mutex_wait']
+        cache = snapshot.get('write_cache', {})
+        recovery = snapshot.get('link_recovery', {})
+        last_recovery = recovery.get('last_recovery_ms')
+        safety = snapshot.get('safety', {})
+        self.diagnostics_summary.setText(
+            f"Since {snapshot['started']} ({snapshot['uptime_s'] / 60.0:.1f} min). "
+            f"Mutex wait: mean {mutex['mean_ms']:.2f} ms, p99 {mutex['p99_ms']:.0f} ms, "
+            f"max {mutex['max_ms']:.1f} ms over {mutex['count']} locks. "
+            f"Write cache: {cache.get('shadow_hits', 0)} hits, {cache.get('shadow_skipped', 0)} skipped. "
+            f"Link recoveries: {recovery.get('recoveries', 0)}"
+            + (f" (last {last_recovery:.0f} ms)." if last_recovery is not None else ".")
+            + (f" Over-pressure alarms: {safety['alarms']}, alarm to action p50 {safety['alarm_action_p50_ms']:.0f} ms, "
+               f"max {safety['alarm_action_max_ms']:.0f} ms." if safety.get('alarms') else "")
+            + self._safety_chain_text())
+
+        parameters = snapshot['parameters']
+        self.diagnostics_table.setRowCount(len(parameters))
+        for row, (key, entry) in enumerate(parameters.items()):
+            for column, (_, field) in enumerate(self.DIAGNOSTIC_COLUMNS):
+                if field is None:
+                    text = key
+                elif field in entry:
+                    text = str(entry[field])
+                else:
+                    text = f"{entry['latency'][field]:.1f}"
+                self.diagnostics_table.setItem(row, column, QTableWidgetItem(text))
+
+    def _safety_chain_text(self):
+        """p99/max of each stage of the journaled alarm responses, in ms since the detection."""
+        stages = self.main_window.safety_journal.summary()
+        stages.pop('detection', None)
+        if not stages:
+            return ""
+        count = max(stage['count'] for stage in stages.values())
+        return (f" Safety chain p99/max over {count} alarms: "
+                + ", ".join(f"{name.replace('_', ' ')} {stage['p99_ms']:.0f}/{stage['max_ms']:.0f} ms"
+                            for name, stage in stages.items()) + ".")
+
+    def export_diagnostics(self):
+        """Saves the latest snapshot, with its histograms, as JSON for offline comparison."""
+        snapshot = self.main_window.link_diagnostics
+        if snapshot is None:
+            QMessageBox.information(self, "Diagnostics", "No link statistics received yet.")
+            return
+        serial = getattr(self.main_window, 'device_serial', 'unknown')
+        default_name = f"link_diagnostics_{serial}_{time.strftime('%Y%m%d_%H%M%S')}.json"
+        path, _ = QFileDialog.getSaveFileName(self, "Export link statistics", default_name, "JSON (*.json)")
+        if not path:
+            return
         try:
-            p_gain = instrument.readParameter(167)
-            i_gain = instrument.readParameter(168)
-            d_gain = instrument.readParameter(169)
-            speed_gain = instrument.readParameter(254)
-            open_gain = instrument.readParameter(165)
-            norm_gain = instrument.readParameter(72)
-            stab_gain = instrument.readParameter(141)
-            hyster_gain = instrument.readParameter(361)
-            user_tag_raw = instrument.readParameter(115)
-        except Exception as e:
-            print(f"Hardware read failed: {e}")
-        finally:
-            self.main_window.instrument_mutex.unlock()
+            export_json(snapshot, path, serial_number=serial,
+                        port=getattr(self.main_window.instrument, 'comport', None),
+                        safety_chain=self.main_window.safety_journal.summary())
+            _admin_log.info("Link statistics exported", path=path)
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"Failed to export link statistics.\n\nError: {e}")
 
-        # 3. UI Update (Safe to do unlocked)
+    def read_pid_parameters(self):
+        """Reads the current PID values from the instrument and updates the UI when they arrive."""
+        self.main_window.submit_command(
+            [('read', dde_nr) for dde_nr in (167, 168, 169, 254, 165, 72, 141, 361, 115)],
+            on_done=lambda results: self._show_pid_parameters(*results),
+            on_error=lambda e: _admin_log.error("Hardware read failed: %s", e))
+
+    def _show_pid_parameters(self, p_gain, i_gain, d_gain, speed_gain, open_gain, norm_gain,
+                             stab_gain, hyster_gain, user_tag_raw):
+        """Fills the boxes with the values read by read_pid_parameters (None = read failed)."""
+        user_tag = "Unknown"
         try:
             if p_gain is not None: self.p_gain_box.setValue(p_gain)
             if i_gain is not None: self.i_gain_box.setValue(i_gain)
@@ -77,16 +187,15 @@ class AdminWindow(QMainWindow):
                 user_tag = str(user_tag_raw)
                 self.user_tag_lineedit.setText(user_tag.strip())
 
-            # --- RESTORED PRINT STATEMENT ---
-            print(
-                f"Read valve control parameters: Kp={p_gain}, Ti={i_gain}, Td={d_gain}, Kspeed={speed_gain}, Kopen={open_gain}, Knormal={norm_gain}, Kstable={stab_gain}, Hysteresis={hyster_gain}, UserTag={user_tag}")
+            _admin_log.info("Read valve control parameters", Kp=p_gain, Ti=i_gain, Td=d_gain, Kspeed=speed_gain,
+                            Kopen=open_gain, Knormal=norm_gain, Kstable=stab_gain, Hysteresis=hyster_gain,
+                            UserTag=user_tag)
 
         except Exception as e:
-            print(f"Error updating UI: {e}")
+            _admin_log.error("Error updating UI: %s", e)
 
     def set_pid_parameters(self):
         """Attempts a full sequence to unlock, write, and save new PID values."""
-        instrument = self.main_window.instrument
         try:
             p_gain = self.p_gain_box.value()
             i_gain = self.i_gain_box.value()
@@ -98,46 +207,44 @@ class AdminWindow(QMainWindow):
             hyster_gain = self.hyster_gain_box.value()
             user_tag = self.user_tag_lineedit.text().strip()
 
-            print("--- Attempting control parameters save sequence ---")
-
             # --- Step 1: Set Control Mode to allow RS232 writes ---
-            print("Setting device to initreset: enable changes mode...")
-            self.main_window.instrument_mutex.lock()  # <--- ADD LOCK
-            try:
-                instrument.writeParameter(7, 64)
-                #time.sleep(0.1)
-                # --- Step 2: Write the new PID values ---
-                print("2. Writing new control values...")
-                instrument.writeParameter(167, p_gain)
-                instrument.writeParameter(168, i_gain)
-                instrument.writeParameter(169, d_gain)
-                instrument.writeParameter(254, speed_gain)
-                instrument.writeParameter(165, int(open_gain))
-                instrument.writeParameter(72, int(norm_gain))
-                instrument.writeParameter(141, int(stab_gain))
-                instrument.writeParameter(361, hyster_gain)
-                instrument.writeParameter(115, user_tag)
-                #time.sleep(0.1)
-                print("Setting device to initreset: disable changes mode...")
-                instrument.writeParameter(7, 0)
-                #time.sleep(0.1)
-            finally:
-                self.main_window.instrument_mutex.unlock()
-            print(f"Set and saved new control values: Kp={p_gain}, Ti={i_gain}, Td={d_gain}, Kspeed={speed_gain},Kopen={open_gain}, Knormal={norm_gain},Kstable={stab_gain},Hysteresis={hyster_gain},UserTag={user_tag}")
-
-            #QMessageBox.information(self, "Success", "Control parameters have been updated.")
-
-            try:
-                self.main_window.read_device_info()
-                print("Control parameters have been updated.")
-                print("Main window device info refreshed after saving settings.")
-            except Exception as e:
-                print(f"Warning: could not refresh device info after saving: {e}")
+            # --- Step 2: Write the new PID values ---
+            # --- Step 3: Disable changes again ---
+            # Sent as one queued command, run by the acquisition thread
+            _admin_log.info("Saving control parameters (init/reset mode, write, then back)", param=7)
+            self.main_window.submit_command(
+                [('write', 7, 64),
+                 ('write', 167, p_gain),
+                 ('write', 168, i_gain),
+                 ('write', 169, d_gain),
+                 ('write', 254, speed_gain),
+                 ('write', 165, int(open_gain)),
+                 ('write', 72, int(norm_gain)),
+                 ('write', 141, int(stab_gain)),
+                 ('write', 361, hyster_gain),
+                 ('write', 115, user_tag),
+                 ('write', 7, 0)],
+                on_done=lambda results: self._pid_parameters_saved(
+                    dict(Kp=p_gain, Ti=i_gain, Td=d_gain, Kspeed=speed_gain, Kopen=open_gain, Knormal=norm_gain,
+                         Kstable=stab_gain, Hysteresis=hyster_gain, UserTag=user_tag)),
+                on_error=self._pid_parameters_failed)
+
+        except Exception as e:
+            self._pid_parameters_failed(e)
 
+    def _pid_parameters_saved(self, values):
+        _admin_log.info("Set and saved new control values", **values)
 
+        #QMessageBox.information(self, "Success", "Control parameters have been updated.")
+
+        try:
+            self.main_window.read_device_info()
         except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to set control parameters.\n\nError: {e}")
-            print( "Error:Failed to set control parameters. Error: ",e)
+            _admin_log.warning("Could not refresh device info after saving: %s", e)
+
+    def _pid_parameters_failed(self, e):
+        QMessageBox.critical(self, "Error", f"Failed to set control parameters.\n\nError: {e}")
+        _admin_log.error("Failed to set control parameters: %s", e)
 
     def valve_force_open(self):
         # Create the warning message box
@@ -149,10 +256,9 @@ class AdminWindow(QMainWindow):
 
         # Check if the user clicked the "Yes" button
         if reply == QMessageBox.Yes:
-            print("User confirmed. Forcing valve open from admin panel.")
+            _admin_log.warning("Forcing the valve open from the admin panel", param=12, value=8)
 
             # --- This is your existing code, which now runs only on confirmation ---
-            instrument = self.main_window.instrument
             main_ui = self.main_window.win
 
             # Update status label and OTHER buttons on the MAIN window
@@ -164,14 +270,11 @@ class AdminWindow(QMainWindow):
             self.force_open_button.setStyleSheet("background-color: red;")
 
             # Send the command to the instrument
-            self.main_window.instrument_mutex.lock()  # <--- ADD LOCK
-            try:
-                instrument.writeParameter(12, 8)  # 'Valve Forced Open' command
-            finally:
-                self.main_window.instrument_mutex.unlock()
+            self.main_window.submit_command([('write', 12, 8)],  # 'Valve Forced Open' command
+                                            description="force the valve open")
 
             # Update the state variable in the MAIN window instance
             self.main_window.valve_status = "force_open"
         else:
             # If the user clicks "No"
-            print("Valve Force Open cancelled by user.")
\ No newline at end of file
+            _admin_log.info("Valve force open cancelled")
\ No newline at end of file
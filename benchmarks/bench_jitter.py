@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the sampling jitter of the two acquisition modes ('thread' and
+'process') while the GUI thread is kept busy redrawing a large plot.
+
+Usage (from the repository root):
+    python benchmarks/bench_jitter.py --port COM5 [--seconds 30] [--period 0.05]
+"""
+
+import argparse
+import os
+import sys
+import threading
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+os.chdir(REPO_DIR)
+
+import numpy as np
+import propar
+from PyQt6.QtWidgets import QApplication
+from PyQt6.QtCore import QTimer
+
+from acquisition import PollScheduler, SampleRing, AcquisitionLoop, AcquisitionProcess
+from flowControl import PlotWindow
+
+
+def make_busy_plot(points):
+    """Creates a plot window and a timer that redraws `points` samples as fast as possible."""
+    plot = PlotWindow(max_history=points, default_duration=points)
+    plot.show()
+    t = np.arange(points, dtype=float)
+    y = np.sin(t / 50.0)
+    # Fill the history once so every redraw handles the whole buffer
+    plot.update_plot(t, y)
+    batch = {'start': float(points)}
+
+    def redraw():
+        plot.update_plot(t[:100] + batch['start'], y[:100])
+        batch['start'] += 100
+
+    timer = QTimer()
+    timer.timeout.connect(redraw)
+    timer.start(0)
+    return plot, timer
+
+
+def loop_settings(period):
+    scheduler = PollScheduler(period, {28: period, 8: period, 55: period})
+    return {'capacity': 1.0, 'scheduler': scheduler, 'compare_cycles': 0, 'timing_report_interval': 0}
+
+
+def run_for(app, seconds):
+    QTimer.singleShot(int(seconds * 1000), lambda: app.exit(0))
+    app.exec()
+
+
+def bench_thread(app, port, seconds, period):
+    """Polling loop in a thread of the GUI process."""
+    results = {}
+    instrument = propar.instrument(port)
+    loop = AcquisitionLoop(instrument, sample_ring=SampleRing(),
+                           on_event=lambda kind, value: results.update({kind: value}),
+                           **loop_settings(period))
+    worker = threading.Thread(target=loop.run, daemon=True)
+    worker.start()
+    run_for(app, seconds)
+    loop.stop = True
+    worker.join()
+    instrument.master.propar.stop()
+    return results.get('timing')
+
+
+def bench_process(app, port, seconds, period):
+    """Polling loop in the acquisition child process."""
+    results = {}
+    acquisition = AcquisitionProcess(propar.instrument, port)
+    acquisition.start_polling(**loop_settings(period))
+    collector = QTimer()
+    collector.timeout.connect(
+        lambda: [results.update({kind: value}) for kind, value in acquisition.get_events()])
+    collector.start(100)
+    run_for(app, seconds)
+    collector.stop()
+    results.update(dict(acquisition.get_events()))
+    acquisition.close()
+    return results.get('timing')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', required=True, help="Serial port of the instrument (e.g. COM5)")
+    parser.add_argument('--seconds', type=float, default=30.0, help="Duration of each run")
+    parser.add_argument('--period', type=float, default=0.05, help="Sampling period in seconds")
+    parser.add_argument('--plot-points', type=int, default=200000, help="Points redrawn by the busy plot")
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    plot, timer = make_busy_plot(args.plot_points)
+
+    # The child process must own the port first: the threaded run keeps the
+    # library's master for this port open in our process
+    stats = {
+        'process': bench_process(app, args.port, args.seconds, args.period),
+        'thread': bench_thread(app, args.port, args.seconds, args.period),
+    }
+    timer.stop()
+
+    print(f"\n{'mode':<10}{'cycles':>8}{'missed':>8}{'jit p50':>10}{'jit p99':>10}{'jit max':>10}{'read p99':>10}  (ms)")
+    for mode, s in stats.items():
+        if s is None:
+            print(f"{mode:<10} no timing data")
+            continue
+        print(f"{mode:<10}{s['cycles']:>8}{s['missed']:>8}{s['jitter_p50_ms']:>10.2f}"
+              f"{s['jitter_p99_ms']:>10.2f}{s['jitter_max_ms']:>10.2f}{s['latency_p99_ms']:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,448 @@
+# -*- coding: utf-8 -*-
+"""
+Performance benchmarks against the simulated P-800 (simulated_instrument.py):
+
+  cycle_rate      sustained THREADFlow cycles per second, polling as fast as
+                  the simulated serial latency allows
+  update_plot     PlotWindow.update_plot cost per sample at several max_history sizes
+  gui_latency     lateness of a 10 ms GUI timer while the full application runs
+  hidden_plot     CPU use of the application with the plot window shown, then hidden
+  overpressure    time from the first over-pressure sample to the valve-close write
+
+Results go to a JSON file (one per run, named after the version by default) so
+they can be compared across releases with --compare.
+
+Usage (from the repository root):
+    python benchmarks/bench_suite.py [--seconds 10] [--only cycle_rate,update_plot] [--output results.json]
+    python benchmarks/bench_suite.py --compare benchmarks/results/bench_1.2.1-beta_20260101-120000.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+os.chdir(REPO_DIR)
+
+import numpy as np
+from PyQt6 import QtCore
+from PyQt6.QtWidgets import QApplication
+from PyQt6.QtCore import QTimer, QMutex
+
+import flowControl
+from acquisition import PollScheduler, SampleRing, percentile
+from flowControl import Bronkhost, PlotWindow, THREADFlow, load_configuration
+from simulated_instrument import SimulatedInstrument
+
+BENCHMARKS = ('cycle_rate', 'update_plot', 'gui_latency', 'hidden_plot', 'overpressure')
+
+
+class RecordingInstrument(SimulatedInstrument):
+    """Simulated instrument that timestamps every write it receives."""
+
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.writes = []   # (time.time(), dde_nr, data)
+        RecordingInstrument.instances.append(self)
+
+    def writeParameter(self, dde_nr, data, channel=None):
+        ok = super().writeParameter(dde_nr, data, channel)
+        self.writes.append((time.time(), dde_nr, data))
+        return ok
+
+
+def summarize_ms(samples_s):
+    """p50/p99/max/mean of a list of durations in seconds, in milliseconds."""
+    values = [s * 1000.0 for s in samples_s]
+    return {
+        'count': len(values),
+        'mean_ms': sum(values) / len(values) if values else 0.0,
+        'p50_ms': percentile(values, 50),
+        'p99_ms': percentile(values, 99),
+        'max_ms': max(values) if values else 0.0,
+    }
+
+
+def run_for(app, seconds):
+    QTimer.singleShot(int(seconds * 1000), lambda: app.exit(0))
+    app.exec()
+
+
+def simulation_settings(config):
+    """Keyword arguments for SimulatedInstrument from the [Simulation] section."""
+    section = config['Simulation'] if config.has_section('Simulation') else {}
+    settings = {}
+    for name in ('latency', 'latency_jitter', 'supply_pressure', 'volume'):
+        if name in section:
+            settings[name] = float(section[name])
+    return settings
+
+
+# --- Benchmarks ---
+
+class _LoopOwner(QtCore.QObject):
+    """The attributes THREADFlow expects from its parent."""
+
+    def __init__(self, instrument):
+        super().__init__()
+        self.instrument = instrument
+        self.instrument_mutex = QMutex()
+
+
+def bench_cycle_rate(app, config, seconds, period):
+    """THREADFlow polling every parameter on every tick, with a tick period shorter than a read."""
+    owner = _LoopOwner(SimulatedInstrument(**simulation_settings(config)))
+    scheduler = PollScheduler(period, {28: period, 8: period, 55: period})
+    ring = SampleRing()
+    thread = THREADFlow(owner, capacity=100.0, thread_sleep_time=period, scheduler=scheduler,
+                        timing_report_interval=0, sample_ring=ring)
+    thread.start()
+    run_for(app, 0.5)   # Let the thread settle before counting
+    start_count, start = ring.count, time.perf_counter()
+    run_for(app, seconds)
+    cycles, elapsed = ring.count - start_count, time.perf_counter() - start
+    thread.stopThread()
+    thread.wait()
+    return {
+        'cycles': cycles,
+        'seconds': elapsed,
+        'cycles_per_s': cycles / elapsed,
+        'cycle_ms': elapsed / cycles * 1000.0 if cycles else None,
+        'tick_period_s': period,
+        'simulated_latency_s': owner.instrument.latency,
+    }
+
+
+def _time_update_plot(app, size, duration, batch, seconds):
+    """Frame times of update_plot on a PlotWindow filled to `size` samples, showing `duration` seconds."""
+    plot = PlotWindow(max_history=size, default_duration=duration)
+    plot.show()
+    t = time.time() - size * 0.1 + np.arange(size) * 0.1
+    plot.update_plot(t, np.sin(np.arange(size) / 50.0))
+    app.processEvents()
+
+    durations = []
+    next_t = t[-1] + 0.1
+    deadline = time.perf_counter() + seconds
+    # At least a few frames even where one frame takes longer than the budget
+    while time.perf_counter() < deadline or len(durations) < 5:
+        times = next_t + np.arange(batch) * 0.1
+        next_t = times[-1] + 0.1
+        start = time.perf_counter()
+        plot.update_plot(times, np.sin(times))
+        app.processEvents()
+        durations.append(time.perf_counter() - start)
+    plot.close()
+
+    frame = summarize_ms(durations)
+    return {
+        'frames': frame['count'],
+        'batch': batch,
+        'visible_s': duration,
+        'frame_p50_ms': frame['p50_ms'],
+        'frame_p99_ms': frame['p99_ms'],
+        'per_sample_us': frame['mean_ms'] * 1000.0 / batch,
+    }
+
+
+def bench_update_plot(app, config, sizes, batch, seconds_per_size):
+    """
+    Fills a PlotWindow to max_history (10 Hz samples), then times update_plot with
+    batches of `batch` samples (one display frame) including the repaint, once
+    with the whole history visible and once with the configured default duration.
+    """
+    default_duration = config['Plotting'].getfloat('default_duration', 10.0)
+    results = {}
+    for size in sizes:
+        results[str(size)] = {
+            'full_history': _time_update_plot(app, size, size * 0.1, batch, seconds_per_size / 2),
+            'default_duration': _time_update_plot(app, size, default_duration, batch, seconds_per_size / 2),
+        }
+    return results
+
+
+def start_application(config):
+    """Bronkhost in thread mode on a RecordingInstrument; prints go back to the console."""
+    config['Thread']['acquisition_mode'] = 'thread'
+    config['Thread']['timing_report_interval'] = '0'
+    settings = simulation_settings(config)
+    RecordingInstrument.instances.clear()
+    window = Bronkhost(com='SIM', config=config,
+                       instrument_factory=lambda com: RecordingInstrument(com, **settings))
+    sys.stdout = sys.__stdout__
+    if not window.connection_successful:
+        raise RuntimeError("The application did not start on the simulated instrument")
+    window.show()
+    window.show_plot_window()
+    return window, RecordingInstrument.instances[-1]
+
+
+def close_application(app, window):
+    window.close()
+    app.processEvents()
+    sys.stdout = sys.__stdout__
+
+
+def bench_gui_latency(app, config, seconds, interval_ms=10):
+    """
+    Lateness of a repeating GUI timer while acquisition, the display refresh and
+    a plot holding a full history (max_history) run.
+    """
+    window, instrument = start_application(config)
+    plot = window.plot_window
+    history = plot.history.capacity
+    t = time.time() - history * 0.1 + np.arange(history) * 0.1
+    plot.update_plot(t, np.zeros(history))
+
+    lateness = []
+    state = {'last': None}
+
+    def probe():
+        now = time.perf_counter()
+        if state['last'] is not None:
+            lateness.append(max(0.0, now - state['last'] - interval_ms / 1000.0))
+        state['last'] = now
+
+    timer = QTimer()
+    timer.setTimerType(QtCore.Qt.TimerType.PreciseTimer)
+    timer.timeout.connect(probe)
+    timer.start(interval_ms)
+    run_for(app, seconds)
+    timer.stop()
+    close_application(app, window)
+
+    result = summarize_ms(lateness)
+    result.update({'interval_ms': interval_ms, 'max_history': history})
+    return result
+
+
+def bench_hidden_plot(app, config, seconds):
+    """
+    CPU time per wall second of the whole application (acquisition included)
+    with the plot window shown over its full history, then hidden; plus the
+    renders done while hidden and the cost of the catch-up render on show.
+    """
+    window, instrument = start_application(config)
+    plot = window.plot_window
+    history = plot.history.capacity
+    t = time.time() - history * 0.1 + np.arange(history) * 0.1
+    plot.update_plot(t, np.zeros(history))
+    plot.set_max_duration(history * 0.1)
+
+    renders = []
+    draw = plot.update_plot_viewport
+
+    def counted_draw():
+        renders.append(time.perf_counter())
+        draw()
+
+    plot.update_plot_viewport = counted_draw
+
+    def cpu_percent(duration):
+        wall, cpu = time.perf_counter(), time.process_time()
+        run_for(app, duration)
+        return (time.process_time() - cpu) / (time.perf_counter() - wall) * 100.0
+
+    result = {'max_history': history}
+    result['cpu_percent_shown'] = cpu_percent(seconds / 2)
+    result['renders_per_s_shown'] = len(renders) / (seconds / 2)
+    plot.close()
+    app.processEvents()
+    renders.clear()
+    result['cpu_percent_hidden'] = cpu_percent(seconds / 2)
+    result['renders_hidden'] = len(renders)
+    start = time.perf_counter()
+    window.show_plot_window()
+    result['catch_up_ms'] = (time.perf_counter() - start) * 1000.0
+    result['renders_on_show'] = len(renders)
+    close_application(app, window)
+    return result
+
+
+def bench_overpressure(app, config, setpoint_bar=20.0, leak=1.0, timeout=30.0):
+    """
+    Runs the application at a setpoint, then opens a leak in the inlet seat so
+    the pressure climbs above the response alarm tolerance. The leak is closed
+    once the device raises its alarm, so the purge can bring the pressure down.
+    Reports the time from the first sample above the tolerance to each stage
+    of the safety sequence, ending with the valve-close write (param 12 = 3),
+    and the stage times of the application's own trace of the alarm.
+    """
+    # The trace is read from memory; the journal file is left alone
+    config['Logging']['safety_journal'] = ''
+    window, instrument = start_application(config)
+    tolerance = config['Safety'].getfloat('set_point_above_tolerance', 2.0)
+    marks = {}
+
+    # Stamped in the acquisition thread when the purge is reported, not when the GUI gets to it
+    window.threadFlow.PURGE.connect(lambda info: marks.setdefault('purge_signal', time.time()),
+                                    QtCore.Qt.ConnectionType.DirectConnection)
+
+    def close_dialogs():
+        # The safety sequence ends in a modal message box
+        dialog = QApplication.activeModalWidget()
+        if dialog is not None:
+            marks.setdefault('dialog', time.time())
+            dialog.close()
+
+    dialogs = QTimer()
+    dialogs.timeout.connect(close_dialogs)
+    dialogs.start(100)
+
+    # Let the startup finish (its status refresh reconfigures the alarm), then
+    # settle at the setpoint and let the alarm re-arm after the cooldown
+    run_for(app, 1.0)
+    window.win.setpoint.setValue(setpoint_bar)
+    window.setPoint()
+    window.win.radioPID.click()
+    settle = config['Safety'].getfloat('set_point_lower_cooldown_delay', 2.0) + 2.0
+    run_for(app, settle)
+
+    fault_time = time.time()
+    instrument.set_inlet_leak(leak)
+
+    def watch():
+        now = time.time()
+        if 'device_alarm' not in marks and instrument.alarm_bits:
+            marks['device_alarm'] = now
+            instrument.set_inlet_leak(0.0)
+        if any(dde_nr == 12 and data == 3 and t >= fault_time for t, dde_nr, data in instrument.writes):
+            app.exit(0)
+        elif now - fault_time > timeout:
+            app.exit(0)
+
+    watcher = QTimer()
+    watcher.timeout.connect(watch)
+    watcher.start(5)
+    app.exec()
+    watcher.stop()
+    # The trace follows the acknowledged close
+    run_for(app, 0.5)
+    dialogs.stop()
+
+    records, _, _ = window.sample_ring.read_since(0)
+    above = records[(records['time'] >= fault_time) & (records['pressure'] > setpoint_bar + tolerance)]
+    close_writes = [t for t, dde_nr, data in instrument.writes if dde_nr == 12 and data == 3 and t >= fault_time]
+    setpoint_writes = [t for t, dde_nr, data in instrument.writes if dde_nr == 9 and t >= fault_time]
+    # First sample of the purge within its target tolerance (1.5 bar of 0 bar)
+    reached = records[(records['time'] >= (setpoint_writes[0] if setpoint_writes else np.inf))
+                      & (records['pressure'] <= 1.5)]
+    safety = window.threadFlow.loop.supervisor.stats()
+    traces = [t for t in window.safety_journal.traces if t['reason'] == 'alarm']
+    close_application(app, window)
+
+    if len(above) == 0 or not close_writes:
+        return {'completed': False, 'reason': 'no over-pressure sample' if len(above) == 0 else 'valve not closed'}
+
+    first_sample = float(above['time'][0])
+
+    def since(name):
+        return (marks[name] - first_sample) * 1000.0 if name in marks else None
+
+    return {
+        'completed': True,
+        'setpoint_bar': setpoint_bar,
+        'tolerance_bar': tolerance,
+        'device_alarm_delay_s': instrument.parameters[182],
+        'sample_to_device_alarm_ms': since('device_alarm'),
+        'sample_to_purge_signal_ms': since('purge_signal'),
+        'supervisor_alarm_to_action_ms': safety['alarm_action_max_ms'],
+        'device_alarm_to_setpoint_write_ms': ((setpoint_writes[0] - marks['device_alarm']) * 1000.0
+                                              if setpoint_writes and 'device_alarm' in marks else None),
+        'sample_to_valve_close_ms': (close_writes[0] - first_sample) * 1000.0,
+        'purge_target_sample_to_close_ms': ((close_writes[0] - float(reached['time'][0])) * 1000.0
+                                            if len(reached) else None),
+        # ms since the status read that showed the alarm
+        'trace_ms': traces[-1]['stages'] if traces else None,
+    }
+
+
+def flatten(results, prefix=''):
+    """{'a': {'b': 1.0}} -> {'a.b': 1.0}, numbers only."""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def print_comparison(previous, current):
+    """Prints every metric of both runs with the relative change."""
+    old, new = flatten(previous['results']), flatten(current['results'])
+    print(f"\n{'metric':<45}{previous['version']:>14}{current['version']:>14}{'change':>10}")
+    for key in sorted(set(old) & set(new)):
+        change = f"{(new[key] - old[key]) / old[key] * 100.0:+.0f}%" if old[key] else ''
+        print(f"{key:<45}{old[key]:>14.3f}{new[key]:>14.3f}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help="JSON file to write (default: benchmarks/results/bench_<version>_<date>.json)")
+    parser.add_argument('--compare', help="Earlier results file to compare this run with")
+    parser.add_argument('--seconds', type=float, default=10.0, help="Duration of the timed runs")
+    parser.add_argument('--period', type=float, default=0.005,
+                        help="Tick period of the cycle rate run (shorter than a read, so it runs flat out)")
+    parser.add_argument('--sizes', default='1000,24000,1000000', help="max_history sizes for update_plot")
+    parser.add_argument('--batch', type=int, default=4, help="Samples per update_plot call (one frame)")
+    parser.add_argument('--only', default=','.join(BENCHMARKS), help="Comma-separated benchmarks to run")
+    args = parser.parse_args()
+
+    selected = [name.strip() for name in args.only.split(',') if name.strip()]
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    app = QApplication(sys.argv)
+    config = load_configuration()
+    if not config.has_section('Simulation'):
+        config.add_section('Simulation')
+
+    results = {}
+    for name in selected:
+        print(f"Running {name}...")
+        if name == 'cycle_rate':
+            results[name] = bench_cycle_rate(app, config, args.seconds, args.period)
+        elif name == 'update_plot':
+            sizes = [int(size) for size in args.sizes.split(',')]
+            results[name] = bench_update_plot(app, config, sizes, args.batch, max(1.0, args.seconds / len(sizes)))
+        elif name == 'gui_latency':
+            results[name] = bench_gui_latency(app, load_configuration(), args.seconds)
+        elif name == 'hidden_plot':
+            results[name] = bench_hidden_plot(app, load_configuration(), args.seconds)
+        elif name == 'overpressure':
+            results[name] = bench_overpressure(app, load_configuration())
+        print(json.dumps(results[name], indent=2))
+
+    document = {
+        'version': flowControl.__version__,
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {'seconds': args.seconds, 'period': args.period, 'batch': args.batch,
+                     'simulation': simulation_settings(config)},
+        'results': results,
+    }
+    output = args.output
+    if output is None:
+        os.makedirs(os.path.join('benchmarks', 'results'), exist_ok=True)
+        output = os.path.join('benchmarks', 'results',
+                              f"bench_{flowControl.__version__}_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump(document, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), document)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Console log of the main window: what is printed goes to the log widget a few
+times per second, as one insert, and to a rotating log file.
+
+ConsoleLog replaces sys.stdout. write() only appends to a buffer under a lock,
+so printing from the acquisition thread costs no signal and no GUI work. A
+timer moves the buffered text to the widget, whose document keeps at most
+`max_lines` lines. Complete lines are queued, timestamped, to a
+QueueListener thread that writes them through a RotatingFileHandler.
+"""
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+
+from PyQt6.QtCore import QTimer
+from PyQt6.QtGui import QTextCursor
+
+
+class ConsoleLog:
+    """File-like object for sys.stdout, feeding a QTextEdit and a rotating file."""
+
+    def __init__(self, widget, max_lines=2000, refresh_ms=250, path=None, max_bytes=5 * 1024 * 1024,
+                 backups=5):
+        """
+        widget: QTextEdit (or QPlainTextEdit) showing the log.
+        max_lines: lines kept in the widget; the oldest are dropped.
+        refresh_ms: interval between two widget updates.
+        path: log file (no file if empty); max_bytes / backups: rotation.
+        """
+        self.widget = widget
+        self.max_lines = max(1, int(max_lines))
+        self.widget.document().setMaximumBlockCount(self.max_lines)
+        self._lock = threading.Lock()
+        self._pending = []     # Text not yet shown in the widget
+        self._partial = ''     # Start of a line not yet written to the file
+
+        self._queue = None
+        self._listener = None
+        self._handler = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._handler = logging.handlers.RotatingFileHandler(path, maxBytes=int(max_bytes),
+                                                                 backupCount=int(backups), encoding='utf-8')
+            self._handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            self._queue = queue.SimpleQueue()
+            self._listener = logging.handlers.QueueListener(self._queue, self._handler)
+            self._listener.start()
+
+        self._timer = QTimer(widget)
+        self._timer.timeout.connect(self.refresh)
+        self._timer.start(max(1, int(refresh_ms)))
+
+    def write(self, text):
+        text = str(text)
+        with self._lock:
+            self._pending.append(text)
+            if self._queue is not None:
+                lines = (self._partial + text).split('\n')
+                self._partial = lines.pop()
+                for line in lines:
+                    self._queue.put(logging.makeLogRecord({'msg': line}))
+
+    def flush(self):
+        # Needed for compatibility; the timer does the flushing
+        pass
+
+    def refresh(self):
+        """Appends the buffered text to the widget in one insert and scrolls to it."""
+        with self._lock:
+            if not self._pending:
+                return
+            text = ''.join(self._pending)
+            self._pending = []
+        # After a burst, only the lines the widget would keep are inserted
+        if text.count('\n') > self.max_lines:
+            text = '\n'.join(text.split('\n')[-(self.max_lines + 1):])
+        cursor = self.widget.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertText(text)
+        self.widget.setTextCursor(cursor)
+        self.widget.ensureCursorVisible()
+
+    def close(self):
+        """Shows what is left, writes the last line to the file and stops the file thread."""
+        self._timer.stop()
+        self.refresh()
+        if self._listener is not None:
+            with self._lock:
+                if self._partial:
+                    self._queue.put(logging.makeLogRecord({'msg': self._partial}))
+                    self._partial = ''
+                self._queue = None
+            self._listener.stop()
+            self._handler.close()
+            self._listener = None
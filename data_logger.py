@@ -0,0 +1,458 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only binary recording of every acquisition sample.
+
+A DataLogger thread is one more reader of the SampleRing: it wakes every
+`flush_interval` seconds, takes the samples written since its last visit and
+appends them to the current recording file in one write. Neither the GUI
+thread nor the acquisition loop ever touches the disk, and a disk stall only
+delays the logger (up to the ring capacity, after which samples are counted
+as lost).
+
+File format (little-endian, fixed width), one recording per file:
+
+    header   32 bytes  magic b'P800-REC', version u4, record size u4,
+                       capacity f8 (full scale in bar), created f8 (s since epoch)
+    records  24 bytes  time f8 (s since epoch), measure i4 (param 8, 0-32000),
+                       setpoint i4 (param 9, 0-32000), valve i4 (param 55),
+                       status i4 (param 28); -1 where not read on that tick
+
+Next to each file, <name>.idx holds the sparse time index: one entry
+(time f8, record number u8) every `index_interval` records, so a time range
+is found by a binary search of the index and one short read of the file.
+<name>.timing.jsonl holds the sampling clock statistics of the recording
+(jitter and read latency percentiles, missed ticks), one JSON object every
+`timing_interval` seconds. Files are rotated by size and by age.
+"""
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from plot_history import min_max_pairs
+
+MAGIC = b'P800-REC'
+VERSION = 1
+
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u4'),
+    ('record_size', '<u4'),
+    ('capacity', '<f8'),
+    ('created', '<f8'),
+])
+
+RECORD_DTYPE = np.dtype([
+    ('time', '<f8'),
+    ('measure', '<i4'),
+    ('setpoint', '<i4'),
+    ('valve', '<i4'),
+    ('status', '<i4'),
+])
+
+INDEX_DTYPE = np.dtype([
+    ('time', '<f8'),
+    ('record', '<u8'),
+])
+
+
+def index_path(path):
+    return os.path.splitext(path)[0] + '.idx'
+
+
+def timing_path(path):
+    return os.path.splitext(path)[0] + '.timing.jsonl'
+
+
+def read_header(path):
+    """Header of a recording file as a dict; ValueError if it is not one."""
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if len(header) == 0 or header['magic'][0] != MAGIC:
+        raise ValueError(f"{path} is not a P-800 recording")
+    if header['record_size'][0] != RECORD_DTYPE.itemsize:
+        raise ValueError(f"{path}: unsupported record size {header['record_size'][0]}")
+    return {name: header[name][0].item() for name in HEADER_DTYPE.names}
+
+
+def record_count(path):
+    """Number of complete records in a recording file."""
+    return max(0, (os.path.getsize(path) - HEADER_DTYPE.itemsize) // RECORD_DTYPE.itemsize)
+
+
+def read_index(path):
+    """Sparse time index of a recording file (empty if there is none)."""
+    idx = index_path(path)
+    if not os.path.exists(idx):
+        return np.empty(0, dtype=INDEX_DTYPE)
+    # A torn last entry (crash while writing) is ignored
+    count = os.path.getsize(idx) // INDEX_DTYPE.itemsize
+    return np.fromfile(idx, dtype=INDEX_DTYPE, count=count)
+
+
+def read_timing(path):
+    """Sampling statistics saved with a recording file, oldest first (empty if there are none)."""
+    timing = []
+    try:
+        with open(timing_path(path), encoding='utf-8') as f:
+            for line in f:
+                try:
+                    timing.append(json.loads(line))
+                except ValueError:
+                    # A torn last line (crash while writing)
+                    continue
+    except FileNotFoundError:
+        pass
+    return timing
+
+
+def open_records(path):
+    """The records of a recording file as a read-only memory map (nothing is loaded)."""
+    read_header(path)
+    count = record_count(path)
+    if count == 0:
+        return np.empty(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER_DTYPE.itemsize, shape=(count,))
+
+
+def load_index(path, records, interval=256):
+    """
+    The sparse time index of a recording: the .idx file, or one built from
+    every `interval`-th record if it is missing or does not cover the file.
+    """
+    index = read_index(path)
+    if len(records) and (len(index) == 0 or int(index['record'][-1]) + 2 * interval < len(records)
+                         or int(index['record'][-1]) >= len(records)):
+        numbers = np.arange(0, len(records), interval, dtype=np.uint64)
+        index = np.empty(len(numbers), dtype=INDEX_DTYPE)
+        index['time'] = records['time'][::interval]
+        index['record'] = numbers
+    return index
+
+
+def locate(records, index, t):
+    """Number of the first record at or after time `t`: binary search of the index, then of one interval."""
+    k = int(np.searchsorted(index['time'], t, side='left'))
+    low = int(index['record'][k - 1]) if k > 0 else 0
+    high = min(int(index['record'][k]), len(records)) if k < len(index) else len(records)
+    return low + int(np.searchsorted(records['time'][low:high], t, side='left'))
+
+
+def find_records(path, t_start, t_end):
+    """(first, end) record numbers of the samples with t_start <= time < t_end."""
+    records = open_records(path)
+    index = load_index(path, records)
+    first = locate(records, index, t_start)
+    return first, max(first, locate(records, index, t_end))
+
+
+def read_range(path, t_start, t_end):
+    """Records of one recording file with t_start <= time < t_end, as an array in memory."""
+    first, end = find_records(path, t_start, t_end)
+    return np.array(open_records(path)[first:end])
+
+
+class RecordedSegment:
+    """
+    One recording file opened for viewing: memory-mapped records, the time
+    index, and min/max levels of detail built in one chunked pass (blocks of
+    `block` records, then `factor` times coarser per level), so any zoom
+    level touches at most a few thousand values plus the raw samples in view.
+    """
+
+    CHUNK = 1 << 20   # Records per pass when building the first level
+
+    def __init__(self, path, levels=True, block=64, factor=8, min_level_size=16):
+        """levels: build the levels of detail (not needed to read ranges, e.g. for export)."""
+        self.path = path
+        self.header = read_header(path)
+        self.capacity = self.header['capacity']
+        self.records = open_records(path)
+        self.index = load_index(path, self.records)
+        self.levels = []   # Per level: (block size, {'time', 'measure_min', ...})
+
+        count = len(self.records)
+        if not levels or count // block < min_level_size:
+            return
+        parts = []
+        for start in range(0, count, self.CHUNK):
+            chunk = self.records[start:start + self.CHUNK]
+            starts = np.arange(0, len(chunk), block)
+            part = {'time': np.array(chunk['time'][starts])}
+            for name in ('measure', 'setpoint'):
+                values = np.array(chunk[name], dtype=np.float64)
+                part[f"{name}_min"] = np.minimum.reduceat(values, starts)
+                part[f"{name}_max"] = np.maximum.reduceat(values, starts)
+            parts.append(part)
+        level = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+        while True:
+            self.levels.append((block, level))
+            if len(level['time']) // factor < min_level_size:
+                break
+            starts = np.arange(0, len(level['time']), factor)
+            level = {'time': level['time'][starts],
+                     **{name: (np.minimum if name.endswith('_min') else np.maximum).reduceat(values, starts)
+                        for name, values in level.items() if name != 'time'}}
+            block *= factor
+
+    def __len__(self):
+        return len(self.records)
+
+    def first_time(self):
+        return float(self.records['time'][0])
+
+    def last_time(self):
+        return float(self.records['time'][-1])
+
+    def locate(self, t):
+        """Number of the first record at or after time `t`."""
+        return locate(self.records, self.index, t)
+
+    def to_bar(self, raw):
+        """Raw 0-32000 values to bar; -1 (not read) becomes NaN so the line breaks."""
+        bar = np.asarray(raw, dtype=np.float64) / 32000.0 * self.capacity
+        bar[np.asarray(raw) < 0] = np.nan
+        return bar
+
+    def envelope(self, channel, x_min, x_max, max_columns):
+        """(x, y) of 'pressure' or 'setpoint' between x_min and x_max, in bar; see LodHistory.envelope."""
+        name = 'measure' if channel == 'pressure' else channel
+        first = max(0, self.locate(x_min) - 1)
+        end = min(len(self.records), self.locate(x_max) + 1)
+        if end - first <= 2 * max_columns or not self.levels:
+            window = self.records[first:end]
+            return np.array(window['time']), self.to_bar(window[name])
+
+        # Coarsest level needed for at most max_columns blocks in view
+        for block, level in self.levels:
+            if (end - first) // block <= max_columns:
+                break
+        start, stop = first // block, -(-end // block)
+        return min_max_pairs(level['time'][start:stop], self.to_bar(level[f"{name}_min"][start:stop]),
+                             self.to_bar(level[f"{name}_max"][start:stop]))
+
+
+class RecordedSession:
+    """Several recording files (e.g. one session across rotations) viewed as one history."""
+
+    def __init__(self, paths, levels=True):
+        segments = [RecordedSegment(path, levels=levels) for path in paths]
+        self.segments = sorted((segment for segment in segments if len(segment)), key=RecordedSegment.first_time)
+        if not self.segments:
+            raise ValueError("The selected recordings hold no samples")
+
+    def __len__(self):
+        return sum(len(segment) for segment in self.segments)
+
+    def first_time(self):
+        return self.segments[0].first_time()
+
+    def last_time(self):
+        return self.segments[-1].last_time()
+
+    def envelope(self, channel, x_min, x_max, max_columns):
+        """Envelopes of the segments in view, each given its share of the columns; NaN between segments."""
+        span = max(x_max - x_min, 1e-9)
+        xs, ys = [], []
+        for segment in self.segments:
+            start, stop = max(x_min, segment.first_time()), min(x_max, segment.last_time())
+            if start > stop:
+                continue
+            columns = max(16, int(max_columns * (stop - start) / span))
+            x, y = segment.envelope(channel, start, stop, columns)
+            xs += [x, [x[-1] if len(x) else start]]
+            ys += [y, [np.nan]]
+        if not xs:
+            return np.empty(0), np.empty(0)
+        return np.concatenate(xs), np.concatenate(ys)
+
+
+class DataLogger(threading.Thread):
+    """Background writer of the recording files, fed from a SampleRing."""
+
+    def __init__(self, sample_ring, directory, capacity, max_bytes=64 * 1024 * 1024,
+                 rotate_seconds=24 * 3600.0, flush_interval=1.0, index_interval=256, timing_interval=60.0):
+        """
+        sample_ring: ring to read (the logger keeps its own cursor).
+        directory: where the recordings go (created if needed).
+        capacity: full scale in bar, stored in the headers.
+        max_bytes / rotate_seconds: start a new file past this size or age.
+        flush_interval: seconds between writes.
+        index_interval: records between two sparse index entries.
+        timing_interval: seconds between two sampling statistics entries.
+        """
+        super().__init__(name='data-logger', daemon=True)
+        self.sample_ring = sample_ring
+        self.directory = directory
+        self.capacity = float(capacity)
+        self.max_bytes = int(max_bytes)
+        self.rotate_seconds = float(rotate_seconds)
+        self.flush_interval = float(flush_interval)
+        self.index_interval = max(1, int(index_interval))
+        self.timing_interval = float(timing_interval)
+        self.cursor = sample_ring.count
+
+        # Setpoint changes from the GUI, applied to the samples by time
+        self._setpoint_lock = threading.Lock()
+        self._setpoint_times = []
+        self._setpoint_values = []
+        self._setpoint = -1
+
+        # Latest sampling statistics, not yet written
+        self._timing = None
+        self._timing_written_at = 0.0
+
+        self._stop_event = threading.Event()
+        self._file = None
+        self._index_file = None
+        self._timing_file = None
+        self.path = None
+        self._opened_at = 0.0
+        self._records_in_file = 0
+
+        # Counters
+        self.records_written = 0
+        self.bytes_written = 0
+        self.files_written = 0
+        self.lost = 0
+        self.write_errors = 0
+
+    def set_setpoint(self, raw_setpoint, timestamp=None):
+        """Records a setpoint change (raw 0-32000) for the samples from `timestamp` on."""
+        with self._setpoint_lock:
+            self._setpoint_times.append(time.time() if timestamp is None else timestamp)
+            self._setpoint_values.append(int(raw_setpoint))
+
+    def set_timing(self, stats):
+        """Sampling clock statistics (SamplingClock.stats()), saved with the recording."""
+        self._timing = dict(stats, time=time.time())
+
+    def stop(self):
+        """Writes the samples still in the ring, closes the file and ends the thread."""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout=5.0)
+        print(f"Data logger stopped: {self.records_written} samples in {self.files_written} file(s), "
+              f"{self.lost} lost, {self.write_errors} write errors.")
+
+    def run(self):
+        os.makedirs(self.directory, exist_ok=True)
+        while not self._stop_event.wait(self.flush_interval):
+            self._write_pending()
+        self._write_pending()
+        try:
+            self._write_timing(force=True)
+        except OSError as e:
+            print(f"Data logger write failed: {e}")
+        self._close_file()
+
+    # --- Writing ---
+
+    def _to_records(self, samples):
+        records = np.empty(len(samples), dtype=RECORD_DTYPE)
+        records['time'] = samples['time']
+        records['measure'] = samples['measure']
+        records['valve'] = samples['valve']
+        records['status'] = samples['status']
+
+        with self._setpoint_lock:
+            times = np.array(self._setpoint_times, dtype=np.float64)
+            values = np.array(self._setpoint_values, dtype=np.int32)
+        # Changes up to the last sample apply now; later ones wait for the next batch
+        applied = int(np.searchsorted(times, records['time'][-1], side='right'))
+        in_force = np.concatenate(([self._setpoint], values[:applied]))
+        records['setpoint'] = in_force[np.searchsorted(times[:applied], records['time'], side='right')]
+        if applied:
+            self._setpoint = int(values[applied - 1])
+            with self._setpoint_lock:
+                del self._setpoint_times[:applied], self._setpoint_values[:applied]
+        return records
+
+    def _write_pending(self):
+        samples, self.cursor, lost = self.sample_ring.read_since(self.cursor)
+        if lost:
+            self.lost += lost
+            print(f"Data logger fell behind: {lost} samples not recorded.")
+        if len(samples) == 0:
+            return
+        records = self._to_records(samples)
+        try:
+            if self._file is None or self._rotation_due():
+                self._open_file(records['time'][0])
+            self._append(records)
+            self._write_timing()
+        except OSError as e:
+            self.write_errors += 1
+            print(f"Data logger write failed: {e}")
+            self._close_file()
+
+    def _rotation_due(self):
+        size = HEADER_DTYPE.itemsize + self._records_in_file * RECORD_DTYPE.itemsize
+        return size >= self.max_bytes or time.time() - self._opened_at >= self.rotate_seconds
+
+    def _open_file(self, first_time):
+        self._close_file()
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(first_time))
+        path = os.path.join(self.directory, f"p800_{stamp}.bin")
+        suffix = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f"p800_{stamp}_{suffix}.bin")
+            suffix += 1
+
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header['magic'] = MAGIC
+        header['version'] = VERSION
+        header['record_size'] = RECORD_DTYPE.itemsize
+        header['capacity'] = self.capacity
+        header['created'] = time.time()
+        self._file = open(path, 'wb')
+        self._file.write(header.tobytes())
+        self._index_file = open(index_path(path), 'wb')
+        self._timing_file = open(timing_path(path), 'w', encoding='utf-8')
+        self._timing_written_at = 0.0
+        self.path = path
+        self._opened_at = time.time()
+        self._records_in_file = 0
+        self.files_written += 1
+        print(f"Recording to {path}")
+
+    def _append(self, records):
+        # Index entries for the records falling on the index grid
+        first = self._records_in_file
+        numbers = np.arange(first, first + len(records))
+        marks = numbers % self.index_interval == 0
+        if marks.any():
+            index = np.empty(int(marks.sum()), dtype=INDEX_DTYPE)
+            index['time'] = records['time'][marks]
+            index['record'] = numbers[marks]
+            self._index_file.write(index.tobytes())
+            self._index_file.flush()
+
+        data = records.tobytes()
+        self._file.write(data)
+        self._file.flush()
+        self._records_in_file += len(records)
+        self.records_written += len(records)
+        self.bytes_written += len(data)
+
+    def _write_timing(self, force=False):
+        """Writes the latest sampling statistics once per timing_interval (or now if forced)."""
+        timing = self._timing
+        if timing is None or self._timing_file is None:
+            return
+        if not force and time.time() - self._timing_written_at < self.timing_interval:
+            return
+        self._timing = None
+        self._timing_file.write(json.dumps(timing) + '\n')
+        self._timing_file.flush()
+        self._timing_written_at = time.time()
+
+    def _close_file(self):
+        for f in (self._file, self._index_file, self._timing_file):
+            if f is not None:
+                try:
+                    f.close()
+                except OSError:
+                    pass
+        self._file = self._index_file = self._timing_file = None
@@ -17,35 +17,46 @@ except ImportError:
     sys.exit(1)
 
 
-def run_parameter_check():
+def run_parameter_check(simulate=False, port=None):
     """
     Connects to the instrument and prints all known parameters.
+    simulate: scan a SimulatedInstrument instead of a real device.
+    port: connect to this port without asking.
     """
-    # 1. Get a list of all available COM ports.
-    available_ports = [port.device for port in serial.tools.list_ports.comports()]
+    if simulate:
+        selected_port = 'SIM'
+    elif port:
+        selected_port = port
+    else:
+        # 1. Get a list of all available COM ports.
+        available_ports = [port.device for port in serial.tools.list_ports.comports()]
+
+        if not available_ports:
+            print("Error: No COM ports found. Please ensure your device is connected.")
+            return
+
+        # 2. Ask the user to select a port from the list.
+        print("Available COM ports:")
+        for i, port in enumerate(available_ports):
+            print(f"  {i}: {port}")
 
-    if not available_ports:
-        print("Error: No COM ports found. Please ensure your device is connected.")
-        return
-
-    # 2. Ask the user to select a port from the list.
-    print("Available COM ports:")
-    for i, port in enumerate(available_ports):
-        print(f"  {i}: {port}")
-
-    try:
-        selection = int(input("Enter the number of the port to connect to: "))
-        selected_port = available_ports[selection]
-    except (ValueError, IndexError):
-        print("Invalid selection. Exiting.")
-        return
+        try:
+            selection = int(input("Enter the number of the port to connect to: "))
+            selected_port = available_ports[selection]
+        except (ValueError, IndexError):
+            print("Invalid selection. Exiting.")
+            return
 
     print(f"\nAttempting to connect to {selected_port}...")
 
     instrument = None
     try:
         # 3. Connect to the instrument.
-        instrument = propar.instrument(selected_port)
+        if simulate:
+            from simulated_instrument import SimulatedInstrument
+            instrument = SimulatedInstrument(selected_port, latency=0.0, latency_jitter=0.0)
+        else:
+            instrument = propar.instrument(selected_port)
         print(f"Successfully connected to {selected_port}.")
 
         # 4. NEW STRATEGY: Iterate through all possible parameter numbers (0-255)
@@ -114,5 +125,11 @@ def run_parameter_check():
 
 
 if __name__ == '__main__':
-    run_parameter_check()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Scan a Bronkhorst instrument for active parameters.")
+    parser.add_argument('--simulate', action='store_true', help="scan the simulated instrument")
+    parser.add_argument('--port', help="port to connect to, instead of asking")
+    args = parser.parse_args()
+    run_parameter_check(simulate=args.simulate, port=args.port)
 
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of the device metadata that practically never changes for a
+given unit (capacity, unit, user tag), keyed by the serial number (param 1).
+Lets the GUI start without reading them, then confirm them in the background.
+"""
+import json
+import os
+import time
+
+
+class DeviceProfileCache:
+    FIELDS = ('capacity', 'unit', 'user_tag')
+
+    def __init__(self, path):
+        self.path = path
+        self.profiles = {}
+        try:
+            with open(path, 'r') as f:
+                self.profiles = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable device profile cache {path}: {e}")
+
+    def get(self, serial):
+        """Returns the cached profile dict of a serial number, or None."""
+        profile = self.profiles.get(serial)
+        if profile is None or any(field not in profile for field in self.FIELDS):
+            return None
+        return profile
+
+    def store(self, serial, capacity, unit, user_tag):
+        """Saves the profile of a serial number if it changed. Returns True if the file was written."""
+        profile = {'capacity': capacity, 'unit': unit, 'user_tag': user_tag}
+        cached = self.profiles.get(serial)
+        if cached is not None and all(cached.get(field) == value for field, value in profile.items()):
+            return False
+
+        profile['updated'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.profiles[serial] = profile
+        # Write a temporary file first so a crash never leaves a truncated cache
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.profiles, f, indent=2)
+        os.replace(temp_path, self.path)
+        return True
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Serial link instrumentation: latency histograms per parameter, None/timeout
+and retry counters, and time spent waiting for the instrument mutex.
+Nothing in here touches Qt; the acquisition side records, the GUI only gets
+snapshot() dicts (JSON-serialisable, so they can be exported as they are).
+"""
+import json
+import threading
+import time
+
+import propar
+
+
+class LatencyHistogram:
+    """Fixed log-spaced buckets in milliseconds, plus count, sum and max."""
+
+    # Upper bounds of the buckets; the last bucket takes everything above
+    BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, seconds):
+        ms = seconds * 1000.0
+        index = 0
+        while index < len(self.BOUNDS_MS) and ms > self.BOUNDS_MS[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile, capped at the max seen."""
+        if self.count == 0:
+            return 0.0
+        rank = q / 100.0 * self.count
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                return min(float(self.BOUNDS_MS[index]), self.max_ms) if index < len(self.BOUNDS_MS) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self):
+        labels = [f"<={bound}" for bound in self.BOUNDS_MS] + [f">{self.BOUNDS_MS[-1]}"]
+        return {
+            'count': self.count,
+            'mean_ms': self.total_ms / self.count if self.count else 0.0,
+            'p50_ms': self.percentile(50),
+            'p99_ms': self.percentile(99),
+            'max_ms': self.max_ms,
+            'histogram_ms': dict(zip(labels, self.buckets)),
+        }
+
+
+class _ParameterStats:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.reads = 0
+        self.writes = 0
+        self.none = 0            # Reads that returned None
+        self.timeouts = 0        # ... of which ran into the response timeout
+        self.write_failures = 0  # Writes not acknowledged
+        self.retries = 0         # Reads repeated after a failed read of the same parameter
+
+    def snapshot(self):
+        result = {name: getattr(self, name)
+                  for name in ('reads', 'writes', 'none', 'timeouts', 'write_failures', 'retries')}
+        result['latency'] = self.latency.snapshot()
+        return result
+
+
+class LinkStatistics:
+    """Thread-safe store of everything InstrumentedInstrument measures."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.parameters = {}   # dde_nr, or 'a+b+c' for a chained request
+            self.mutex_wait = LatencyHistogram()
+            self._failed = set()   # Parameters whose last read failed
+
+    def _entry(self, key):
+        entry = self.parameters.get(key)
+        if entry is None:
+            entry = self.parameters[key] = _ParameterStats()
+        return entry
+
+    def record_read(self, key, duration, ok, timed_out=False):
+        with self._lock:
+            entry = self._entry(key)
+            entry.reads += 1
+            entry.latency.add(duration)
+            if key in self._failed:
+                entry.retries += 1
+            if ok:
+                self._failed.discard(key)
+            else:
+                entry.none += 1
+                entry.timeouts += int(timed_out)
+                self._failed.add(key)
+
+    def record_write(self, key, duration, ok):
+        with self._lock:
+            entry = self._entry(key)
+            entry.writes += 1
+            entry.latency.add(duration)
+            entry.write_failures += int(not ok)
+
+    def record_mutex_wait(self, duration):
+        with self._lock:
+            self.mutex_wait.add(duration)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'started': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started)),
+                'uptime_s': time.time() - self.started,
+                # Single parameters by number, then the chained requests
+                'parameters': {str(key): entry.snapshot() for key, entry in sorted(
+                    self.parameters.items(),
+                    key=lambda item: (isinstance(item[0], str), item[0] if isinstance(item[0], int) else 0,
+                                      str(item[0])))},
+                'mutex_wait': self.mutex_wait.snapshot(),
+            }
+
+
+def export_json(snapshot, path, **extra):
+    """Writes a snapshot (plus any extra fields, e.g. the serial number) to a JSON file."""
+    document = dict(extra)
+    document['exported'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    document.update(snapshot)
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2)
+
+
+class InstrumentedInstrument:
+    """
+    Wraps a propar.instrument and records every readParameter, writeParameter
+    and chained read_parameters call in a LinkStatistics. Any other attribute
+    (db, master, comport...) is passed through to the wrapped instrument.
+    """
+
+    def __init__(self, instrument, stats=None):
+        self.instrument = instrument
+        self.stats = stats if stats is not None else LinkStatistics()
+        master = getattr(instrument, 'master', None)
+        self.response_timeout = getattr(master, 'response_timeout', 0.5)
+
+    def __getattr__(self, name):
+        return getattr(self.instrument, name)
+
+    def _timed_out(self, duration):
+        return duration >= 0.9 * self.response_timeout
+
+    def readParameter(self, dde_nr, channel=None):
+        start = time.perf_counter()
+        try:
+            value = self.instrument.readParameter(dde_nr, channel)
+        except Exception:
+            self.stats.record_read(dde_nr, time.perf_counter() - start, False)
+            raise
+        duration = time.perf_counter() - start
+        self.stats.record_read(dde_nr, duration, value is not None, self._timed_out(duration))
+        return value
+
+    def writeParameter(self, dde_nr, data, channel=None):
+        start = time.perf_counter()
+        try:
+            ok = self.instrument.writeParameter(dde_nr, data, channel)
+        except Exception:
+            self.stats.record_write(dde_nr, time.perf_counter() - start, False)
+            raise
+        self.stats.record_write(dde_nr, time.perf_counter() - start, bool(ok))
+        return ok
+
+    def read_parameters(self, parameters, callback=None, channel=None):
+        key = '+'.join(str(parm['dde_nr']) for parm in parameters)
+        start = time.perf_counter()
+        try:
+            response = self.instrument.read_parameters(parameters, callback, channel)
+        except Exception:
+            self.stats.record_read(key, time.perf_counter() - start, False)
+            raise
+        duration = time.perf_counter() - start
+        ok = (response is not None and len(response) == len(parameters)
+              and all(parm.get('status', 0) == 0 for parm in response))
+        timed_out = bool(response) and response[0].get('status') == propar.PP_STATUS_TIMEOUT_ANSWER
+        self.stats.record_read(key, duration, ok, timed_out)
+        return response
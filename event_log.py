@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Structured log events, gated by level per category.
+
+Every event belongs to one category (acquisition, safety, admin, connection)
+whose level is read from the [Logging] section of config.ini. A call below
+the active level returns after one comparison: the message is a %-style
+template, and neither it nor the fields are formatted unless the event is
+emitted. Emitted events are printed, so they reach the log panel and the log
+file like any other message, as
+
+    [safety] Purge timeout, forcing close elapsed_s=10.02 target_bar=0.0
+
+The fields (param, value, latency...) follow as key=value pairs that
+scripts can parse.
+"""
+import logging
+import sys
+
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+CATEGORIES = ('acquisition', 'safety', 'admin', 'connection')
+
+
+class _ConsoleHandler(logging.StreamHandler):
+    """Writes to the current sys.stdout (the log panel once redirected, the event queue in the child)."""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class _EventFormatter(logging.Formatter):
+    def format(self, record):
+        text = f"[{record.category}] "
+        if record.levelno >= WARNING:
+            text += f"{record.levelname}: "
+        text += record.getMessage()
+        for key, value in record.fields.items():
+            if isinstance(value, float):
+                value = f"{value:.6g}"
+            text += f" {key}={value}"
+        return text
+
+
+_root = logging.getLogger('p800')
+_root.propagate = False
+_handler = _ConsoleHandler()
+_handler.setFormatter(_EventFormatter())
+_root.addHandler(_handler)
+
+
+class EventLog:
+    """Logger of one category. debug/info/warning/error(message, *args, **fields)."""
+
+    def __init__(self, category):
+        self.category = category
+        self.level = INFO
+        self.logger = logging.getLogger('p800.' + category)
+        self.logger.setLevel(self.level)
+
+    def enabled(self, level):
+        """For hot paths that would have to compute an argument: `if log.enabled(DEBUG): ...`."""
+        return level >= self.level
+
+    def set_level(self, level):
+        self.level = level
+        self.logger.setLevel(level)
+
+    def debug(self, message, *args, **fields):
+        if self.level <= DEBUG:
+            self._emit(DEBUG, message, args, fields)
+
+    def info(self, message, *args, **fields):
+        if self.level <= INFO:
+            self._emit(INFO, message, args, fields)
+
+    def warning(self, message, *args, **fields):
+        if self.level <= WARNING:
+            self._emit(WARNING, message, args, fields)
+
+    def error(self, message, *args, **fields):
+        if self.level <= ERROR:
+            self._emit(ERROR, message, args, fields)
+
+    def _emit(self, level, message, args, fields):
+        self.logger.log(level, message, *args, extra={'category': self.category, 'fields': fields})
+
+
+_logs = {category: EventLog(category) for category in CATEGORIES}
+
+
+def get_log(category):
+    """Returns the EventLog of a category (one of CATEGORIES)."""
+    return _logs[category]
+
+
+def levels_from_config(settings):
+    """
+    Reads {category: level} from a [Logging] section (or any mapping):
+    `level` applies to every category, `<category>_level` overrides it.
+    Unknown level names fall back to INFO.
+    """
+    default = str(settings.get('level', 'INFO')).strip().upper()
+    levels = {}
+    for category in CATEGORIES:
+        name = str(settings.get(f'{category}_level', default)).strip().upper()
+        level = logging.getLevelName(name)
+        levels[category] = level if isinstance(level, int) else INFO
+    return levels
+
+
+def configure(levels):
+    """Applies {category: level} (levels_from_config); also called in the acquisition process."""
+    for category, level in levels.items():
+        _logs[category].set_level(level)
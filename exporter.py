@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Export of pressure, setpoint, valve and status samples to CSV or Parquet.
+
+Samples come from a source that yields them in chunks (recording files read
+through their memory maps, or a snapshot of the live plot history), and the
+ExportWorker thread writes each chunk before asking for the next one, so
+memory use does not depend on the number of rows and the GUI stays responsive.
+Parquet needs the optional pyarrow package.
+"""
+import glob
+import os
+
+import numpy as np
+from PyQt6 import QtCore
+
+from data_logger import RecordedSession, open_records
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = pq = None
+
+# Rows per chunk read and written
+CHUNK_ROWS = 50000
+
+EXPORT_COLUMNS = ('time', 'utc_time', 'pressure_bar', 'setpoint_bar', 'valve', 'status')
+
+
+def parquet_available():
+    return pq is not None
+
+
+class RecordingSource:
+    """Samples of recording files between t_start and t_end, chunk by chunk."""
+
+    def __init__(self, session, t_start, t_end):
+        self.parts = []   # (segment, first record, end record)
+        for segment in session.segments:
+            first = segment.locate(t_start)
+            end = segment.locate(t_end)
+            if end > first:
+                self.parts.append((segment, first, end))
+
+    def __len__(self):
+        return sum(end - first for _, first, end in self.parts)
+
+    def chunks(self, rows=CHUNK_ROWS):
+        for segment, first, end in self.parts:
+            for start in range(first, end, rows):
+                records = np.array(segment.records[start:min(start + rows, end)])
+                yield {'time': records['time'],
+                       'pressure_bar': segment.to_bar(records['measure']),
+                       'setpoint_bar': segment.to_bar(records['setpoint']),
+                       'valve': records['valve'],
+                       'status': records['status']}
+
+
+class HistorySource:
+    """
+    A copy of the raw samples of the live plot history. The plot does not
+    keep the valve and status reads, which are exported as -1.
+    """
+
+    def __init__(self, history, setpoints):
+        self.time = np.array(history.view('time'))
+        self.pressure = np.array(history.view('pressure'))
+        self.setpoint = setpoints.values_at(self.time)
+
+    def __len__(self):
+        return len(self.time)
+
+    def chunks(self, rows=CHUNK_ROWS):
+        for start in range(0, len(self.time), rows):
+            window = slice(start, start + rows)
+            missing = np.full(len(self.time[window]), -1, dtype=np.int32)
+            yield {'time': self.time[window], 'pressure_bar': self.pressure[window],
+                   'setpoint_bar': self.setpoint[window], 'valve': missing, 'status': missing}
+
+
+def recordings_between(directory, t_start, t_end):
+    """Recording files of `directory` holding samples between t_start and t_end."""
+    paths = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.bin'))):
+        try:
+            records = open_records(path)
+        except (OSError, ValueError):
+            continue
+        if len(records) and records['time'][0] <= t_end and records['time'][-1] >= t_start:
+            paths.append(path)
+    return paths
+
+
+def live_source(plot_window):
+    """
+    Source for exporting the live plot history: the recordings covering its
+    time range when there are any (they hold every field), else the history itself.
+    """
+    history = plot_window.history
+    t_start, t_end = history.first('time'), history.last('time')
+    paths = recordings_between(plot_window.recording_dir, t_start, t_end) if plot_window.recording_dir else []
+    if paths:
+        return RecordingSource(RecordedSession(paths, levels=False), t_start, t_end + 1e-6)
+    return HistorySource(history, plot_window.setpoints)
+
+
+def _utc_strings(times):
+    return np.datetime_as_string((times * 1000.0).astype('datetime64[ms]'), unit='ms')
+
+
+class _CsvWriter:
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        self.file.write(','.join(EXPORT_COLUMNS) + '\n')
+
+    def write(self, chunk):
+        utc = _utc_strings(chunk['time'])
+        lines = [f"{t:.3f},{u},{p:.4f},{s:.4f},{v},{st}\n"
+                 for t, u, p, s, v, st in zip(chunk['time'].tolist(), utc.tolist(), chunk['pressure_bar'].tolist(),
+                                             chunk['setpoint_bar'].tolist(), chunk['valve'].tolist(),
+                                             chunk['status'].tolist())]
+        self.file.write(''.join(lines).replace('nan', ''))
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetWriter:
+    def __init__(self, path):
+        schema = pyarrow.schema([('time', pyarrow.float64()), ('utc_time', pyarrow.timestamp('ms', tz='UTC')),
+                                 ('pressure_bar', pyarrow.float64()), ('setpoint_bar', pyarrow.float64()),
+                                 ('valve', pyarrow.int32()), ('status', pyarrow.int32())])
+        self.writer = pq.ParquetWriter(path, schema)
+
+    def write(self, chunk):
+        # One row group per chunk
+        columns = dict(chunk, utc_time=(chunk['time'] * 1000.0).astype('datetime64[ms]'))
+        self.writer.write_table(pyarrow.table({name: columns[name] for name in EXPORT_COLUMNS},
+                                              schema=self.writer.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+class ExportWorker(QtCore.QThread):
+    """Writes a source to a CSV or Parquet file (by extension) off the GUI thread."""
+    PROGRESS = QtCore.pyqtSignal(int, int)   # rows written, total rows
+    FINISHED = QtCore.pyqtSignal(str, int)   # path, rows written
+    FAILED = QtCore.pyqtSignal(str)
+
+    def __init__(self, source, path, parent=None):
+        super(ExportWorker, self).__init__(parent)
+        self.source = source
+        self.path = path
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        total = len(self.source)
+        written = 0
+        try:
+            if self.path.lower().endswith('.parquet'):
+                if pq is None:
+                    raise RuntimeError("Parquet export needs the pyarrow package (pip install pyarrow).")
+                writer = _ParquetWriter(self.path)
+            else:
+                writer = _CsvWriter(self.path)
+            try:
+                for chunk in self.source.chunks():
+                    if self.cancelled:
+                        break
+                    writer.write(chunk)
+                    written += len(chunk['time'])
+                    self.PROGRESS.emit(written, total)
+            finally:
+                writer.close()
+        except (OSError, RuntimeError, ValueError) as e:
+            self.FAILED.emit(str(e))
+            return
+        if self.cancelled:
+            os.remove(self.path)
+            self.FAILED.emit("Export cancelled.")
+            return
+        self.FINISHED.emit(self.path, written)
@@ -10,25 +10,39 @@ __version__ = "1.2.1-beta"
 import pathlib, os
 os.environ['QT_API'] = 'pyqt6'
 from admin_window import AdminWindow
+from acquisition import (PollScheduler, SampleRing, AcquisitionLoop, AcquisitionProcess, CommandQueue,
+                         bar_to_propar, propar_to_bar)
+from console_log import ConsoleLog
+from data_logger import DataLogger, RecordedSession
+from device_profiles import DeviceProfileCache
+from event_log import configure as configure_event_logs, get_log, levels_from_config
+from exporter import ExportWorker, RecordingSource, live_source, parquet_available
+from plot_history import EventHistory, TieredHistory, parse_tiers
+from safety_journal import SafetyJournal
+from simulated_instrument import factory_from_config
 from help_window import HelpWindow
 import propar
 from PyQt6 import QtCore, uic
-from PyQt6.QtWidgets import (QApplication, QWidget, QMainWindow, QInputDialog, QMessageBox, QLineEdit, QButtonGroup)
-from PyQt6.QtCore import QMutex
+from PyQt6.QtWidgets import (QApplication, QWidget, QMainWindow, QInputDialog, QMessageBox, QLineEdit, QButtonGroup,
+                             QFileDialog, QProgressDialog)
+from PyQt6.QtCore import QMutex, QEvent
 
 import datetime as dt
 import pyqtgraph as pg
 from PyQt6.QtGui import QIcon
 import sys
 import time
+import argparse
 import qdarkstyle
 from PyQt6.QtCore import Qt
-
-from collections import deque
 import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 import configparser
 
+_safety_log = get_log('safety')
+_connection_log = get_log('connection')
+_admin_log = get_log('admin')
+
 
 def load_configuration():
     config = configparser.ConfigParser()
@@ -38,7 +52,11 @@ def load_configuration():
 
     # Default values in case file is missing
     defaults = {
-        'Connection': {'default_com_port': 'COM1'},
+        'Connection': {
+            'default_com_port': 'COM1',
+            'use_profile_cache': '1',
+            'profile_cache': 'device_profiles.json'
+        },
         'Safety': {
             'max_set_pressure': '100.0',
             'set_point_above_tolerance': '1',
@@ -47,14 +65,59 @@ def load_configuration():
             'purge_shut_delay_timeout': '7'
             # ----------------------
         },
-        'Thread': {'thread_sleep_time': '0.2'},
+        'Thread': {
+            'thread_sleep_time': '0.1',
+            'valve_poll_time': '0.2',
+            'status_poll_time': '0.2',
+            'acquisition_mode': 'thread',
+            'chained_reads': '1',
+            'read_mode_compare_cycles': '10',
+            'timing_report_interval': '60',
+            'heartbeat_parameter': '28',
+            'reconnect_initial_delay': '0.05',
+            'reconnect_max_delay': '2.0',
+            'reconnect_reopen_after': '5'
+        },
+        'Simulation': {
+            'latency': '0.010',
+            'latency_jitter': '0.002',
+            'dropout_rate': '0',
+            'supply_pressure': '110',
+            'volume': '1.0'
+        },
         'Plotting': {
             'max_history': '24000',
             'default_duration': '10',
+            'history_tiers': '1:86400, 60:43200',
 
         },
+        'Recording': {
+            'enabled': 'true',
+            'directory': 'recordings',
+            'max_file_mb': '64',
+            'rotate_hours': '24',
+            'flush_interval': '1.0',
+            'index_interval': '256',
+            'timing_interval': '60'
+        },
+        'Logging': {
+            'log_file': 'logs/console.log',
+            'log_file_mb': '5',
+            'log_file_backups': '5',
+            'widget_max_lines': '2000',
+            'widget_refresh_ms': '250',
+            'level': 'INFO',
+            'acquisition_level': 'INFO',
+            'safety_level': 'INFO',
+            'admin_level': 'INFO',
+            'connection_level': 'INFO',
+            'safety_journal': 'logs/safety_journal.jsonl'
+        },
         'Security': {'admin_password': 'appli'},
-        'UI': {'window_title': 'LOA Pressure Control'}
+        'UI': {
+            'window_title': 'LOA Pressure Control',
+            'display_refresh_fps': '30'
+        }
     }
 
     # Load the file
@@ -121,16 +184,13 @@ def calculate_valve_percentage(raw_valve_output):
     norm = 100 * (100 / 61.67)
     return float(norm * (raw_valve_output / max_val))
 
-class Stream(QtCore.QObject):
-    """Redirects console output to a QTextEdit widget."""
-    new_text = QtCore.pyqtSignal(str)
-
-    def write(self, text):
-        self.new_text.emit(str(text))
-
-    def flush(self):
-        # This is needed for compatibility.
-        pass
+def status_from_code(alarm_status):
+    """Maps the status word (param 28) to the device status shown in the GUI."""
+    if alarm_status & 1:
+        return 'Error'
+    elif alarm_status & 2:
+        return 'Warning'
+    return 'Normal'
 
 class EnterSpinBox(QDoubleSpinBox):
     """
@@ -178,17 +238,20 @@ class TimeAxisItem(pg.AxisItem):
                 local_dt = utc_dt.astimezone(None)  # None uses the system's local time zone
 
                 # 3. Format the LOCALIZED datetime object to display time as HH:MM:SS
-                strings.append(local_dt.strftime('%H:%M:%S'))
+                #    (with the date once the ticks are hours apart, e.g. viewing recordings)
+                strings.append(local_dt.strftime('%d/%m %H:%M' if spacing >= 3600 else '%H:%M:%S'))
 
             except Exception:
                 strings.append('')
         return strings
 
 class PlotWindow(QMainWindow):
-    # ... (other code)
+    # Control modes shaded behind the curves, with their (r, g, b, alpha) fill
+    MODES = ('PID', 'Shut', 'Purge')
+    MODE_BRUSHES = {'PID': (0, 230, 118, 18), 'Shut': (160, 160, 160, 28), 'Purge': (255, 145, 0, 45)}
 
     def __init__(self, parent=None, max_history=24000, default_duration=10.0,
-                 p_color='#FFFF00', s_color='#FF0000',user_tag=""):
+                 p_color='#FFFF00', s_color='#FF0000',user_tag="", tiers=()):
         # 1. Initialize the QMainWindow superclass
         super(PlotWindow, self).__init__(parent)
         self.resize(400, 300)  # Width, Height in pixels
@@ -203,6 +266,7 @@ class PlotWindow(QMainWindow):
 
         # 3. Styling the plot
         self.graphWidget.setBackground('k')
+        self.session = None
         self.update_title(user_tag)
         gray_color = '#C0C0C0'
         styles = {'color': gray_color, 'font-size': '10pt'}
@@ -216,9 +280,37 @@ class PlotWindow(QMainWindow):
 
         # 4. Initialize Data Storage (MAX_HISTORY_POINTS needs to be defined near the class)
         #MAX_HISTORY_POINTS = 24000 #around 1 hour
-        self.time_data = deque(maxlen=int(max_history))
-        self.pressure_data = deque(maxlen=int(max_history))
-        self.setpoint_data = deque(maxlen=int(max_history))
+        # Preallocated numpy arrays with min/max levels of detail; the plot lines
+        # get the visible part at about two points per pixel column. Older data
+        # is kept in coarser min/mean/max tiers (e.g. 1 s, 1 min) of fixed size.
+        self.history = TieredHistory(max_history, channels=('pressure',), tiers=tiers)
+        # The setpoint and the control mode change a few times per session:
+        # they are kept as change events, not one value per sample
+        self.setpoints = EventHistory()
+        self.modes = EventHistory()
+        self.mode_regions = []
+        # Set when data arrived while the window was hidden or minimized
+        self.render_pending = False
+
+        # 7. History viewer: recordings (data_logger.py) opened memory-mapped, drawn
+        #    for whatever range the mouse zooms or pans to; live data keeps being stored
+        self.session = None
+        self.recording_dir = ''
+        self.recording_timer = QTimer(self)
+        self.recording_timer.setSingleShot(True)
+        self.recording_timer.timeout.connect(self.render_recording)
+        self.graphWidget.getViewBox().sigXRangeChanged.connect(self._on_x_range_changed)
+        history_menu = self.menuBar().addMenu('&History')
+        open_action = history_menu.addAction('Open recording...')
+        open_action.triggered.connect(self.choose_recording)
+        self.live_action = history_menu.addAction('Back to live view')
+        self.live_action.triggered.connect(self.show_live)
+        self.live_action.setEnabled(False)
+        history_menu.addSeparator()
+        export_action = history_menu.addAction('Export samples...')
+        export_action.triggered.connect(self.export_samples)
+        self.export_worker = None
+        self.export_progress = None
         #self.start_time = time.monotonic()
 
 
@@ -226,7 +318,7 @@ class PlotWindow(QMainWindow):
 
         # 5. Initialize Plot Lines
         pen = pg.mkPen(color=p_color, width=2)
-        self.data_line = self.graphWidget.plot(list(self.time_data), list(self.pressure_data), pen=pen)
+        self.data_line = self.graphWidget.plot(pen=pen)
 
         # --- Setpoint Line ---
         setpoint_pen = pg.mkPen(color=s_color, width=1.5)  # slightly thinner
@@ -264,6 +356,10 @@ class PlotWindow(QMainWindow):
 
     def update_title(self, user_tag=""):
         """Updates the plot title to include the User Tag if available."""
+        self.user_tag = user_tag
+        if self.session is not None:
+            # The viewer shows the recording name; the tag is used again on return to live
+            return
         base_title = "Pressure Reading and Setpoint"
         if user_tag and user_tag != "—":
             full_title = f"{base_title} - {user_tag}"
@@ -276,51 +372,197 @@ class PlotWindow(QMainWindow):
         if duration_s > 0:
             self.max_duration = duration_s
             # When duration changes, it forces a refresh of the plotted data
-            self.update_plot_viewport()
+            self.render()
 
     def set_setpoint_value(self, value):
         """A simple slot to receive and store the current setpoint value."""
         self.current_setpoint = value
+        self.setpoints.record(time.time(), value)
+
+    def set_mode(self, mode):
+        """Records a control mode change ('PID', 'Shut' or 'Purge') for the shaded regions."""
+        self.modes.record(time.time(), self.MODES.index(mode))
 
-    def update_plot(self, timestamp, pressure_value):
-        """ This method receives new data, appends it to the history, and updates the plot view. """
+    def update_plot(self, timestamps, pressure_values):
+        """
+        Receives a batch of new samples, appends them to the history,
+        and updates the plot view once for the whole batch.
+        """
 
         # *** FIX: Remove the elapsed time calculation! ***
-        # The incoming 'timestamp' from THREADFlow is now the absolute x-value (time.time())
+        # The incoming timestamps from THREADFlow are the absolute x-values (wall time)
         # The line 'elapsed_time = timestamp - self.start_time' is no longer needed.
 
-        # 1. Append new data (using the absolute timestamp directly)
-        self.time_data.append(timestamp)  # Use the absolute timestamp here
-        self.pressure_data.append(pressure_value)
-        self.setpoint_data.append(self.current_setpoint)
+        # 1. Append new data (using the absolute timestamps directly)
+        self.history.extend(time=timestamps, pressure=pressure_values)
 
-        # 2. Update the plot lines
-        self.data_line.setData(list(self.time_data), list(self.pressure_data))
-        self.setpoint_line.setData(list(self.time_data), list(self.setpoint_data))
+        # 2. Update the plot lines and adjust the viewport to show the desired max_duration
+        self.render()
 
-        # 3. Adjust the viewport to show the desired max_duration
-        self.update_plot_viewport()
+    def render(self):
+        """Redraws the current view if the window is on screen; otherwise only
+        notes that a redraw is due, so a hidden plot costs just the appends."""
+        if self.isVisible() and not self.isMinimized() and self.session is None:
+            self.render_pending = False
+            self.update_plot_viewport()
+        else:
+            self.render_pending = True
+
+    def catch_up(self):
+        """Draws the data stored while the window was hidden or minimized, once."""
+        if self.render_pending:
+            self.render()
+
+    def choose_recording(self):
+        """Asks for recording files (several files of one session can be selected together)."""
+        paths, _ = QFileDialog.getOpenFileNames(self, "Open recordings", self.recording_dir,
+                                                "P-800 recordings (*.bin)")
+        if paths:
+            self.open_recording(paths)
+
+    def open_recording(self, paths):
+        """Switches to the history viewer on the given recording files, zoomed out to all of them."""
+        try:
+            session = RecordedSession(paths)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Error", f"Failed to open the recording.\n\nError: {e}")
+            return
+        print(f"Viewing {len(session)} recorded samples from {len(session.segments)} file(s).")
+        self.session = session
+        self.live_action.setEnabled(True)
+        for region in self.mode_regions:
+            region.hide()
+        self.graphWidget.setTitle(f"Recording - {os.path.basename(sorted(paths)[0])}"
+                                  + (f" (+{len(paths) - 1})" if len(paths) > 1 else ""),
+                                  color="#C0C0C0", size="12pt")
+        self.graphWidget.setXRange(session.first_time(), session.last_time(), padding=0)
+        self.render_recording()
+
+    def show_live(self):
+        """Leaves the history viewer; the live plot catches up with the samples stored meanwhile."""
+        self.session = None
+        self.live_action.setEnabled(False)
+        self.update_title(self.user_tag)
+        self.render_pending = True
+        self.catch_up()
+
+    def export_samples(self):
+        """
+        Exports to CSV or Parquet, in a worker thread: the live history, or
+        the visible range when a recording is open.
+        """
+        if self.export_worker is not None and self.export_worker.isRunning():
+            QMessageBox.information(self, "Export", "An export is already running.")
+            return
+        if self.session is not None:
+            x_min, x_max = self.graphWidget.getViewBox().viewRange()[0]
+            source = RecordingSource(self.session, x_min, x_max)
+        elif len(self.history):
+            source = live_source(self)
+        else:
+            QMessageBox.information(self, "Export", "No samples to export yet.")
+            return
+        if len(source) == 0:
+            QMessageBox.information(self, "Export", "No samples in the selected range.")
+            return
+
+        filters = "CSV (*.csv)" + (";;Parquet (*.parquet)" if parquet_available() else "")
+        default_name = f"p800_samples_{time.strftime('%Y%m%d_%H%M%S')}.csv"
+        path, selected = QFileDialog.getSaveFileName(self, "Export samples", default_name, filters)
+        if not path:
+            return
+        if not path.lower().endswith(('.csv', '.parquet')):
+            path += '.parquet' if selected.startswith('Parquet') else '.csv'
+
+        print(f"Exporting {len(source)} samples to {path}...")
+        self.export_progress = QProgressDialog(f"Exporting {len(source)} samples...", "Cancel", 0, 1000, self)
+        self.export_progress.setWindowTitle("Export")
+        self.export_progress.setMinimumDuration(0)
+        self.export_worker = ExportWorker(source, path, self)
+        self.export_worker.PROGRESS.connect(
+            lambda written, total: self.export_progress.setValue(int(written * 1000 / max(total, 1))))
+        self.export_worker.FINISHED.connect(self._export_finished)
+        self.export_worker.FAILED.connect(self._export_failed)
+        self.export_progress.canceled.connect(self.export_worker.cancel)
+        self.export_worker.start()
+
+    def _export_finished(self, path, rows):
+        self.export_progress.reset()
+        print(f"Exported {rows} samples to {path}")
+
+    def _export_failed(self, message):
+        self.export_progress.reset()
+        print(f"Export failed: {message}")
+        QMessageBox.warning(self, "Export", message)
+
+    def _on_x_range_changed(self, *args):
+        # Wheel and drag events come in bursts: draw once they are handled
+        if self.session is not None:
+            self.recording_timer.start(0)
+
+    def render_recording(self):
+        """Draws the visible range of the opened recording, decimated to the plot width."""
+        if self.session is None:
+            return
+        x_min, x_max = self.graphWidget.getViewBox().viewRange()[0]
+        columns = max(int(self.graphWidget.getViewBox().width()), 100)
+        self.data_line.setData(*self.session.envelope('pressure', x_min, x_max, columns))
+        self.setpoint_line.setData(*self.session.envelope('setpoint', x_min, x_max, columns))
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.catch_up()
+
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        # Restored from minimized
+        if event.type() == QEvent.Type.WindowStateChange:
+            self.catch_up()
 
     def update_plot_viewport(self):
         """Automatically adjusts the X-axis view to match the current duration setting,
         clipping the view to the actual recorded history."""
 
-        if self.time_data:
-            x_max = self.time_data[-1]
+        if len(self.history):
+            x_max = self.history.last('time')
 
             # 1. Calculate the minimum time required by the max_duration setting
             required_x_min = x_max - self.max_duration
 
-            # 2. Get the actual oldest time currently in the deque
-            actual_x_min = self.time_data[0]
+            # 2. Get the actual oldest time currently in the history (any tier)
+            actual_x_min = self.history.oldest_time()
 
             # 3. Clip the visible minimum (x_min) to be the larger of the two values.
             #    This prevents viewing time before the first recorded point.
             x_min = max(required_x_min, actual_x_min)
 
-            # 4. Set the X-Range of the plot
+            # 4. Hand the lines the visible samples only, decimated to min/max pairs
+            #    when there are more than two per pixel column, so the cost follows
+            #    the plot width rather than the visible duration and spikes stay visible
+            columns = max(int(self.graphWidget.getViewBox().width()), 100)
+            self.data_line.setData(*self.history.envelope('pressure', x_min, x_max, columns))
+            # The setpoint is a step curve through its change events
+            self.setpoint_line.setData(*self.setpoints.steps(x_min, x_max))
+            self.update_mode_regions(x_min, x_max)
+
+            # 5. Set the X-Range of the plot
             self.graphWidget.setXRange(x_min, x_max, padding=0)
 
+    def update_mode_regions(self, x_min, x_max):
+        """Shades the time spent in each control mode, reusing one region item per segment in view."""
+        segments = self.modes.segments(x_min, x_max)
+        while len(self.mode_regions) < len(segments):
+            region = pg.LinearRegionItem(movable=False, pen=pg.mkPen(None))
+            region.setZValue(-10)
+            self.graphWidget.addItem(region)
+            self.mode_regions.append(region)
+        for region, (start, end, mode) in zip(self.mode_regions, segments):
+            region.setBrush(pg.mkBrush(self.MODE_BRUSHES[self.MODES[int(mode)]]))
+            region.setRegion((start, end))
+            region.show()
+        for region in self.mode_regions[len(segments):]:
+            region.hide()
+
     def closeEvent(self, event):
         # Override closeEvent to only hide the window, not destroy it
         self.hide()
@@ -328,8 +570,13 @@ class PlotWindow(QMainWindow):
 
 
 class Bronkhost(QMainWindow):
+    # (future, on_done, on_error, description) of a finished instrument
+    # command, delivered in the GUI thread
+    COMMAND_DONE = QtCore.pyqtSignal(object, object, object, str)
 
-    def __init__(self, com=None, config=None, parent=None):
+    def __init__(self, com=None, config=None, parent=None, instrument_factory=None):
+        # instrument_factory: called with the port to open the instrument,
+        # propar.instrument by default (a SimulatedInstrument factory with --simulate)
         if com is None:
             # If no port was given, maybe pop up the selection dialog right here!
             # Or print an error, etc.
@@ -337,10 +584,14 @@ class Bronkhost(QMainWindow):
             return  # Stop initialization
 
         self.config = config  # Store config for later use
+        startup_start = time.perf_counter()
 
         super(Bronkhost, self).__init__(parent)
         self.is_offline = False
         self.connection_successful = False
+        self.acquisition_process = None
+        self.link_diagnostics = None
+        self.data_logger = None
         p = pathlib.Path(__file__)
         sepa = os.sep
         self.win = uic.loadUi('flow.ui', self)
@@ -382,36 +633,65 @@ class Bronkhost(QMainWindow):
         self.purge_timeout_limit = 10.0  # Default timeout
 
         self.current_pressure_bar = 0.0  # Stores the latest reading
-        self.purge_target = 0.0  # Stores target for check
-        self.purge_check_timer = QTimer(self)
-        self.purge_check_timer.timeout.connect(self._check_purge_condition)
-        self.purge_start_time = 0.0
 
         # --- REDIRECT PRINT STATEMENTS ---
-        self.log_stream = Stream()
-        self.log_stream.new_text.connect(self.update_log)
+        # Buffered: the log widget is updated a few times per second and keeps a
+        # bounded number of lines; everything also goes to a rotating file
+        log_settings = self.config['Logging'] if self.config.has_section('Logging') else {}
+        log_file = log_settings.get('log_file', 'logs/console.log').strip()
+        if log_file and not os.path.isabs(log_file):
+            log_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), log_file)
+        self.log_stream = ConsoleLog(
+            self.win.log_display,
+            max_lines=int(log_settings.get('widget_max_lines', 2000)),
+            refresh_ms=int(log_settings.get('widget_refresh_ms', 250)),
+            path=log_file,
+            max_bytes=float(log_settings.get('log_file_mb', 5)) * 1024 * 1024,
+            backups=int(log_settings.get('log_file_backups', 5)))
         sys.stdout = self.log_stream
+        # Levels of the structured event logs (acquisition, safety, admin, connection)
+        self.log_levels = levels_from_config(log_settings)
+        configure_event_logs(self.log_levels)
+        # Stage times of every safety event, kept across sessions
+        journal_file = log_settings.get('safety_journal', 'logs/safety_journal.jsonl').strip()
+        if journal_file and not os.path.isabs(journal_file):
+            journal_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), journal_file)
+        self.safety_journal = SafetyJournal(journal_file)
+        self.gui_dispatch_ms = {}  # Trace id -> GUI dispatch stage, until the trace arrives
         print(f"--- LOA Pressure Control v{__version__} ---")
 
+        # 'thread': poll in a QThread of this process
+        # 'process': poll in a child process that owns the serial port
+        self.acquisition_mode = self.config.get('Thread', 'acquisition_mode', fallback='thread').strip().lower()
+        if instrument_factory is None:
+            instrument_factory = propar.instrument
+
         try:
-            self.instrument = propar.instrument(com)
+            if self.acquisition_mode == 'process':
+                print("Starting acquisition process...")
+                self.acquisition_process = AcquisitionProcess(instrument_factory, com, log_levels=self.log_levels)
+                self.instrument = self.acquisition_process.instrument
+            else:
+                self.instrument = instrument_factory(com)
             device_serial = self.instrument.readParameter(1)  # Try to read the serial number
             if device_serial is None:
                 raise ConnectionError("Device is not responding on this port.")
-            print(f"Successfully connected to device with serial number: {device_serial}")
+            _connection_log.info("Connected to device", param=1, value=str(device_serial).strip())
+            self.device_serial = str(device_serial).strip()
             self.connection_successful = True
 
-            print("Reading initial device status...")
             initial_status = self.instrument.readParameter(28)
             if initial_status is not None:
-                binary_string = bin(initial_status)[2:].zfill(8)
-                print(f"Initial device status (param 28): Value={initial_status}, Bits={binary_string}")
+                _connection_log.info("Initial device status", param=28, value=initial_status)
             else:
-                print("Could not read initial device status.")
+                _connection_log.warning("Could not read initial device status", param=28)
 
         except Exception as e:
             # If connection fails, show an error
-            print("Failed")
+            _connection_log.error("Connection failed: %s", e, port=com)
+            if self.acquisition_process is not None:
+                self.acquisition_process.close()
+                self.acquisition_process = None
             QMessageBox.critical(self, "Connection Error",
                                  f"Failed to connect to {com}.\n\nError: {e}\n\nPlease check connection or try another port.")
             return
@@ -419,6 +699,19 @@ class Bronkhost(QMainWindow):
         # -------------------------------------------------------------------
         # *** START SUCCESSFUL CONNECTION BLOCK ***
         # -------------------------------------------------------------------
+        # Instrument commands are queued and sent by the thread that owns the port
+        if self.acquisition_process is not None:
+            self.commands = self.acquisition_process.commands
+        else:
+            self.commands = CommandQueue()
+        self.COMMAND_DONE.connect(self._command_finished)
+
+        # Capacity, unit and user tag of known devices are cached on disk
+        self.profile_cache = None
+        if self.config['Connection'].getboolean('use_profile_cache', True):
+            cache_file = self.config['Connection'].get('profile_cache', 'device_profiles.json')
+            self.profile_cache = DeviceProfileCache(os.path.join(str(p.parent), cache_file))
+
         title = self.config['UI'].get('window_title', 'LOA Pressure Control')
         self.setWindowTitle(f"{title} v{__version__}")
         #self.setWindowTitle(f"{name} v{__version__}")
@@ -431,14 +724,26 @@ class Bronkhost(QMainWindow):
         self.valve_close()
 
         self.alarm_popup_active = False
-        self.last_reset_time = 0.0
 
         # --- Read device capacity and units ---
         self.capacity = 0.0
         self.unit = ""
         self.response_alarm_enabled = False
-        self.read_device_info()
+        profile = self.profile_cache.get(self.device_serial) if self.profile_cache is not None else None
+        if profile is not None:
+            # Start from the cached profile; confirmed in the background once polling runs
+            print(f"Using cached device profile of {self.device_serial} (saved {profile.get('updated', '?')})")
+            self._apply_device_info(profile['capacity'], profile['unit'], profile['user_tag'])
+            self.read_device_info()
+        else:
+            # Polling has not started yet: read these directly, the rest of the
+            # startup needs the capacity
+            device_info = [self.instrument.readParameter(dde_nr) for dde_nr in (21, 129, 115)]
+            self._apply_device_info(*device_info)
+            self._store_device_profile(*device_info)
         self.configure_response_alarm()
+        # The first 'normal' status must not read all this again
+        self.device_info_current = True
 
         # 1. Initialize PlotWindow
         #self.plot_window = PlotWindow(self)
@@ -454,15 +759,42 @@ class Bronkhost(QMainWindow):
 
         # 4. Initialize and start the thread
         try:
-            thread_time = self.config['Thread'].getfloat('thread_sleep_time', 0.2)
+            thread_time = self.config['Thread'].getfloat('thread_sleep_time', 0.1)
+            valve_time = self.config['Thread'].getfloat('valve_poll_time', thread_time)
+            status_time = self.config['Thread'].getfloat('status_poll_time', thread_time)
+            chained_reads = self.config['Thread'].getboolean('chained_reads', True)
+            compare_cycles = self.config['Thread'].getint('read_mode_compare_cycles', 10)
+            timing_report_interval = self.config['Thread'].getfloat('timing_report_interval', 60.0)
+            reconnect_settings = {
+                'heartbeat_parameter': self.config['Thread'].getint('heartbeat_parameter', 28),
+                'initial_delay': self.config['Thread'].getfloat('reconnect_initial_delay', 0.05),
+                'max_delay': self.config['Thread'].getfloat('reconnect_max_delay', 2.0),
+                'reopen_after': self.config['Thread'].getint('reconnect_reopen_after', 5),
+            }
         except KeyError:
             # Fallback if [Thread] section is missing entirely in the file
             thread_time = 0.2
+            valve_time = status_time = thread_time
+            chained_reads = True
+            compare_cycles = 10
+            timing_report_interval = 60.0
+            reconnect_settings = {}
             print("Warning: [Thread] section missing in config, using default 0.2 s")
 
         print(f"Refresh thread_time loaded: {thread_time}")
-        max_possible_seconds = hist * thread_time
-        print(f"Buffer Capacity: {max_possible_seconds:.1f} seconds")
+        print(f"Acquisition read mode: {'chained' if chained_reads else 'per-parameter'}")
+        # Rate classes: pressure is read every tick, the others every N ticks
+        poll_scheduler = PollScheduler(thread_time, {28: status_time, 8: thread_time, 55: valve_time})
+        print(f"Poll periods: pressure={poll_scheduler.period_of(8):.2f}s, "
+              f"valve={poll_scheduler.period_of(55):.2f}s, status={poll_scheduler.period_of(28):.2f}s")
+
+        # The plot history holds one point per pressure sample, then coarser tiers
+        tiers = parse_tiers(self.config['Plotting'].get('history_tiers', ''))
+        raw_seconds = hist * poll_scheduler.period_of(8)
+        max_possible_seconds = max([raw_seconds] + [period * points for period, points in tiers])
+        print(f"Buffer Capacity: {raw_seconds:.1f} seconds raw, "
+              + "".join(f"{period * points / 3600:.1f} h at {period:g} s, " for period, points in tiers)
+              + f"{max_possible_seconds:.1f} seconds in total")
 
         # 3. Initialize PlotWindow
         # We read the default duration, but we cap it immediately to be safe
@@ -482,8 +814,12 @@ class Bronkhost(QMainWindow):
             max_history=hist,
             default_duration=startup_duration,
             p_color=col_pressure,
-            s_color=col_setpoint
+            s_color=col_setpoint,
+            tiers=tiers
         )
+        # Start the setpoint and mode records of the new plot window
+        self.show_setpoint(self.last_known_setpoint)
+        self._show_mode_on_plot()
 
         # 4. CONFIGURE THE SPINBOX
         if hasattr(self.win, 'plot_duration_spinbox'):
@@ -496,98 +832,143 @@ class Bronkhost(QMainWindow):
             # Add a tooltip so the user knows why it stops there
             self.win.plot_duration_spinbox.setToolTip(
                 f"Max history is {int(max_possible_seconds)}s. "
-                f"Limited by buffer size ({hist} points) "
-                f"and thread time ({thread_time}s)."
+                f"Raw samples for the last {int(raw_seconds)}s (buffer size {hist} points, "
+                f"thread time {thread_time}s), then the history_tiers averages."
             )
 
-        self.threadFlow = THREADFlow(self, capacity=self.capacity, thread_sleep_time=thread_time)
-        #self.threadFlow = THREADFlow(self, capacity=self.capacity)
-        self.threadFlow.start()
-
-        # 5. Connect thread signals
-        self.threadFlow.MEAS.connect(self.aff)
-        self.threadFlow.VALVE1_MEAS.connect(self.update_inlet_valve_display)
-        self.threadFlow.DEBUG_MEAS.connect(self.update_debug_display)
-        self.threadFlow.MEAS.connect(self.plot_window.update_plot)
-        self.threadFlow.DEVICE_STATUS_UPDATE.connect(self.update_device_status)
-        self.threadFlow.CRITICAL_ALARM.connect(self.handle_critical_alarm)
+        # Samples travel from the acquisition loop to the GUI through a ring buffer,
+        # drained in batches by a timer capped at the display rate
+        self.ring_cursor = 0
+        if self.acquisition_process is not None:
+            # The child already maps the shared-memory ring; its events are
+            # collected by drain_samples
+            self.sample_ring = self.acquisition_process.ring
+            self.acquisition_process.start_polling(
+                capacity=self.capacity, scheduler=poll_scheduler, chained_reads=chained_reads,
+                compare_cycles=compare_cycles, timing_report_interval=timing_report_interval,
+                reconnect=reconnect_settings, safety=self.safety_settings())
+            self.safety = self.acquisition_process.supervisor
+        else:
+            self.sample_ring = SampleRing()
+            self.threadFlow = THREADFlow(self, capacity=self.capacity, thread_sleep_time=thread_time,
+                                         chained_reads=chained_reads, compare_cycles=compare_cycles,
+                                         scheduler=poll_scheduler,
+                                         timing_report_interval=timing_report_interval,
+                                         sample_ring=self.sample_ring, commands=self.commands,
+                                         reconnect=reconnect_settings, safety=self.safety_settings())
+            # Over-pressure alarms and purges are handled in the acquisition thread
+            self.safety = self.threadFlow.loop.supervisor
+            #self.threadFlow = THREADFlow(self, capacity=self.capacity)
+            self.threadFlow.start()
+
+            # 5. Connect thread signals
+            self.threadFlow.DEBUG_MEAS.connect(self.update_debug_display)
+            self.threadFlow.DEVICE_STATUS_UPDATE.connect(self.update_device_status)
+            self.threadFlow.PURGE.connect(self.on_purge_event)
+            self.threadFlow.SAFETY_TRACE.connect(self.on_safety_trace)
+            self.threadFlow.TIMING_STATS.connect(self.update_timing_stats)
+            self.threadFlow.LINK_STATUS.connect(self.show_link_status)
+            self.threadFlow.DIAGNOSTICS.connect(self.update_diagnostics)
+
+        # 6. Record every sample to disk from a thread of its own
+        self.start_data_logger()
+
+        # 7. Start the display refresh timer
+        refresh_fps = self.config['UI'].getfloat('display_refresh_fps', 30.0)
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.drain_samples)
+        self.refresh_timer.start(max(1, int(1000.0 / refresh_fps)))
 
         self.win.title_2.setText('Pressure Control')
 
-    def reset_alarm_cmd(self):
-        """Sends the sequence to reset the instrument alarm."""
+        print(f"Startup took {(time.perf_counter() - startup_start) * 1000.0:.0f} ms "
+              f"({'cached' if profile is not None else 'device'} profile)")
+
+    def submit_command(self, steps, priority=CommandQueue.ROUTINE, on_done=None, on_error=None,
+                       description="send command"):
+        """
+        Queues instrument steps (see CommandQueue) and returns immediately.
+        on_done(results) or on_error(exception) is called in the GUI thread
+        once the command has been executed; by default failures are printed.
+        """
+        future = self.commands.submit(steps, priority)
+        future.add_done_callback(
+            lambda f: self.COMMAND_DONE.emit(f, on_done, on_error, description))
+        return future
+
+    def _command_finished(self, future, on_done, on_error, description):
+        """Runs the completion handler of a command in the GUI thread."""
         try:
-            print("Sending Alarm Reset Command...")
-            # Good practice: Send 0 first to clear previous commands
-            self.instrument_mutex.lock()  # <--- Lock
-            try:
-                self.instrument.writeParameter(114, 0)
-                time.sleep(0.1)
-                # Send 2 to reset the alarm
-                self.instrument.writeParameter(114, 2)
-                time.sleep(0.1)
-                # Send 0 again to finish
-                self.instrument.writeParameter(114, 0)
-            finally:
-                self.instrument_mutex.unlock()  # <--- Unlock
-
-            print("Alarm Reset Sent.")
+            results = future.result()
         except Exception as e:
-            print(f"Failed to reset alarm: {e}")
+            if on_error is not None:
+                on_error(e)
+            else:
+                print(f"Failed to {description}: {e}")
+            return
+        if on_done is not None:
+            on_done(results)
+
+    def safety_settings(self):
+        """Keyword arguments of the SafetySupervisor of the acquisition loop, from [Safety]."""
+        return {
+            'target_bar': self.purge_target,
+            'timeout': self.purge_timeout_limit,
+            # Alarms closer together than this are one event
+            'rearm_delay': self.config['Safety'].getfloat('set_point_above_delay', 2.0) + 1.0,
+        }
+
+    def on_purge_event(self, info):
+        """
+        A purge was started or finished by the safety supervisor of the
+        acquisition loop, which has already sent the commands: only the UI
+        follows here.
+        """
+        if info['state'] == 'started':
+            # GUI dispatch stage of the trace, before any UI work
+            self.gui_dispatch_ms[info['trace_id']] = (time.perf_counter() - info['detected_at']) * 1000.0
+            self._show_purge(info['target_bar'])
+            if info['reason'] == 'alarm':
+                self.handle_critical_alarm(info)
+        elif self.is_purging:
+            # A cancelled purge was ended by a mode change, which set the UI already
+            self.is_purging = False
+            if info['reason'] != 'cancelled':
+                self.valve_status = "closed"
+                self._show_shut_mode()
+                self._show_mode_on_plot()
+
+    def on_safety_trace(self, trace):
+        """Completes the trace of a finished purge with the GUI stage and journals it."""
+        gui_dispatch = self.gui_dispatch_ms.pop(trace['id'], None)
+        if gui_dispatch is not None:
+            trace['stages']['gui_dispatch'] = gui_dispatch
+        self.safety_journal.record(trace)
+        _safety_log.info("Safety event traced", reason=trace['reason'], end=trace['end'],
+                         **{f"{stage}_ms": ms for stage, ms in trace['stages'].items() if stage != 'detection'})
+
+    def _show_purge(self, target_bar):
+        """UI of a running purge: setpoint at the target (not sent again), PID mode."""
+        self.is_purging = True
+        self.win.setpoint.blockSignals(True)
+        self.win.setpoint.setValue(target_bar)
+        self.win.setpoint.blockSignals(False)
+        if self.plot_window is not None:
+            self.show_setpoint(target_bar)
+        self.valve_status = "PID"
+        self._show_pid_mode()
+        self._show_mode_on_plot()
 
-    def handle_critical_alarm(self, alarm_code):
+    def handle_critical_alarm(self, info):
         """
-        Handles the CRITICAL_ALARM signal.
-        AUTOMATIC SAFETY SEQUENCE:
-        1. Immediate Visual Update.
-        2. Immediate Reset.
-        3. Trigger Shared Purge Sequence (Smart Logic).
-        4. Notify user.
+        Tells the user about an over-pressure alarm. The purge is already
+        running in the acquisition loop, so the message box blocks nothing.
         """
-        # 1. Cooldown Check (Prevent spamming)
         if self.alarm_popup_active:
             return
-
-        # Simple debounce to prevent multiple triggers in rapid succession
-        delay_setting = self.config['Safety'].getfloat('set_point_above_delay', 2.0)
-        cooldown_period = delay_setting + 1.0
-        if (time.time() - self.last_reset_time) < cooldown_period:
-            return
-
         self.alarm_popup_active = True
-        print(f"CRITICAL ALARM {alarm_code}: Executing AUTO-SAFETY sequence.")
-
-        # ----------------------------------------------------------
-        # STEP 1: IMMEDIATE ACTIONS
-        # ----------------------------------------------------------
+        alarm_code = info['code']
 
-        # A. Visual Update (Set UI to safe value immediately)
-        safe_bar = self.get_safe_setpoint_bar()  # Returns 0.0
-        if self.plot_window is not None:
-            self.plot_window.set_setpoint_value(safe_bar)
-        self.win.setpoint.blockSignals(True)
-        self.win.setpoint.setValue(safe_bar)
-        self.win.setpoint.blockSignals(False)
-
-        # B. Reset Alarm Bit (Clear the current error on device)
-        self.reset_alarm_cmd()
-
-        # C. TRIGGER THE SMART PURGE SEQUENCE
-        # This replaces the old manual timer logic.
-        # It will:
-        #   1. Set is_purging = True (Disable alarms)
-        #   2. Send Setpoint 0.0 bar
-        #   3. Switch to PID
-        #   4. Start the 200ms loop to check for 0 bar OR timeout
-        print("Transferring control to Purge Logic...")
-        self.purge_system()
-
-        # D. Update Cooldown Tracker
-        self.last_reset_time = time.time()
-
-        # ----------------------------------------------------------
-        # STEP 2: NOTIFY USER
-        # ----------------------------------------------------------
         msg = QMessageBox(self)
         msg.setIcon(QMessageBox.Icon.Critical)
         msg.setWindowTitle("SAFETY SHUTDOWN")
@@ -603,8 +984,7 @@ class Bronkhost(QMainWindow):
         )
         msg.addButton("OK", QMessageBox.ButtonRole.AcceptRole)
 
-        # This blocks the User Interface (mouse clicks),
-        # BUT the purge_check_timer continues running in the background.
+        # This blocks the User Interface (mouse clicks), not the purge
         msg.exec()
 
         self.alarm_popup_active = False
@@ -631,7 +1011,7 @@ class Bronkhost(QMainWindow):
         # --- OFFLINE STATE ---
         if normalized_status == 'offline':
             if not self.is_offline:
-                print("Connection to device lost...")
+                _connection_log.warning("Connection to device lost")
                 self.is_offline = True
             self.win.device_status_label.setText("Offline")
 
@@ -671,31 +1051,25 @@ class Bronkhost(QMainWindow):
             # *** FIX: Reset the offline flag immediately ***
             if self.is_offline:
                 self.is_offline = False
-                print("Device back online. Resetting offline status.")
+                _connection_log.info("Device back online")
 
             # Only trigger the refresh once per transition
             if self._last_status != "normal":
-                print("Device status back to Normal — refreshing device info...")
-
                 # Resynchronize Setpoint only if plot_window is initialized
                 if self.plot_window is not None:
                     self._resync_setpoint()
 
-                self.read_device_info()
-                self.configure_response_alarm()
-
-                try:
-                    valve1_output = self.instrument.readParameter(55)
-                    if valve1_output is not None:
-                        current_valve_value = calculate_valve_percentage(valve1_output)
-                        self.update_inlet_valve_display(current_valve_value)
-                    else:
-                        if hasattr(self.win, 'inlet_valve_label'):
-                            self.win.inlet_valve_label.setText("...")
-                except Exception as e:
-                    print(f"Failed to perform valve read on reconnect: {e}")
-                    if hasattr(self.win, 'inlet_valve_label'):
-                        self.win.inlet_valve_label.setText("...")
+                # Just read (or its confirm queued) by the startup
+                if getattr(self, 'device_info_current', False):
+                    self.device_info_current = False
+                else:
+                    _connection_log.info("Device status back to normal, refreshing device info")
+                    self.read_device_info()
+                    self.configure_response_alarm()
+                self.submit_command([('read', 55)],
+                                    on_done=lambda results: self._show_valve_output(results[0]),
+                                    on_error=lambda e: self._show_valve_output(None, e),
+                                    description="perform valve read on reconnect")
 
                 # Re-enable UI
                 self.win.plotButton.setEnabled(True)
@@ -772,14 +1146,6 @@ class Bronkhost(QMainWindow):
         # 3. Reconnect the signal
         self.win.setpoint.editingFinished.connect(self.setPoint)
 
-    def update_log(self, text):
-        """Appends text to the QTextEdit."""
-        cursor = self.win.log_display.textCursor()
-        cursor.movePosition(cursor.End)
-        cursor.insertText(text)
-        self.win.log_display.setTextCursor(cursor)
-        self.win.log_display.ensureCursorVisible()
-
     def actionButton(self):
         self.mode_group.buttonClicked.connect(self.on_mode_changed)
 
@@ -834,7 +1200,7 @@ class Bronkhost(QMainWindow):
 
         # Check if the user clicked "OK" and if the password is correct
         if ok and password == CORRECT_PASSWORD:
-            print("Password correct. Opening admin panel.")
+            _admin_log.info("Admin panel opened")
 
             # We store the window as an attribute of the main class
             # to prevent it from being garbage collected and disappearing.
@@ -860,22 +1226,38 @@ class Bronkhost(QMainWindow):
 
 
         elif ok:  # If they clicked OK but the password was wrong
+            _admin_log.warning("Admin panel: incorrect password")
             QMessageBox.warning(self, "Access Denied", "Incorrect password.")
 
     def read_device_info(self):
         """Reads the capacity and unit from the instrument to calculate absolute values."""
-        try:
-            self.instrument_mutex.lock()  # <--- ADD LOCK
-            try:
-                capacity = self.instrument.readParameter(21)
-                unit = self.instrument.readParameter(129)
-                user_tag_raw = self.instrument.readParameter(115)
-            finally:
-                self.instrument_mutex.unlock()
+        self.submit_command([('read_chained', (21, 129, 115))],
+                            on_done=lambda results: self._device_info_read(*results[0]),
+                            description="read device info")
+
+    def _device_info_read(self, capacity, unit, user_tag_raw):
+        self._apply_device_info(capacity, unit, user_tag_raw)
+        self._store_device_profile(capacity, unit, user_tag_raw)
 
+    def _store_device_profile(self, capacity, unit, user_tag_raw):
+        """Updates the cached profile of the connected device after a complete read."""
+        if self.profile_cache is None or None in (capacity, unit, user_tag_raw):
+            return
+        if isinstance(user_tag_raw, (bytes, bytearray)):
+            user_tag_raw = user_tag_raw.decode('utf-8', errors='ignore')
+        try:
+            if self.profile_cache.store(self.device_serial, float(capacity), str(unit).strip(),
+                                        str(user_tag_raw).strip()):
+                _connection_log.info("Device profile saved", serial=self.device_serial)
+        except OSError as e:
+            _connection_log.warning("Failed to save device profile: %s", e, serial=self.device_serial)
+
+    def _apply_device_info(self, capacity, unit, user_tag_raw):
+        """Applies the capacity (21), unit (129) and user tag (115) to the UI."""
+        try:
             if capacity is not None:
                 self.capacity = float(capacity)
-                print(f"Device Capacity Read: {self.capacity}")
+                _connection_log.info("Device capacity", param=21, value=self.capacity)
 
                 # Default to a high number (or self.capacity) if missing in config
                 safety_limit = self.config['Safety'].getfloat('max_set_pressure', self.capacity)
@@ -884,24 +1266,24 @@ class Bronkhost(QMainWindow):
                 # It is the LOWER of the physical device limit and the config safety limit
                 effective_max = min(self.capacity, safety_limit)
 
-                print(f"Safety Limit: {safety_limit} | Effective UI Max: {effective_max}")
+                _safety_log.info("Setpoint limit", max_set_pressure=safety_limit, effective_max=effective_max)
                 # --- Configure the setpoint box's range and precision ---
                 if hasattr(self.win, 'setpoint'):
                     self.win.setpoint.setMaximum(effective_max)
                     self.win.setpoint.setDecimals(2)
                     self.win.setpoint.setToolTip(f"Config limited to {effective_max} (Physical: {self.capacity})")
             else:
-                print("Warning: Could not read device capacity (param 21).")
+                _connection_log.warning("Could not read device capacity", param=21)
 
             if unit is not None:
                 self.unit = str(unit).strip()  # .strip() removes leading/trailing whitespace
-                print(f"Device Unit Read: '{self.unit}'")
+                _connection_log.info("Device unit", param=129, value=self.unit)
                 # --- Set the dedicated unit label ---
                 if hasattr(self.win, 'unit_label'):
                     self.win.unit_label.setText(self.unit)
                     self.win.unit_label.setStyleSheet("font-size: 16pt; color: white;")
             else:
-                print("Warning: Could not read device unit (param 129).")
+                _connection_log.warning("Could not read device unit", param=129)
 
             if user_tag_raw is not None:
                 if isinstance(user_tag_raw, (bytes, bytearray)):
@@ -928,7 +1310,7 @@ class Bronkhost(QMainWindow):
                 if self.plot_window is not None:
                     self.plot_window.update_title(user_tag)
         except Exception as e:
-            print(f"Error reading device info: {e}")
+            _connection_log.error("Error reading device info: %s", e)
 
     def configure_response_alarm(self):
         """
@@ -938,8 +1320,6 @@ class Bronkhost(QMainWindow):
         if self.is_offline:
             return
         try:
-            print("--- Loading Config of Response Alarm ---")
-
             # 1. Read the Enable Flag
             enable_flag = self.config['Safety'].getboolean('set_point_above_safety_enable', True)
             self.response_alarm_enabled = enable_flag
@@ -947,18 +1327,12 @@ class Bronkhost(QMainWindow):
             # 2. Read Configuration Values
             tol_bar = self.config['Safety'].getfloat('set_point_above_tolerance', 2.0)
             self.safety_tolerance_bar = tol_bar
-            print(f"Pressure tolerance: {tol_bar} bars")
-            delay_sec = self.config['Safety'].getint('set_point_above_delay', 2)
-            print(f"Alarm activation delay: {delay_sec} s")
+            delay_sec = int(self.config['Safety'].getfloat('set_point_above_delay', 2))
             # --- Read Cooldown Delay  ---
             self.lower_setpoint_cooldown = self.config['Safety'].getfloat('set_point_lower_cooldown_delay', 2.0)
-            print(f"Lower Setpoint Cooldown: {self.lower_setpoint_cooldown} s")
             # ---  Purge Settings Here ---
             self.purge_timeout_limit = self.config['Safety'].getfloat('purge_shut_delay_timeout', 5.0)
-            print(f"Purge delay timeout={self.purge_timeout_limit} s")
-            print("------")
             self.purge_target = 0.0  # Hardcoded target
-            print(f"Hardcoded Purge setpoint={self.purge_target} bar")
 
             # 3. Calculate Device Integers (0-32000)
 
@@ -974,24 +1348,21 @@ class Bronkhost(QMainWindow):
             # Safe Setpoint Integer
             safe_setpoint_int = self.bar_to_propar(safe_pressure_bar, self.capacity)
 
-            print(f"Response Alarm Enable = {self.response_alarm_enabled}")
-            print(f"Tolerance: {tol_bar} bar (Int: {dev_above_int})")
-            print(f"Safe State: {safe_pressure_bar} bar (Int: {safe_setpoint_int})")
+            _safety_log.info("Response alarm configured", enabled=self.response_alarm_enabled,
+                             tolerance_bar=tol_bar, tolerance_raw=dev_above_int, delay_s=delay_sec,
+                             cooldown_s=self.lower_setpoint_cooldown, purge_target_bar=self.purge_target,
+                             purge_timeout_s=self.purge_timeout_limit, safe_bar=safe_pressure_bar)
 
             # 4. Send Configuration
-            self.instrument_mutex.lock()  # <--- Lock
-            try:
-                self.instrument.writeParameter(118, 0)  # Disable temporarily
-                self.instrument.writeParameter(116, dev_above_int)
-                self.instrument.writeParameter(117, dev_below_int)
-                self.instrument.writeParameter(121, safe_setpoint_int)
-                self.instrument.writeParameter(120, 1)  # Enable Setpoint Change
-                self.instrument.writeParameter(182, delay_sec)
-            finally:
-
-                self.instrument_mutex.unlock()  # <--- Unlock
+            self.submit_command([('write', 118, 0),  # Disable temporarily
+                                 ('write', 116, dev_above_int),
+                                 ('write', 117, dev_below_int),
+                                 ('write', 121, safe_setpoint_int),
+                                 ('write', 120, 1),  # Enable Setpoint Change
+                                 ('write', 182, delay_sec)],
+                                description="configure alarms")
         except Exception as e:
-            print(f"Error configuring alarms: {e}")
+            _safety_log.error("Error configuring alarms: %s", e)
 
 
     def read_initial_setpoint(self):
@@ -1005,6 +1376,34 @@ class Bronkhost(QMainWindow):
         # Send the initial setpoint to the plot window
         self.plot_window.set_setpoint_value(bar_setpoint)
 
+    def show_setpoint(self, bar_setpoint):
+        """Records a setpoint change in the plot and in the data recording."""
+        self.plot_window.set_setpoint_value(bar_setpoint)
+        if self.data_logger is not None:
+            self.data_logger.set_setpoint(self.bar_to_propar(bar_setpoint, self.capacity))
+
+    def start_data_logger(self):
+        """Starts the DataLogger on the sample ring, as set in the [Recording] section."""
+        if not self.config.has_section('Recording'):
+            return
+        section = self.config['Recording']
+        if not section.getboolean('enabled', True):
+            print("Recording disabled in config.")
+            return
+        directory = section.get('directory', 'recordings')
+        if not os.path.isabs(directory):
+            directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), directory)
+        self.data_logger = DataLogger(
+            self.sample_ring, directory, self.capacity,
+            max_bytes=int(section.getfloat('max_file_mb', 64.0) * 1024 * 1024),
+            rotate_seconds=section.getfloat('rotate_hours', 24.0) * 3600.0,
+            flush_interval=section.getfloat('flush_interval', 1.0),
+            index_interval=section.getint('index_interval', 256),
+            timing_interval=section.getfloat('timing_interval', 60.0))
+        self.data_logger.set_setpoint(self.bar_to_propar(self.last_known_setpoint, self.capacity))
+        self.data_logger.start()
+        self.plot_window.recording_dir = directory
+
     def show_plot_window(self):
         """
         Shows the plot window and positions it to the top-right
@@ -1027,15 +1426,20 @@ class Bronkhost(QMainWindow):
         self.plot_window.raise_()
         self.plot_window.activateWindow()
 
+        # 5. One render of the current view if samples arrived while it was hidden
+        self.plot_window.catch_up()
+
     def on_mode_changed(self, button):
         """Central handler for radio button clicks"""
 
         # --- NEW: If user manually changes mode, cancel any active purge ---
         if self.is_purging:
-            print("Manual Override: Cancelling Purge Sequence.")
+            _safety_log.warning("Manual override: purge cancelled")
             self.is_purging = False
-            if self.purge_check_timer.isActive():
-                self.purge_check_timer.stop()
+            try:
+                self.safety.cancel_purge()
+            except Exception as e:
+                _safety_log.error("Failed to cancel the purge: %s", e)
         # -------------------------------------------------------------------
         if button == self.win.radioPID:
             self.valve_PID()
@@ -1044,82 +1448,23 @@ class Bronkhost(QMainWindow):
 
     def purge_system(self):
         """
-        Purge Sequence:
-        1. Set Setpoint to configured purge pressure.
+        Purge Sequence, run by the safety supervisor of the acquisition loop:
+        1. Set Setpoint to configured purge pressure, alarm disabled.
         2. Switch to PID mode.
-        3. Start a timer that checks if we reached target OR if timeout occurred.
+        3. Close the valve once the target is reached OR the timeout occurred.
+        The UI follows through on_purge_event.
         """
         if self.is_offline or not self.connection_successful:
-            print("Purge skipped: Device is offline.")
+            _safety_log.warning("Purge skipped: device is offline")
             return
-
-        # *** FIX: UNINDENTED THIS BLOCK ***
-        # --- 1. SET FLAG & DISABLE ALARM ---
-        self.is_purging = True
-
-        # Explicitly disable alarm (Param 118 -> 0)
         try:
-            self.instrument_mutex.lock()
-            self.instrument.writeParameter(118, 0)
+            self.safety.start_purge()
         except Exception as e:
-            print(f"Error disabling alarm for purge: {e}")
-        finally:
-            self.instrument_mutex.unlock()
-        # -----------------------------------
-
-        print(f"--- Purge Initiated: Target={self.purge_target} bar, Max Wait={self.purge_timeout_limit}s ---")
-
-        # 2. Update UI and Send Setpoint
-        self.win.setpoint.setValue(self.purge_target)
-        self.setPoint()
-
-        # 3. Activate PID Mode
-        self.valve_PID(force_cooldown=True)
-
-        # 4. Start the Logic Check
-        self.purge_start_time = time.time()
-
-        # Check the condition every 200ms (0.2 seconds)
-        self.purge_check_timer.start(200)
-
-    def _check_purge_condition(self):
-        """
-        Called repeatedly by purge_check_timer.
-        Checks if pressure is close to target or if timeout has passed.
-        """
-        # Define "Close enough" (e.g., +/- 0.5 bar)
-        TOLERANCE = 1.5
-
-        elapsed = time.time() - self.purge_start_time
-        current_diff = abs(self.current_pressure_bar - self.purge_target)
-
-        # 1. SUCCESS CONDITION: Pressure is within tolerance
-        if current_diff <= TOLERANCE:
-            print(f"Purge Target Reached! (Diff: {current_diff:.4f} bar). Closing.")
-            self._finalize_purge()
-
-        # 2. TIMEOUT CONDITION: Time exceeded limit
-        elif elapsed >= self.purge_timeout_limit:
-            print(f"Purge Timeout ({elapsed:.1f}s > {self.purge_timeout_limit}s). Forcing Close.")
-            self._finalize_purge()
-
-        # 3. Otherwise, do nothing and wait for next timer tick
-
-    def _finalize_purge(self):
-        """
-        Stops the timer and closes the valves.
-        """
-        # Stop the checking timer so it doesn't fire again
-        if self.purge_check_timer.isActive():
-            self.purge_check_timer.stop()
-        self.is_purging = False
-        print("Purge Sequence Complete. Closing valves.")
-
-        # Close the valve
-        self.valve_close()
-
-        # Ensure the UI Radio Button reflects the change
-        self.win.radioShut.setChecked(True)
+            _safety_log.error("Failed to start the purge: %s", e)
+            return
+        # Shown now, not on the event, so a mode change made before it arrives
+        # cancels the purge and starts from the purge setpoint
+        self._show_purge(self.purge_target)
 
     def _trigger_alarm_cooldown(self):
         """
@@ -1127,23 +1472,14 @@ class Bronkhost(QMainWindow):
         Used when lowering setpoint OR when switching to PID mode.
         """
         if self.response_alarm_enabled:
-            try:
-                print(f"Safety Wait Period: Disabling alarm for {self.lower_setpoint_cooldown}s...")
+            _safety_log.info("Alarm disabled for the cooldown", param=118, value=0, cooldown_s=self.lower_setpoint_cooldown)
 
-                # 1. Disable Alarm (Mode 0) immediately
+            # 1. Disable Alarm (Mode 0) immediately
+            self.submit_command([('write', 118, 0)], description="trigger alarm cooldown")
 
-                self.instrument_mutex.lock()  # <--- ADD LOCK
-                try:
-                    self.instrument.writeParameter(118, 0)
-                finally:
-                    self.instrument_mutex.unlock()
-
-                # 2. Start/Restart the timer (converts seconds to ms)
-                # When this timer finishes, it calls _reenable_alarm automatically
-                self.rearm_timer.start(int(self.lower_setpoint_cooldown * 1000))
-
-            except Exception as e:
-                print(f"Error triggering alarm cooldown: {e}")
+            # 2. Start/Restart the timer (converts seconds to ms)
+            # When this timer finishes, it calls _reenable_alarm automatically
+            self.rearm_timer.start(int(self.lower_setpoint_cooldown * 1000))
 
     def _handle_setpoint_safety_logic(self, new_bar_setpoint):
         """
@@ -1159,108 +1495,89 @@ class Bronkhost(QMainWindow):
             alarm_threshold = new_bar_setpoint + self.safety_tolerance_bar
 
             if self.current_pressure_bar > alarm_threshold:
-                print(f"PID Safety: Pressure ({self.current_pressure_bar:.2f}) > "
-                      f"Limit ({alarm_threshold:.2f}). Triggering cooldown.")
+                _safety_log.info("Pressure above the new alarm limit, triggering cooldown",
+                                 pressure_bar=self.current_pressure_bar, limit_bar=alarm_threshold)
                 self._trigger_alarm_cooldown()
 
-    def valve_PID(self, force_cooldown=False):
-        print('Valve PID controlled')
+    def valve_PID(self):
+        _safety_log.info("Valve PID controlled", param=12, value=0)
 
         # 1. Update UI Visuals
-        self.flicker_timer.stop()
-        self.win.label_valve_status.setStyleSheet("color: white;")
-        self.win.label_valve_status.setText('PID')
-        self.win.radioPID.setChecked(True)
-
-        if hasattr(self.win, 'inlet_valve_label'):
-            self.win.inlet_valve_label.setStyleSheet("color: white;")
-            self.win.inlet_valve_label.setText("... %")
-        if hasattr(self.win, 'label_In_Out'):
-            self.win.label_In_Out.setStyleSheet("color: white;")
+        self._show_pid_mode()
 
         # 2. Send Command to Device
-        self.instrument_mutex.lock()
-        try:
-            self.instrument.writeParameter(12, 0)  # 'PID Control' command
-            self.valve_status = "PID"
-        finally:
-            self.instrument_mutex.unlock()
+        self.submit_command([('write', 12, 0)], description="switch to PID control")  # 'PID Control' command
+        self.valve_status = "PID"
+        self._show_mode_on_plot()
 
         # 3. ALARM LOGIC
+        # (a purge runs in PID too, but its supervisor keeps the alarm off)
         if self.response_alarm_enabled:
 
             # Calculate the safe limit based on UI setpoint + Tolerance
             current_setpoint = self.win.setpoint.value()
             alarm_threshold = current_setpoint + self.safety_tolerance_bar
 
-            # Case A: Purge Requested (Always force cooldown)
-            if force_cooldown:
-                print("Entering PID (Forced): Triggering Cooldown.")
-                self._trigger_alarm_cooldown()
-
-            # Case B: Smart Safety Check
+            # Case A: Smart Safety Check
             # Only disable alarm if pressure is actually high enough to trigger it
-            elif self.current_pressure_bar > alarm_threshold:
-                print(f"Entering PID: Pressure ({self.current_pressure_bar:.2f}) > "
-                      f"Limit ({alarm_threshold:.2f}). Triggering Cooldown.")
+            if self.current_pressure_bar > alarm_threshold:
+                _safety_log.info("Entering PID above the alarm limit, triggering cooldown",
+                                 pressure_bar=self.current_pressure_bar, limit_bar=alarm_threshold)
                 self._trigger_alarm_cooldown()
 
-            # Case C: Safe Condition (Pressure is within tolerance)
-            else:
-                try:
-                    self.instrument_mutex.lock()
-                    try:
-                        self.instrument.writeParameter(118, 2)
-                    finally:
-                        self.instrument_mutex.unlock()
-                    print("Safety alarm: ENABLED (Mode 2) - Immediate")
-                except Exception as e:
-                    print(f"Failed to enable alarm: {e}")
-
-        # 4. Attempt to read the new valve value
-        time.sleep(0.1)
-        try:
-            self.instrument_mutex.lock()
-            try:
-                valve1_output = self.instrument.readParameter(55)
-            finally:
-                self.instrument_mutex.unlock()
-
-            if valve1_output is not None:
-                current_valve_value = calculate_valve_percentage(valve1_output)
-                self.update_inlet_valve_display(current_valve_value)
+            # Case B: Safe Condition (Pressure is within tolerance)
             else:
-                if hasattr(self.win, 'inlet_valve_label'):
-                    self.win.inlet_valve_label.setText("...")
-        except Exception as e:
-            print(f"Failed to perform initial valve read: {e}")
-            if hasattr(self.win, 'inlet_valve_label'):
-                self.win.inlet_valve_label.setText("...")
+                self.submit_command([('write', 118, 2)],
+                                    on_done=lambda results: _safety_log.info("Safety alarm enabled", param=118, value=2),
+                                    description="enable alarm")
+
+        # 4. Attempt to read the new valve value once the valve has moved
+        self.submit_command([('wait', 0.1), ('read', 55)],
+                            on_done=lambda results: self._show_valve_output(results[1]),
+                            on_error=lambda e: self._show_valve_output(None, e),
+                            description="perform initial valve read")
+
+    def _show_valve_output(self, valve1_output, error=None):
+        """Shows a one-off read of the valve output (param 55)."""
+        if error is not None:
+            print(f"Failed to perform valve read: {error}")
+        if valve1_output is not None:
+            current_valve_value = calculate_valve_percentage(valve1_output)
+            self.update_inlet_valve_display(current_valve_value)
+        elif hasattr(self.win, 'inlet_valve_label'):
+            self.win.inlet_valve_label.setText("...")
 
     def valve_close(self):
-        print('Valve closed')
+        _safety_log.info("Valve closed", param=12, value=3)
+        self._show_shut_mode()
+        # Safety command: goes ahead of any routine command still queued
+        # 'Valve Closed' command (always sent), then disable the alarm
+        self.submit_command([('write', 12, 3, True), ('write', 118, 0)], CommandQueue.SAFETY,
+                            on_done=lambda results: _safety_log.info("Safety alarm disabled", param=118, value=0),
+                            description="close valve")
+        self.valve_status = "closed"
+        self._show_mode_on_plot()
+
+    def _show_pid_mode(self):
+        """Valve labels and radio button in PID control."""
+        self.flicker_timer.stop()
+        self.win.label_valve_status.setStyleSheet("color: white;")
+        self.win.label_valve_status.setText('PID')
+        self.win.radioPID.setChecked(True)
+
+        if hasattr(self.win, 'inlet_valve_label'):
+            self.win.inlet_valve_label.setStyleSheet("color: white;")
+            self.win.inlet_valve_label.setText("... %")
+        if hasattr(self.win, 'label_In_Out'):
+            self.win.label_In_Out.setStyleSheet("color: white;")
+
+    def _show_shut_mode(self):
+        """Valve labels and radio button with the valve closed."""
         self.win.label_valve_status.setText('Shut')
         #self.win.closeButton.setStyleSheet("background-color: red")
         #self.win.openButton.setStyleSheet("background-color: gray")
         self.flicker_timer.start(500)  # 500 ms interval
-        self.instrument_mutex.lock()  # <--- Lock
-        try:
-            self.instrument.writeParameter(12, 3)  # 'Valve Closed' command
-        finally:
-            self.instrument_mutex.unlock()
-        self.valve_status = "closed"
-
-        # --- Disable Alarm ---
-        try:
-            self.instrument_mutex.lock()  # <--- Lock
-            try:
-                self.instrument.writeParameter(118, 0)
-            finally:
-                self.instrument_mutex.unlock()
-            print("Safety Alarm: DISABLED (Mode 0)")
-        except Exception as e:
-            print(f"Failed to disable alarm: {e}")
-        # --------------------------
+        self.win.radioShut.setChecked(True)
 
         if hasattr(self.win, 'inlet_valve_label'):
             self.win.inlet_valve_label.setStyleSheet("color: gray;")
@@ -1268,31 +1585,37 @@ class Bronkhost(QMainWindow):
         if hasattr(self.win, 'label_In_Out'):
             self.win.label_In_Out.setStyleSheet("color: gray;")
 
+    def _show_mode_on_plot(self):
+        """Records the current control mode in the plot (purge runs in PID mode but is shown apart)."""
+        if self.plot_window is None:
+            return
+        if self.is_purging:
+            self.plot_window.set_mode('Purge')
+        else:
+            self.plot_window.set_mode('PID' if self.valve_status == "PID" else 'Shut')
+
     def setPoint(self):
         # *** Guard against running while offline ***
         if self.is_offline or not self.connection_successful:
-            print("Set point skipped: Device is offline.")
+            _safety_log.warning("Setpoint skipped: device is offline")
             return
 
         bar_setpoint = self.win.setpoint.value()
 
         self._handle_setpoint_safety_logic(bar_setpoint)
 
-        print(f"Bar setpoint set to: {bar_setpoint} {self.unit}")
-        self.plot_window.set_setpoint_value(bar_setpoint)
+        _safety_log.info("Setpoint", param=9, value=bar_setpoint, unit=self.unit)
+        self.show_setpoint(bar_setpoint)
 
         if self.capacity > 0:
             propar_value = self.bar_to_propar(bar_setpoint, self.capacity)
-            self.instrument_mutex.lock()
-            try:
-                self.instrument.writeParameter(9, propar_value)
-                # --- Re-engage control mode every time setpoint changes ---
-                if self.valve_status == "PID":
-                    self.instrument.writeParameter(12, 0)  # 'PID Control' command
-            finally:
-                self.instrument_mutex.unlock()
+            steps = [('write', 9, propar_value)]
+            # --- Re-engage control mode every time setpoint changes ---
+            if self.valve_status == "PID":
+                steps.append(('write', 12, 0))  # 'PID Control' command
+            self.submit_command(steps, description="send setpoint")
         else:
-            print("Warning: Cannot set point, device capacity is unknown or zero.")
+            _safety_log.warning("Cannot send the setpoint, device capacity is unknown or zero", param=9)
 
     def _reenable_alarm(self):
         """
@@ -1312,8 +1635,8 @@ class Bronkhost(QMainWindow):
 
             # If we are still above that limit, DO NOT enable alarm. Wait again.
             if self.current_pressure_bar > current_limit:
-                print(f"Cooldown Check: Pressure ({self.current_pressure_bar:.2f}) > "
-                      f"Limit ({current_limit:.2f}). Extending wait...")
+                _safety_log.info("Cooldown extended, pressure above the alarm limit",
+                                 pressure_bar=self.current_pressure_bar, limit_bar=current_limit)
 
                 # Restart the timer for another cycle (e.g. another 5 seconds)
                 # This gives the physics time to catch up
@@ -1321,15 +1644,8 @@ class Bronkhost(QMainWindow):
                 return
             # -------------------
 
-            try:
-                print("Cooldown finished & Pressure Safe: Re-enabling Safety Alarm (Mode 2)")
-                self.instrument_mutex.lock()
-                try:
-                    self.instrument.writeParameter(118, 2)
-                finally:
-                    self.instrument_mutex.unlock()
-            except Exception as e:
-                print(f"Failed to re-enable alarm: {e}")
+            _safety_log.info("Cooldown finished, re-enabling the safety alarm", param=118, value=2)
+            self.submit_command([('write', 118, 2)], description="re-enable alarm")
 
     def update_inlet_valve_display(self, raw_value):
         if self.valve_status != "closed":
@@ -1342,6 +1658,94 @@ class Bronkhost(QMainWindow):
         if hasattr(self.win, 'debug_param_output'):
             self.win.debug_param_output.setText(f"{int(raw_value)} %")
 
+    def update_diagnostics(self, snapshot):
+        """Keeps the latest link statistics for the diagnostics tab of the admin panel."""
+        self.link_diagnostics = snapshot
+
+    def show_link_status(self, message):
+        """Shows a link recovery stage in the status bar (the loop has already logged it)."""
+        self.statusBar().showMessage(message)
+        # Keep it readable for a while before the timing statistics come back
+        self.link_status_until = time.monotonic() + 5.0
+
+    def update_timing_stats(self, stats):
+        """Shows the rolling sampling clock statistics in the status bar and records them."""
+        if self.data_logger is not None:
+            self.data_logger.set_timing(stats)
+        if time.monotonic() < getattr(self, 'link_status_until', 0.0):
+            return
+        self.statusBar().showMessage(
+            f"Jitter p50/p99: {stats['jitter_p50_ms']:.1f}/{stats['jitter_p99_ms']:.1f} ms | "
+            f"Read p50/p99: {stats['latency_p50_ms']:.1f}/{stats['latency_p99_ms']:.1f} ms | "
+            f"Missed: {stats['missed']}")
+
+    def handle_acquisition_event(self, kind, value):
+        """Dispatches an event received from the acquisition process."""
+        if kind == 'offline':
+            self.update_device_status('offline')
+        elif kind == 'purge':
+            # Run outside the timer slot: the alarm handler opens a modal box
+            QTimer.singleShot(0, lambda: self.on_purge_event(value))
+        elif kind == 'trace':
+            # Queued the same way, so it comes after the 'started' event
+            QTimer.singleShot(0, lambda: self.on_safety_trace(value))
+        elif kind == 'timing':
+            self.update_timing_stats(value)
+        elif kind == 'link':
+            self.show_link_status(value)
+        elif kind == 'diagnostics':
+            self.update_diagnostics(value)
+        elif kind == 'log':
+            print(value, end='')
+        elif kind == 'command':
+            self.acquisition_process.commands.resolve(*value)
+        elif kind == 'supervisor':
+            self.on_supervisor_reply(*value)
+
+    def on_supervisor_reply(self, method, ok, error):
+        """Outcome of a purge start or cancel sent to the acquisition process."""
+        if ok:
+            return
+        if method == 'start_purge':
+            _safety_log.error("Failed to start the purge: %s", error)
+            # purge_system showed it before the child answered
+            self.is_purging = False
+        else:
+            _safety_log.error("Failed to cancel the purge: %s", error)
+
+    def drain_samples(self):
+        """
+        Called by refresh_timer. Takes every sample queued by the thread since
+        the last frame and updates the displays once for the whole batch.
+        """
+        if self.acquisition_process is not None:
+            for kind, value in self.acquisition_process.get_events():
+                self.handle_acquisition_event(kind, value)
+
+        records, self.ring_cursor, lost = self.sample_ring.read_since(self.ring_cursor)
+        if lost:
+            print(f"Display fell behind: {lost} samples dropped from the plot.")
+        if len(records) == 0:
+            return
+
+        # Labels only need the most recent values
+        last = records[-1]
+        self.aff(last['time'], last['pressure'])
+
+        valve_reads = records['valve'][records['valve'] >= 0]
+        if len(valve_reads):
+            self.update_inlet_valve_display(calculate_valve_percentage(int(valve_reads[-1])))
+
+        status_reads = records['status'][records['status'] >= 0]
+        if len(status_reads):
+            status = status_from_code(int(status_reads[-1]))
+            if status.lower() != getattr(self, '_last_status', None):
+                self.update_device_status(status)
+
+        # The plot gets the whole batch
+        if self.plot_window is not None:
+            self.plot_window.update_plot(records['time'], records['pressure'])
+
     def aff(self, timestamp, M):
         # This function updates the display with the measurement from the thread
 
@@ -1366,42 +1770,55 @@ class Bronkhost(QMainWindow):
 
         if hasattr(self, 'plot_window'):
             self.plot_window.close()
+            if self.plot_window.export_worker is not None and self.plot_window.export_worker.isRunning():
+                self.plot_window.export_worker.cancel()
+                self.plot_window.export_worker.wait()
         if hasattr(self, 'help_w') and self.help_w.isVisible():
             self.help_w.close()
         if hasattr(self, 'admin_w') and self.admin_w.isVisible():
             self.admin_w.close()
 
+        if self.connection_successful:
+            # Queued ahead of everything else; the acquisition loop sends the
+            # commands still queued before it stops
+            _safety_log.info("Closing valve on exit", param=12, value=3)
+            self.submit_command([('write', 12, 3, True)], CommandQueue.SAFETY, description="close valve")
+            self.win.label_valve_status.setText('Shut')
+
         if hasattr(self, 'threadFlow'):
             self.threadFlow.stopThread()
             # Wait for the thread to actually finish (blocking the close event slightly)
             self.threadFlow.wait()
+        elif self.acquisition_process is not None:
+            try:
+                self.acquisition_process.stop_polling()
+            except Exception as e:
+                _connection_log.error("Failed to stop acquisition process: %s", e)
+
+        # Last samples to disk, before the process ring is unmapped
+        if self.data_logger is not None:
+            self.data_logger.stop()
 
         if self.connection_successful:
             if hasattr(self, 'instrument'):
-                self.instrument_mutex.lock()
-                try:
-                    self.instrument.writeParameter(12, 3)
-                    print("Closing valve...")
-                    self.win.label_valve_status.setText('Shut')
-                    time.sleep(0.5)
+                if self.acquisition_process is not None:
+                    self.acquisition_process.close()
+                else:
                     self.instrument.master.propar.stop()
-                    print("Connection closed.")
-                finally:
-                    self.instrument_mutex.unlock()
+                _connection_log.info("Connection closed")
+
+        # Last lines to the log file; later prints go to the console
+        self.log_stream.close()
+        sys.stdout = sys.__stdout__
         event.accept()
 
     def propar_to_bar(self, propar_value, capacity):  # Added 'capacity' argument
         """Converts a raw Propar value (0-32000) to the absolute unit (bar)."""
-        if propar_value is None or capacity == 0:
-            return 0.0
-        return (float(propar_value) / 32000.0) * capacity
+        return propar_to_bar(propar_value, capacity)
 
     def bar_to_propar(self, bar_value, capacity):  # Added 'capacity' argument
         """Converts an absolute unit (bar) to a raw Propar value (0-32000)."""
-        if bar_value is None or capacity == 0:
-            return 0
-        propar_float = (bar_value / capacity) * 32000.0
-        return int(max(0.0, min(32000.0, propar_float)))
+        return bar_to_propar(bar_value, capacity)
 
     def show_help_window(self):
         """
@@ -1437,99 +1854,59 @@ class Bronkhost(QMainWindow):
 
 
 class THREADFlow(QtCore.QThread):
-    MEAS = QtCore.pyqtSignal(float, float)
-    VALVE1_MEAS = QtCore.pyqtSignal(float)
+    """
+    Runs the AcquisitionLoop in a QThread of the GUI process and turns its
+    events into Qt signals.
+    """
     DEBUG_MEAS = QtCore.pyqtSignal(float)
     DEVICE_STATUS_UPDATE = QtCore.pyqtSignal(str)
-    CRITICAL_ALARM = QtCore.pyqtSignal(int)
-
-    def __init__(self, parent, capacity, thread_sleep_time):
+    PURGE = QtCore.pyqtSignal(dict)
+    SAFETY_TRACE = QtCore.pyqtSignal(dict)
+    TIMING_STATS = QtCore.pyqtSignal(dict)
+    LINK_STATUS = QtCore.pyqtSignal(str)
+    DIAGNOSTICS = QtCore.pyqtSignal(dict)
+
+    def __init__(self, parent, capacity, thread_sleep_time, chained_reads=True, compare_cycles=0,
+                 scheduler=None, timing_report_interval=60.0, sample_ring=None, commands=None,
+                 reconnect=None, safety=None):
         super(THREADFlow, self).__init__(parent)
         self.parent = parent
-        self.instrument = self.parent.instrument
-        self.propar_to_bar_func = self.parent.propar_to_bar
-        self.capacity = capacity
-        self.stop = False
         self.thread_sleep_time = float(thread_sleep_time)
 
-    def run(self):
-        last_alarm_status = 0  # Track changes
-        while not self.stop:
-            # 1. Mark the start time of this cycle
-            loop_start_time = time.time()
-
-            try:
-                # ACQUIRE LOCK BEFORE READING
-                self.parent.instrument_mutex.lock()
-
-                try:
-                    # --- Perform all reads ---
-                    # This is the "Work" that causes latency (e.g., takes 0.05s)
-                    alarm_status = self.instrument.readParameter(28)
-                    raw_measure = self.instrument.readParameter(8)
-                    valve1_output = self.instrument.readParameter(55)
-                finally:
-                    self.parent.instrument_mutex.unlock()
-                # --- Offline Logic ---
-                # If critical read fails (None), device is disconnected.
-                if raw_measure is None:
-                    self.DEVICE_STATUS_UPDATE.emit('offline')
-                    # If offline, don't do drift calculation, just wait 1s and retry
-                    time.sleep(1.0)
-                    continue
-
-                # --- Status Logic ---
-                if alarm_status is not None:
-                    # DEBUG: Print only if status changes or is critical
-                    if alarm_status != last_alarm_status:
-                        print(f" [ALARM CHANGE] Status Code: {alarm_status} (Binary: {bin(alarm_status)})")
-                        last_alarm_status = alarm_status
-
-                    if alarm_status & 1:
-                        self.DEVICE_STATUS_UPDATE.emit('Error')
-                    elif alarm_status & 2:
-                        self.DEVICE_STATUS_UPDATE.emit('Warning')
-                    else:
-                        self.DEVICE_STATUS_UPDATE.emit('Normal')
-
-                    if (alarm_status & 32) or (alarm_status & 8):
-                        self.CRITICAL_ALARM.emit(alarm_status)
-                # --- Emission Logic (Pressure) ---
-                # We use the current time as the timestamp for the graph
-                timestamp = time.time()
-                bar_measure = self.propar_to_bar_func(raw_measure, self.capacity)
-                self.MEAS.emit(timestamp, bar_measure)
-
-                # --- Emission Logic (Valve) ---
-                if valve1_output is not None:
-                    # Ensure the helper function is accessible here
-                    current_valve_value = calculate_valve_percentage(valve1_output)
-                    self.VALVE1_MEAS.emit(current_valve_value)
-
-                # --- SMART SLEEP (Drift Correction) ---
-                # 1. Calculate how long the read/emit process took
-                work_duration = time.time() - loop_start_time
-                # 4. PRINT IT (Temporary Debug)
-                #print(f"Hardware IO took: {work_duration:.4f} seconds")
-                # 2. Calculate remaining time to match the configured thread_sleep_time
-                sleep_time = self.thread_sleep_time - work_duration
-
-                # 3. Only sleep if we have time left.
-                # If work_duration > thread_sleep_time, the hardware is slower than the config,
-                # so we run immediately without sleeping.
-                if sleep_time > 0:
-                    time.sleep(sleep_time)
-
-            except Exception as e:
-                self.DEVICE_STATUS_UPDATE.emit('offline')
-                print(f"Error reading from instrument: {e}")
-                # On exception, wait a safe fixed amount before retrying
-                time.sleep(2.0)
+        # Without a scheduler every parameter is read on every tick
+        if scheduler is None:
+            scheduler = PollScheduler(self.thread_sleep_time,
+                                      {dde_nr: self.thread_sleep_time for dde_nr in AcquisitionLoop.POLL_PARAMETERS})
+
+        # Samples are published to the ring instead of one signal per value
+        self.sample_ring = sample_ring if sample_ring is not None else SampleRing()
+
+        self.loop = AcquisitionLoop(self.parent.instrument, capacity, scheduler, self.sample_ring,
+                                    chained_reads=chained_reads, compare_cycles=compare_cycles,
+                                    timing_report_interval=timing_report_interval,
+                                    mutex=self.parent.instrument_mutex, on_event=self._forward_event,
+                                    commands=commands, reconnect=reconnect, safety=safety)
+
+    def _forward_event(self, kind, value):
+        """Emits the loop events as signals (queued to the GUI thread)."""
+        if kind == 'offline':
+            self.DEVICE_STATUS_UPDATE.emit('offline')
+        elif kind == 'purge':
+            self.PURGE.emit(value)
+        elif kind == 'trace':
+            self.SAFETY_TRACE.emit(value)
+        elif kind == 'timing':
+            self.TIMING_STATS.emit(value)
+        elif kind == 'link':
+            self.LINK_STATUS.emit(value)
+        elif kind == 'diagnostics':
+            self.DIAGNOSTICS.emit(value)
 
-        print('Measurement thread stopped.')
+    def run(self):
+        self.loop.run()
 
     def stopThread(self):
-        self.stop = True
+        self.loop.stop = True
 
 
 if __name__ == '__main__':
@@ -1537,11 +1914,29 @@ if __name__ == '__main__':
     appli.setStyleSheet(qdarkstyle.load_stylesheet())
     #appli.setStyleSheet(qdarkstyle.load_stylesheet_pyqt5())
 
+    # --simulate: run against a simulated P-800 instead of a serial port
+    # --port: connect to this port without the selection dialog (e.g. a propar_emulator.py pty)
+    arg_parser = argparse.ArgumentParser(description="LOA Pressure Control")
+    arg_parser.add_argument('--simulate', action='store_true',
+                            help="use a simulated instrument ([Simulation] in config.ini)")
+    arg_parser.add_argument('--port', help="serial port to connect to, instead of asking")
+    args, _ = arg_parser.parse_known_args()
+
     main_window = None
     APP_CONFIG = load_configuration()
     default_port = APP_CONFIG['Connection'].get('default_com_port', '')
 
-    while True:  # Start the selection loop
+    if args.simulate:
+        if not APP_CONFIG.has_section('Simulation'):
+            APP_CONFIG.add_section('Simulation')
+        print("Starting with a simulated instrument...")
+        main_window = Bronkhost(com='SIM', config=APP_CONFIG,
+                                instrument_factory=factory_from_config(APP_CONFIG['Simulation']))
+    elif args.port:
+        print(f"Attempting to connect to {args.port}...")
+        main_window = Bronkhost(com=args.port, config=APP_CONFIG)
+
+    while not (args.simulate or args.port):  # Start the selection loop
         #available_ports = [port.device for port in serial.tools.list_ports.comports()]
         ports_objects = serial.tools.list_ports.comports()
         available_ports = [port.device for port in ports_objects]
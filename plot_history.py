@@ -0,0 +1,467 @@
+# -*- coding: utf-8 -*-
+"""
+Plot history storage. Samples live in preallocated float64 numpy arrays, one
+per channel, so the plot can hand pyqtgraph views of them instead of
+converting Python containers to lists on every update.
+"""
+import math
+
+import numpy as np
+
+
+def parse_tiers(text):
+    """
+    config.ini tier list -> ((period_s, points), ...), finest first.
+    Format: "period:points, period:points", e.g. "1:86400, 60:43200".
+    """
+    tiers = []
+    for item in text.split(','):
+        if item.strip():
+            period, points = item.split(':')
+            tiers.append((float(period), int(points)))
+    return tuple(sorted(tiers))
+
+
+def reduce_blocks(times, lows, highs, block):
+    """Merges every `block` consecutive entries: first time, min of lows, max of highs."""
+    starts = np.arange(0, len(times), block)
+    return times[starts], np.minimum.reduceat(lows, starts), np.maximum.reduceat(highs, starts)
+
+
+def min_max_pairs(times, lows, highs):
+    """Two points per entry, its min then its max at the entry time (a vertical stroke)."""
+    x = np.repeat(times, 2)
+    y = np.empty(len(x))
+    y[0::2] = lows
+    y[1::2] = highs
+    return x, y
+
+
+class HistoryBuffer:
+    """
+    Fixed-capacity history of aligned channels (e.g. time and pressure).
+
+    The arrays are a little longer than the capacity. Samples are appended
+    after the newest one; when the end of the arrays is reached, the samples
+    still inside the capacity are moved back to the start in one block copy.
+    The history is therefore always contiguous and in time order, view() never
+    copies, and the copies cost O(1) per sample on average (one block of
+    `capacity` values every `slack` samples).
+    """
+
+    def __init__(self, capacity, channels=('time', 'pressure'), slack=0.25):
+        """
+        capacity: number of samples kept (the oldest are dropped beyond it).
+        channels: names of the aligned channels.
+        slack: spare room as a fraction of the capacity (more room, fewer block copies).
+        """
+        self.capacity = max(1, int(capacity))
+        self.slack = max(1, int(self.capacity * slack))
+        self.arrays = {name: np.empty(self.capacity + self.slack, dtype=np.float64) for name in channels}
+        self.start = 0   # Index of the oldest sample
+        self.end = 0     # Index after the newest sample
+
+    def __len__(self):
+        return self.end - self.start
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def extend(self, **columns):
+        """Appends a batch of samples; every channel gets an equally long sequence."""
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) != 1 or set(columns) != set(self.arrays):
+            raise ValueError("extend() needs one sequence of the same length per channel")
+        n = lengths.pop()
+        if n == 0:
+            return
+        if n >= self.capacity:
+            # The batch alone fills the history
+            for name, values in columns.items():
+                self.arrays[name][:self.capacity] = np.asarray(values, dtype=np.float64)[-self.capacity:]
+            self.start, self.end = 0, self.capacity
+            return
+
+        if self.end + n > len(self.arrays[next(iter(self.arrays))]):
+            # Out of room: move the samples that stay to the front
+            keep = min(len(self), self.capacity - n)
+            for array in self.arrays.values():
+                array[:keep] = array[self.end - keep:self.end]
+            self.start, self.end = 0, keep
+
+        for name, values in columns.items():
+            self.arrays[name][self.end:self.end + n] = values
+        self.end += n
+        self.start = max(self.start, self.end - self.capacity)
+
+    def view(self, name, first=0):
+        """The channel from sample `first` (0 = oldest) to the newest, as a view."""
+        return self.arrays[name][self.start + first:self.end]
+
+    def index_of(self, time_value, channel='time'):
+        """Index of the first sample at or after `time_value` (the channel must be sorted)."""
+        return int(np.searchsorted(self.view(channel), time_value, side='left'))
+
+    def first(self, name):
+        return self.arrays[name][self.start]
+
+    def last(self, name):
+        return self.arrays[name][self.end - 1]
+
+    def clear(self):
+        self.start = self.end = 0
+
+
+class LodHistory:
+    """
+    History with precomputed min/max levels of detail, for drawing long time
+    ranges with about two points per pixel column.
+
+    Level 1 holds one block per `factor` raw samples, level 2 one per factor**2,
+    and so on; each block keeps the time of its first sample and, per channel,
+    the min and max over the block, so spikes survive any zoom level. Levels
+    are filled incrementally as samples arrive (blocks are aligned on the
+    sample count), each in its own HistoryBuffer covering the same time span
+    as the raw samples.
+    """
+
+    def __init__(self, capacity, channels=('pressure',), factor=8, min_level_size=64):
+        """
+        capacity: raw samples kept.
+        channels: names of the value channels (a 'time' channel is added).
+        factor: raw samples per block of level 1, and level-to-level ratio.
+        min_level_size: no level smaller than this many blocks is built.
+        """
+        self.channels = tuple(channels)
+        self.factor = int(factor)
+        self.raw = HistoryBuffer(capacity, channels=('time',) + self.channels)
+        self.levels = []        # HistoryBuffer per level: time, <channel>_min, <channel>_max
+        self.pending = []       # Per level: samples of the block being filled, from the level below
+        self.covered_until = [] # Per level: time of the last sample inside a completed block
+        block = self.factor
+        while capacity // block >= min_level_size:
+            names = ['time'] + [f"{name}_{kind}" for name in self.channels for kind in ('min', 'max')]
+            self.levels.append(HistoryBuffer(capacity // block + 2, channels=names))
+            self.pending.append(None)
+            self.covered_until.append(None)
+            block *= self.factor
+
+    def __len__(self):
+        return len(self.raw)
+
+    @property
+    def capacity(self):
+        return self.raw.capacity
+
+    @property
+    def nbytes(self):
+        return self.raw.nbytes + sum(level.nbytes for level in self.levels)
+
+    def first(self, name):
+        return self.raw.first(name)
+
+    def last(self, name):
+        return self.raw.last(name)
+
+    def view(self, name, first=0):
+        return self.raw.view(name, first)
+
+    def index_of(self, time_value):
+        return self.raw.index_of(time_value)
+
+    def extend(self, time, **columns):
+        time = np.asarray(time, dtype=np.float64)
+        columns = {name: np.asarray(values, dtype=np.float64) for name, values in columns.items()}
+        self.raw.extend(time=time, **columns)
+        # Level 0 feeds level 1 with min = max = the raw value
+        block = {'time': time, 'last': time}
+        for name in self.channels:
+            block[f"{name}_min"] = columns[name]
+            block[f"{name}_max"] = columns[name]
+        for index in range(len(self.levels)):
+            block = self._aggregate(index, block)
+            if block is None:
+                break
+
+    def _aggregate(self, index, incoming):
+        """Adds blocks of the level below to level `index`; returns the blocks it completed."""
+        pending = self.pending[index]
+        if pending is not None:
+            incoming = {name: np.concatenate((pending[name], values)) for name, values in incoming.items()}
+        count = len(incoming['time']) // self.factor * self.factor
+        self.pending[index] = {name: values[count:] for name, values in incoming.items()}
+        if count == 0:
+            return None
+
+        shape = (count // self.factor, self.factor)
+        completed = {'time': incoming['time'][:count:self.factor],
+                     'last': incoming['last'][self.factor - 1:count:self.factor]}
+        for name in self.channels:
+            completed[f"{name}_min"] = incoming[f"{name}_min"][:count].reshape(shape).min(axis=1)
+            completed[f"{name}_max"] = incoming[f"{name}_max"][:count].reshape(shape).max(axis=1)
+        self.levels[index].extend(**{name: values for name, values in completed.items() if name != 'last'})
+        self.covered_until[index] = completed['last'][-1]
+        return completed
+
+    def envelope(self, channel, x_min, x_max, max_columns):
+        """
+        (x, y) arrays drawing `channel` between x_min and x_max with at most
+        about 2 * max_columns points. Raw views are returned when the raw
+        samples already fit; otherwise min/max pairs of the coarsest level needed,
+        plus the raw samples not yet aggregated, decimated the same way.
+        """
+        first = max(0, self.raw.index_of(x_min) - 1)
+        last = self.raw.index_of(x_max) if x_max < self.raw.last('time') else len(self.raw)
+        visible = last - first
+        if visible <= 2 * max_columns or not self.levels:
+            times = self.raw.view('time', first)
+            return times, self.raw.view(channel, first)
+
+        # Smallest level with at most max_columns blocks in view
+        block = self.factor
+        index = 0
+        while index < len(self.levels) - 1 and visible // block > max_columns:
+            index += 1
+            block *= self.factor
+        level = self.levels[index]
+        if self.covered_until[index] is None:
+            return self.raw.view('time', first), self.raw.view(channel, first)
+
+        start = max(0, level.index_of(x_min) - 1)
+        times = level.view('time', start)
+        lows = level.view(f"{channel}_min", start)
+        highs = level.view(f"{channel}_max", start)
+
+        # Raw samples after the last completed block, reduced with the same block size
+        tail = self.raw.index_of(self.covered_until[index]) + 1
+        tail_times = self.raw.view('time', tail)
+        tail_values = self.raw.view(channel, tail)
+        if len(tail_times):
+            tail_times, tail_lows, tail_highs = reduce_blocks(tail_times, tail_values, tail_values, block)
+            times = np.concatenate((times, tail_times))
+            lows = np.concatenate((lows, tail_lows))
+            highs = np.concatenate((highs, tail_highs))
+
+        return min_max_pairs(times, lows, highs)
+
+
+class AggregateTier:
+    """
+    Fixed-size history of one point per `period` seconds, holding the min,
+    mean and max of each channel over that period. The period being filled
+    is kept in running accumulators and shown as a partial point.
+    """
+
+    def __init__(self, period, points, channels):
+        self.period = float(period)
+        self.channels = tuple(channels)
+        names = ['time'] + [f"{name}_{kind}" for name in self.channels for kind in ('min', 'mean', 'max')]
+        self.buffer = HistoryBuffer(points, channels=names)
+        self.bucket = None      # Index (time // period) of the period being filled
+        self.partial = {}       # Per channel: [min, sum, max, count] of that period
+        self.first_time = None  # Time of the first sample aggregated
+
+    @property
+    def span(self):
+        """Seconds of history the tier can hold."""
+        return self.period * self.buffer.capacity
+
+    @property
+    def nbytes(self):
+        return self.buffer.nbytes
+
+    def oldest_time(self):
+        """
+        Time of the earliest sample the tier still covers: the first sample
+        aggregated, until its period is dropped; then the start of the oldest
+        period kept, which the samples follow on the sampling grid.
+        """
+        if self.first_time is None:
+            return None
+        if len(self.buffer):
+            return max(self.first_time, self.buffer.first('time'))
+        return self.first_time
+
+    def extend(self, time, **columns):
+        if len(time) == 0:
+            return
+        if self.first_time is None:
+            self.first_time = float(time[0])
+        buckets = np.floor(time / self.period)
+        # Runs of samples in the same period (times are in order)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+        counts = np.diff(np.append(starts, len(time)))
+        reduced = {}
+        for name in self.channels:
+            values = columns[name]
+            reduced[name] = [np.minimum.reduceat(values, starts), np.add.reduceat(values, starts),
+                             np.maximum.reduceat(values, starts), counts.astype(np.float64)]
+
+        # The first run continues the period being filled, if it is the same
+        if self.bucket is not None and buckets[0] == self.bucket:
+            for name in self.channels:
+                low, total, high, count = self.partial[name]
+                run = reduced[name]
+                run[0][0] = min(run[0][0], low)
+                run[1][0] += total
+                run[2][0] = max(run[2][0], high)
+                run[3][0] += count
+        elif self.bucket is not None:
+            self._store(np.array([self.bucket]), {name: [np.array([value]) for value in self.partial[name]]
+                                                  for name in self.channels})
+
+        # Every run but the last is a finished period
+        if len(starts) > 1:
+            self._store(buckets[starts[:-1]], {name: [part[:-1] for part in reduced[name]]
+                                               for name in self.channels})
+        self.bucket = buckets[starts[-1]]
+        self.partial = {name: [part[-1] for part in reduced[name]] for name in self.channels}
+
+    def _store(self, buckets, reduced):
+        columns = {'time': buckets * self.period}
+        for name in self.channels:
+            low, total, high, count = reduced[name]
+            columns[f"{name}_min"] = low
+            columns[f"{name}_mean"] = total / count
+            columns[f"{name}_max"] = high
+        self.buffer.extend(**columns)
+
+    def envelope(self, channel, x_min, x_max, max_columns):
+        """(x, y) min/max pairs of `channel` from x_min on, at most about 2 * max_columns points."""
+        start = max(0, self.buffer.index_of(x_min) - 1)
+        times = self.buffer.view('time', start)
+        lows = self.buffer.view(f"{channel}_min", start)
+        highs = self.buffer.view(f"{channel}_max", start)
+        if self.bucket is not None:
+            low, _, high, _ = self.partial[channel]
+            times = np.append(times, self.bucket * self.period)
+            lows = np.append(lows, low)
+            highs = np.append(highs, high)
+        if len(times) > max_columns:
+            times, lows, highs = reduce_blocks(times, lows, highs, math.ceil(len(times) / max_columns))
+        return min_max_pairs(times, lows, highs)
+
+
+class TieredHistory:
+    """
+    Recent raw samples (a LodHistory) plus coarser AggregateTiers for older
+    data, e.g. 1 s and 1 min min/mean/max, all in fixed memory. Every sample
+    goes to every tier; a view is drawn from the finest store that still
+    reaches back to its left edge, so days or weeks stay viewable.
+    """
+
+    def __init__(self, capacity, channels=('pressure',), tiers=()):
+        """
+        capacity: raw samples kept.
+        tiers: ((period_s, points), ...), e.g. parse_tiers() of the config.
+        """
+        self.channels = tuple(channels)
+        self.recent = LodHistory(capacity, channels=self.channels)
+        self.tiers = [AggregateTier(period, points, self.channels) for period, points in sorted(tiers)]
+        self.received = 0       # Samples extended, to tell whether the raw store dropped any
+
+    def __len__(self):
+        return len(self.recent)
+
+    @property
+    def capacity(self):
+        return self.recent.capacity
+
+    @property
+    def nbytes(self):
+        return self.recent.nbytes + sum(tier.nbytes for tier in self.tiers)
+
+    def span(self, sample_period):
+        """Seconds of history kept, given the time between raw samples."""
+        return max([self.capacity * sample_period] + [tier.span for tier in self.tiers])
+
+    def oldest_time(self):
+        """Time of the oldest data held by any store."""
+        times = [tier.oldest_time() for tier in self.tiers] + [self.recent.first('time')]
+        return min(t for t in times if t is not None)
+
+    def first(self, name):
+        return self.recent.first(name)
+
+    def last(self, name):
+        return self.recent.last(name)
+
+    def view(self, name, first=0):
+        return self.recent.view(name, first)
+
+    def extend(self, time, **columns):
+        time = np.asarray(time, dtype=np.float64)
+        columns = {name: np.asarray(values, dtype=np.float64) for name, values in columns.items()}
+        self.recent.extend(time=time, **columns)
+        self.received += len(time)
+        for tier in self.tiers:
+            tier.extend(time, **columns)
+
+    def envelope(self, channel, x_min, x_max, max_columns):
+        """
+        (x, y) arrays drawing `channel` between x_min and x_max; see
+        LodHistory.envelope. The raw samples are used while they still hold
+        the whole session, or reach back to x_min.
+        """
+        if not self.tiers or self.received <= self.capacity or x_min >= self.recent.first('time'):
+            return self.recent.envelope(channel, x_min, x_max, max_columns)
+        for tier in self.tiers:
+            oldest = tier.oldest_time()
+            if oldest is not None and oldest <= x_min:
+                return tier.envelope(channel, x_min, x_max, max_columns)
+        return self.tiers[-1].envelope(channel, x_min, x_max, max_columns)
+
+
+class EventHistory:
+    """
+    Values that change rarely (setpoint, control mode), stored as change
+    events rather than one value per sample: a record() that repeats the
+    current value costs nothing, and drawing only touches the events in view.
+    """
+
+    def __init__(self, capacity=4096):
+        self.events = HistoryBuffer(capacity, channels=('time', 'value'))
+
+    def __len__(self):
+        return len(self.events)
+
+    def record(self, time, value):
+        """Stores `value` from `time` on, if it differs from the current one."""
+        if len(self.events) and self.events.last('value') == value:
+            return
+        self.events.extend(time=[time], value=[value])
+
+    def _in_view(self, x_min, x_max):
+        """Times and values of the events in force between x_min and x_max."""
+        times = self.events.view('time')
+        first = max(0, int(np.searchsorted(times, x_min, side='right')) - 1)
+        last = max(first + 1, int(np.searchsorted(times, x_max, side='right')))
+        return times[first:last], self.events.view('value')[first:last]
+
+    def values_at(self, times):
+        """Value in force at each of `times` (NaN before the first event)."""
+        in_force = np.concatenate(([np.nan], self.events.view('value')))
+        return in_force[np.searchsorted(self.events.view('time'), times, side='right')]
+
+    def steps(self, x_min, x_max):
+        """(x, y) of the step curve from x_min (or the first event) to x_max."""
+        if not len(self.events):
+            return np.empty(0), np.empty(0)
+        times, values = self._in_view(x_min, x_max)
+        times = np.maximum(times, x_min)
+        # Each value holds until the next event: horizontal, then vertical
+        x = np.empty(2 * len(times))
+        x[0::2] = times
+        x[1:-1:2] = times[1:]
+        x[-1] = max(x_max, times[-1])
+        return x, np.repeat(values, 2)
+
+    def segments(self, x_min, x_max):
+        """[(start, end, value), ...] of the values in force between x_min and x_max."""
+        if not len(self.events):
+            return []
+        times, values = self._in_view(x_min, x_max)
+        ends = np.append(times[1:], max(x_max, times[-1]))
+        return [(max(start, x_min), end, value)
+                for start, end, value in zip(times.tolist(), ends.tolist(), values.tolist())]
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+Byte-level propar emulator on a Linux pseudo-terminal.
+
+Unlike SimulatedInstrument, which replaces propar.instrument in-process,
+this one sits at the other end of a serial port: the application opens the
+pty with the real propar library (framing, pyserial, its reader and message
+threads) exactly as it opens a P-800. Requests are decoded from binary propar
+frames (DLE STX ... DLE ETX), answered from a SimulatedInstrument model, and
+the answer is held back for the time the bytes would take on the wire at the
+configured baud rate, plus a configurable device response delay.
+
+    python propar_emulator.py --baud 38400 --delay 0.002 --link /tmp/ttyP800
+    python flowControl.py --port /tmp/ttyP800
+"""
+import argparse
+import os
+import random
+import select
+import struct
+import threading
+import time
+import tty
+
+import propar
+
+from simulated_instrument import SimulatedInstrument
+
+# Parameters served, by FlowDDE number
+SERVED_PARAMETERS = (1, 7, 8, 9, 12, 21, 28, 55, 72, 114, 115, 116, 117, 118, 119, 120, 121, 129,
+                     141, 165, 166, 167, 168, 169, 182, 254, 361)
+
+# Parameters the device measures itself; writing them is refused
+READ_ONLY_PARAMETERS = (8, 28, 55)
+
+BYTE_DLE = 0x10
+BYTE_STX = 0x02
+BYTE_ETX = 0x03
+
+# Start, 8 data and stop bit per byte
+BITS_PER_BYTE = 10
+
+
+def encode_frame(message):
+    """propar message dict (seq, node, len, data) -> binary frame, DLE bytes doubled."""
+    body = [message['seq'], message['node'], message['len']] + list(message['data'])
+    frame = [BYTE_DLE, BYTE_STX]
+    for byte in body:
+        frame.append(byte)
+        if byte == BYTE_DLE:
+            frame.append(byte)
+    frame += [BYTE_DLE, BYTE_ETX]
+    return bytes(frame)
+
+
+class FrameDecoder:
+    """Collects received bytes into propar message dicts, as _propar_provider does on the host side."""
+
+    def __init__(self):
+        self.buffer = []
+        self.in_frame = False
+        self.escape = False
+        self.errors = 0
+
+    def feed(self, data):
+        """Returns the messages completed by `data`."""
+        messages = []
+        for byte in data:
+            if not self.in_frame:
+                # Waiting for DLE STX
+                if self.escape:
+                    self.escape = False
+                    if byte == BYTE_STX:
+                        self.in_frame = True
+                        self.buffer = []
+                elif byte == BYTE_DLE:
+                    self.escape = True
+            elif self.escape:
+                self.escape = False
+                if byte == BYTE_DLE:
+                    self.buffer.append(byte)
+                elif byte == BYTE_ETX:
+                    self.in_frame = False
+                    if len(self.buffer) > 3:
+                        messages.append({'seq': self.buffer[0], 'node': self.buffer[1],
+                                         'len': self.buffer[2], 'data': self.buffer[3:]})
+                    else:
+                        self.errors += 1
+                else:
+                    self.in_frame = False
+                    self.errors += 1
+            elif byte == BYTE_DLE:
+                self.escape = True
+            else:
+                self.buffer.append(byte)
+        return messages
+
+
+class ProparEmulator:
+    """
+    Serves one P-800 on a pty. The device model is a SimulatedInstrument
+    without its own latency; the timing comes from the baud rate and
+    response_delay instead.
+    """
+
+    def __init__(self, device=None, baudrate=38400, response_delay=0.002, address=0x80, link=None,
+                 dropout_rate=0.0):
+        """
+        device: SimulatedInstrument to serve (a default one if None).
+        baudrate: line speed used to pace the answers, in bit/s.
+        response_delay: device processing time per request, in seconds.
+        link: optional path of a symlink to the pty, for a stable port name.
+        dropout_rate: probability that a request is not answered at all.
+        """
+        self.device = device if device is not None else SimulatedInstrument(latency=0.0, latency_jitter=0.0)
+        self.baudrate = baudrate
+        self.response_delay = response_delay
+        self.address = address
+        self.link = link
+        self.dropout_rate = dropout_rate
+        self.random = random.Random()
+        self.builder = propar._propar_builder()
+
+        db = propar.database()
+        self.by_dde = {}       # dde_nr -> database parameter
+        self.by_propar = {}    # (proc_nr, parm_nr) -> dde_nr
+        for dde_nr in SERVED_PARAMETERS:
+            parm = db.get_parameter(dde_nr)
+            self.by_dde[dde_nr] = parm
+            self.by_propar[(parm['proc_nr'], parm['parm_nr'])] = dde_nr
+
+        self.master_fd = None
+        self.slave_fd = None
+        self.port = None
+        self._thread = None
+        self._running = False
+
+        # Counters
+        self.requests = 0
+        self.dropped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    # --- Port ---
+
+    def open(self):
+        """Creates the pty and starts serving it. Returns the port to connect to."""
+        self.master_fd, self.slave_fd = os.openpty()
+        # No echo or line editing: the host side sees only the bytes we write.
+        # The slave stays open here too, so a client closing the port does not end the emulator.
+        tty.setraw(self.slave_fd)
+        self.port = os.ttyname(self.slave_fd)
+        if self.link:
+            if os.path.islink(self.link):
+                os.remove(self.link)
+            os.symlink(self.port, self.link)
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, name='propar-emulator', daemon=True)
+        self._thread.start()
+        return self.link or self.port
+
+    def close(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        for fd in (self.master_fd, self.slave_fd):
+            if fd is not None:
+                os.close(fd)
+        self.master_fd = self.slave_fd = None
+        if self.link and os.path.islink(self.link):
+            os.remove(self.link)
+
+    def _serve(self):
+        decoder = FrameDecoder()
+        while self._running:
+            readable, _, _ = select.select([self.master_fd], [], [], 0.1)
+            if not readable:
+                continue
+            try:
+                data = os.read(self.master_fd, 1024)
+            except OSError:
+                continue
+            self.bytes_in += len(data)
+            for message in decoder.feed(data):
+                received = time.perf_counter()
+                request_bytes = len(encode_frame(message))
+                answer = self.handle(message)
+                if answer is None:
+                    continue
+                frame = encode_frame(answer)
+                # The request and the answer both cross the line at the baud rate
+                wire_time = (request_bytes + len(frame)) * BITS_PER_BYTE / self.baudrate
+                remaining = received + wire_time + self.response_delay - time.perf_counter()
+                if remaining > 0:
+                    time.sleep(remaining)
+                os.write(self.master_fd, frame)
+                self.bytes_out += len(frame)
+
+    # --- Protocol ---
+
+    def handle(self, message):
+        """Answers one propar message; None if no answer is due."""
+        if message['node'] not in (self.address, 0x80):
+            return None
+        self.requests += 1
+        if self.dropout_rate and self.random.random() < self.dropout_rate:
+            # The host runs into its own response timeout
+            self.dropped += 1
+            return None
+        command = message['data'][0]
+        if command == propar.PP_COMMAND_REQUEST_PARM:
+            return self._answer_request(message)
+        if command in (propar.PP_COMMAND_SEND_PARM_WITH_ACK, propar.PP_COMMAND_SEND_PARM):
+            status, position = self._apply_write(message)
+            if command == propar.PP_COMMAND_SEND_PARM:
+                return None
+            return self.builder.create_pp_status_message(message, status, position)
+        return self.builder.create_pp_status_message(message, propar.PP_STATUS_COMMAND)
+
+    def _answer_request(self, message):
+        requested = list(self.builder.read_pp_request_parameter_message(message))
+        if not requested or any(parm['status'] != propar.PP_STATUS_OK for parm in requested):
+            return self.builder.create_pp_status_message(message, propar.PP_STATUS_PROTOCOL_ERROR)
+
+        dde_numbers = []
+        for parm in requested:
+            dde_nr = self.by_propar.get((parm['proc_nr'], parm['parm_nr']))
+            if dde_nr is None:
+                return self.builder.create_pp_status_message(message, propar.PP_STATUS_PARM_NUMBER,
+                                                             parm['status_pos'])
+            dde_numbers.append(dde_nr)
+
+        # One chained read of the model, so the answer is a consistent snapshot
+        values = self.device.read_parameters([{'dde_nr': dde_nr} for dde_nr in dde_numbers])
+
+        answer = []
+        for parm, dde_nr, value in zip(requested, dde_numbers, values):
+            if value['status'] != propar.PP_STATUS_OK:
+                return self.builder.create_pp_status_message(message, value['status'], parm['status_pos'])
+            parm_type = self.by_dde[dde_nr]['parm_type']
+            data = value['data']
+            if parm_type == propar.PP_TYPE_STRING:
+                data = str(data)
+            elif parm_type == propar.PP_TYPE_FLOAT:
+                data = float(data)
+            else:
+                data = int(data)
+            answer.append({'proc_nr': parm['proc_nr'], 'parm_nr': parm['parm_nr'],
+                           'proc_index': parm['proc_nr'], 'parm_index': parm['parm_nr'],
+                           'parm_type': parm_type, 'parm_size': parm['parm_size'], 'data': data})
+        return self.builder.build_pp_send_parameter_message(message, answer)
+
+    def _apply_write(self, message):
+        """Writes the parameters of a send message to the model. Returns (status, status position)."""
+        for parm in self.builder.read_pp_send_parameter_message(message):
+            if parm['status'] != propar.PP_STATUS_OK:
+                return propar.PP_STATUS_PROTOCOL_ERROR, parm['status_pos']
+            dde_nr = self.by_propar.get((parm['proc_nr'], parm['parm_nr']))
+            if dde_nr is None:
+                return propar.PP_STATUS_PARM_NUMBER, parm['status_pos']
+            if dde_nr in READ_ONLY_PARAMETERS:
+                return propar.PP_STATUS_READONLY, parm['status_pos']
+            data = parm['data']
+            parm_type = self.by_dde[dde_nr]['parm_type']
+            if parm_type == propar.PP_TYPE_FLOAT:
+                # Floats travel as the 32-bit pattern
+                data = struct.unpack('f', struct.pack('I', data))[0]
+            elif parm_type in (propar.PP_TYPE_SINT16, propar.PP_TYPE_BSINT16):
+                data = struct.unpack('h', struct.pack('H', data))[0]
+            if not self.device.writeParameter(dde_nr, data):
+                return propar.PP_STATUS_PARM_VALUE, parm['status_pos']
+        return propar.PP_STATUS_OK, 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulate a Bronkhorst P-800 on a pseudo-terminal.")
+    parser.add_argument('--baud', type=int, default=38400, help="line speed used to pace answers (default 38400)")
+    parser.add_argument('--delay', type=float, default=0.002,
+                        help="device response delay per request in seconds (default 0.002)")
+    parser.add_argument('--link', help="also expose the pty under this path, e.g. /tmp/ttyP800")
+    parser.add_argument('--dropout-rate', type=float, default=0.0,
+                        help="probability that a request is not answered (default 0)")
+    args = parser.parse_args()
+
+    emulator = ProparEmulator(baudrate=args.baud, response_delay=args.delay, link=args.link,
+                              dropout_rate=args.dropout_rate)
+    port = emulator.open()
+    print(f"Emulating a P-800 on {port} ({emulator.port}), {args.baud} baud, {args.delay * 1000:.1f} ms response delay")
+    print("Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emulator.close()
+        print(f"Served {emulator.requests} requests ({emulator.dropped} dropped), "
+              f"{emulator.bytes_in} bytes in, {emulator.bytes_out} bytes out")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Journal of the safety events (over-pressure alarms and purges), with the
+time each stage of the response took.
+
+The SafetySupervisor of the acquisition loop traces every purge: each stage
+is a time.perf_counter() stamp taken where it happens, stored in
+milliseconds since the detection (the status read that showed the alarm, or
+the purge button). perf_counter is system-wide, so the GUI adds its own
+dispatch stage to traces made in the acquisition process. Stages:
+    detection       0
+    setpoint_write  setpoint at the purge target acknowledged
+    pid_switch      PID control acknowledged (the alarm-to-action time)
+    gui_dispatch    the GUI handled the purge event
+    alarm_reset     alarm reset (param 114) acknowledged, alarms only
+    close           valve close acknowledged (target reached or timeout)
+
+Each trace is appended to the journal file as one JSON line, so the record
+outlives the session; the percentiles cover the traces of the file read at
+start-up plus the new ones.
+"""
+import json
+import os
+from collections import deque
+
+from acquisition import percentile
+
+STAGES = ('detection', 'setpoint_write', 'pid_switch', 'gui_dispatch', 'alarm_reset', 'close')
+
+
+class SafetyJournal:
+    """Safety event traces, in memory and in a JSON-lines file."""
+
+    def __init__(self, path=None, window=1000):
+        """
+        path: journal file (nothing written if empty).
+        window: number of traces kept for the percentiles.
+        """
+        self.path = path
+        self.traces = deque(maxlen=window)
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self.traces.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Cannot read the safety journal {self.path}: {e}")
+
+    def record(self, trace):
+        """Adds a trace: {'id', 'time', 'reason', 'code', 'end', 'stages': {stage: ms}}."""
+        self.traces.append(trace)
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(trace) + '\n')
+        except OSError as e:
+            print(f"Cannot write to the safety journal {self.path}: {e}")
+
+    def summary(self, reason='alarm'):
+        """
+        Percentiles of every stage over the traces of one reason ('alarm' or
+        'manual'; None for all): {stage: {'count', 'p50_ms', 'p99_ms', 'max_ms'}}.
+        Stages never reached (a cancelled purge has no close) are not counted.
+        """
+        traces = [t for t in self.traces if reason is None or t.get('reason') == reason]
+        summary = {}
+        for stage in STAGES:
+            times = [t['stages'][stage] for t in traces if t.get('stages', {}).get(stage) is not None]
+            if times:
+                summary[stage] = {'count': len(times), 'p50_ms': percentile(times, 50),
+                                  'p99_ms': percentile(times, 99), 'max_ms': max(times)}
+        return summary
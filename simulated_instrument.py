@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+Simulated EL-PRESS P-800 with the same surface as propar.instrument
+(readParameter, writeParameter, read_parameters, db, master), so the GUI and
+the acquisition path can run and be benchmarked without hardware.
+
+Model: an inlet valve feeds the conduit from a supply, a relief valve vents
+it; the on-board PID (167/168/169, Kspeed 254, hysteresis 361) drives both
+in control mode 0. The deviation alarm (116/117/118/182, setpoint change
+120/121) sets the response alarm bit in param 28 and is reset with 114.
+Every transaction costs a configurable serial latency, and can drop out.
+"""
+import functools
+import random
+import threading
+import time
+
+import propar
+
+# Raw valve output (param 55) of a fully open valve; see calculate_valve_percentage
+VALVE_FULL_SCALE = 0.6167 * 16777215
+
+# Param 28 (alarm info) bits
+STATUS_ERROR = 1
+STATUS_WARNING = 2
+STATUS_MAX_ALARM = 8
+STATUS_RESPONSE_ALARM = 32
+
+
+class _SimulatedSerial:
+    def __init__(self):
+        self.is_open = True
+
+
+class _SimulatedProvider:
+    """Stands in for the propar provider: the port can be stopped and restarted."""
+
+    def __init__(self):
+        self.serial = _SimulatedSerial()
+
+    def stop(self):
+        self.serial.is_open = False
+
+    def start(self):
+        self.serial.is_open = True
+
+
+class _SimulatedMaster:
+    def __init__(self, db):
+        self.propar = _SimulatedProvider()
+        self.db = db
+        self.response_timeout = 0.5
+
+
+class SimulatedInstrument:
+    """
+    Drop-in replacement for propar.instrument(comport). Keyword arguments set
+    the model; everything has a default so SimulatedInstrument('SIM') works.
+    """
+
+    # Integration step of the physical model, in seconds
+    STEP = 0.001
+
+    def __init__(self, comport=None, address=0x80, baudrate=38400, channel=1,
+                 capacity=100.0, supply_pressure=110.0, volume=1.0, inlet_conductance=2.0,
+                 relief_conductance=2.0, leak=0.001, latency=0.010, latency_jitter=0.002,
+                 dropout_rate=0.0, seed=None):
+        """
+        capacity: full scale in bar (param 21); supply_pressure: upstream pressure in bar.
+        volume: conduit volume in litres; *_conductance: fully open valve flow in litres/s per bar;
+        leak: fraction of the pressure lost per second with both valves closed.
+        latency / latency_jitter: seconds per bus transaction; dropout_rate: probability
+        that a transaction gets no answer (costs the propar response timeout).
+        """
+        # No OS device behind it, so there is nothing for the reconnect logic to look for
+        self.comport = None
+        self.address = address
+        self.channel = channel
+        self.db = propar.database()
+        self.master = _SimulatedMaster(self.db)
+
+        self.capacity = float(capacity)
+        self.supply_pressure = float(supply_pressure)
+        self.volume = float(volume)
+        self.inlet_conductance = float(inlet_conductance)
+        self.relief_conductance = float(relief_conductance)
+        self.leak = float(leak)
+        self.latency = float(latency)
+        self.latency_jitter = float(latency_jitter)
+        self.dropout_rate = float(dropout_rate)
+        self.random = random.Random(seed)
+
+        self._lock = threading.Lock()
+        self._offline_until = 0.0
+        self.inlet_leak = 0.0    # Flow through a leaking inlet seat, as a fraction of inlet_conductance
+
+        # Process state
+        self.pressure = 0.0      # bar
+        self.inlet = 0.0         # valve openings 0..1
+        self.relief = 0.0
+        self.integral = 0.0
+        self.last_error = 0.0
+        self.deviation_time = 0.0  # How long the deviation alarm condition has lasted
+        self.alarm_bits = 0
+        self.last_update = time.monotonic()
+
+        self.parameters = {
+            1: 'SIM-P800-0001',   # Serial number
+            7: 0,                 # Init/reset mode
+            9: 0,                 # Setpoint (0..32000)
+            12: 3,                # Control mode: 0 PID, 3 valve closed, 8 valve fully open
+            21: self.capacity,    # Capacity
+            72: 128,              # Knormal
+            114: 0,               # Reset alarm
+            115: 'SIMULATED',     # User tag
+            116: 32000,           # Alarm max limit / deviation above
+            117: 32000,           # Alarm min limit / deviation below
+            118: 0,               # Alarm mode: 0 off, 1 absolute, 2 relative to setpoint
+            119: 0,               # Alarm output mode
+            120: 0,               # Setpoint change on alarm
+            121: 0,               # New setpoint on alarm
+            129: 'bar',           # Capacity unit
+            141: 128,             # Kstable
+            165: 128,             # Kopen
+            166: 0,               # Controller features
+            167: 2000.0,          # PID Kp
+            168: 0.25,            # PID Ti (s)
+            169: 0.0,             # PID Td (s)
+            182: 0,               # Alarm delay (s)
+            254: 1.0,             # Kspeed
+            361: 0.001,           # Controller hysteresis (fraction of full scale)
+        }
+
+    # --- Physical model ---
+
+    def _advance(self):
+        """Integrates the model up to now. Must be called with the lock held."""
+        now = time.monotonic()
+        # A long pause (debugger, suspended process) is not worth more than 10 s of steps
+        if now - self.last_update > 10.0:
+            self.last_update = now - 10.0
+        steps = int((now - self.last_update) / self.STEP)
+        # The fraction of a step left over is carried to the next call
+        self.last_update += steps * self.STEP
+        for _ in range(steps):
+            self._step(self.STEP)
+
+    def _step(self, dt):
+        p = self.parameters
+        setpoint = p[9] / 32000.0 * self.capacity
+        mode = p[12]
+
+        if mode == 0:
+            # PID on the normalised error; positive output opens the inlet, negative the relief
+            error = (setpoint - self.pressure) / self.capacity
+            if abs(error) < p[361]:
+                error = 0.0
+            gain = p[167] / 2000.0 * p[254] * 20.0
+            ti = max(p[168], 1e-3)
+            derivative = (error - self.last_error) / dt
+            self.last_error = error
+            integral = self.integral + error * dt / ti
+            output = gain * (error + integral + p[169] * derivative)
+            # Anti-windup: the integral only moves while the valves are not saturated
+            if abs(output) <= 1.0:
+                self.integral = integral
+            output = max(-1.0, min(1.0, output))
+            self.inlet = max(output, 0.0)
+            self.relief = max(-output, 0.0)
+        elif mode == 8:
+            self.inlet, self.relief = 1.0, 0.0
+        else:
+            self.inlet = self.relief = 0.0
+            self.integral = 0.0
+
+        flow_in = (self.inlet_conductance * (self.inlet + self.inlet_leak)
+                   * max(self.supply_pressure - self.pressure, 0.0))
+        flow_out = (self.relief_conductance * self.relief + self.leak) * self.pressure
+        self.pressure = max(0.0, self.pressure + (flow_in - flow_out) / self.volume * dt)
+
+        self._check_alarm(dt)
+
+    def _check_alarm(self, dt):
+        p = self.parameters
+        mode = p[118]
+        if mode == 0:
+            self.deviation_time = 0.0
+            return
+        measure = self.pressure / self.capacity * 32000.0
+        if mode == 2:
+            above = measure > p[9] + p[116]
+            below = measure < p[9] - p[117]
+        else:
+            above = measure > p[116]
+            below = measure < p[117]
+        if not (above or below):
+            self.deviation_time = 0.0
+            return
+        self.deviation_time += dt
+        if self.deviation_time >= p[182] and not self.alarm_bits & STATUS_RESPONSE_ALARM:
+            self.alarm_bits |= STATUS_RESPONSE_ALARM | (STATUS_MAX_ALARM if above else 0)
+            if p[120]:
+                p[9] = p[121]
+
+    def inject_pressure(self, bar):
+        """Adds `bar` to the conduit pressure at once (a disturbance, for tests and benchmarks)."""
+        with self._lock:
+            self._advance()
+            self.pressure = max(0.0, self.pressure + bar)
+
+    def set_inlet_leak(self, fraction):
+        """Lets the inlet pass `fraction` of its full flow whatever the controller does (0 = tight)."""
+        with self._lock:
+            self._advance()
+            self.inlet_leak = float(fraction)
+
+    def go_offline(self, seconds):
+        """Stops answering for `seconds` (a cable glitch)."""
+        self._offline_until = time.monotonic() + seconds
+
+    # --- Bus ---
+
+    def _transaction(self, count=1):
+        """Spends the bus time of one message. Returns False if it gets no answer."""
+        if not self.master.propar.serial.is_open:
+            return False
+        if time.monotonic() < self._offline_until or self.random.random() < self.dropout_rate:
+            time.sleep(self.master.response_timeout)
+            return False
+        delay = self.latency + 0.001 * (count - 1)
+        if self.latency_jitter:
+            delay += self.random.uniform(-self.latency_jitter, self.latency_jitter)
+        time.sleep(max(delay, 0.0))
+        return True
+
+    def _read(self, dde_nr):
+        """Current value of a parameter, None if the device does not have it. Lock held."""
+        if dde_nr == 8:
+            return int(round(self.pressure / self.capacity * 32000.0))
+        if dde_nr == 28:
+            return self.alarm_bits
+        if dde_nr == 55:
+            return int(self.inlet * VALVE_FULL_SCALE)
+        return self.parameters.get(dde_nr)
+
+    def _write(self, dde_nr, data):
+        """Stores a written value. Returns False for parameters the device does not have. Lock held."""
+        if dde_nr not in self.parameters:
+            return False
+        if dde_nr == 114 and int(data) == 2:
+            self.alarm_bits = 0
+            self.deviation_time = 0.0
+        if dde_nr == 12 and data != self.parameters[12]:
+            self.integral = 0.0
+        current = self.parameters[dde_nr]
+        self.parameters[dde_nr] = type(current)(data) if not isinstance(current, str) else str(data)
+        return True
+
+    def readParameter(self, dde_nr, channel=None):
+        if not self._transaction():
+            return None
+        with self._lock:
+            self._advance()
+            return self._read(dde_nr)
+
+    def writeParameter(self, dde_nr, data, channel=None):
+        if not self._transaction():
+            return False
+        with self._lock:
+            self._advance()
+            return self._write(dde_nr, data)
+
+    def read_parameters(self, parameters, callback=None, channel=None):
+        if not self._transaction(len(parameters)):
+            return [{'status': propar.PP_STATUS_TIMEOUT_ANSWER, 'data': None}]
+        with self._lock:
+            self._advance()
+            response = []
+            for parm in parameters:
+                value = self._read(parm['dde_nr'])
+                status = propar.PP_STATUS_OK if value is not None else propar.PP_STATUS_PARM_NUMBER
+                response.append(dict(parm, data=value, status=status))
+        if callback is not None:
+            callback(response)
+        return response
+
+
+def factory_from_config(section):
+    """
+    Returns an instrument factory (called with the com port, like propar.instrument)
+    built from a config.ini [Simulation] section. It is a functools.partial,
+    so it can be handed to the acquisition process.
+    """
+    settings = {}
+    for name in ('capacity', 'supply_pressure', 'volume', 'inlet_conductance', 'relief_conductance',
+                 'leak', 'latency', 'latency_jitter', 'dropout_rate'):
+        if name in section:
+            settings[name] = section.getfloat(name)
+    if section.get('seed', '').strip():
+        settings['seed'] = section.getint('seed')
+    return functools.partial(SimulatedInstrument, **settings)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures. The modules live at the top of the repository, next to
+flowControl.py, and are imported from there.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simulated_instrument import SimulatedInstrument  # noqa: E402
+
+
+class RecordingInstrument(SimulatedInstrument):
+    """
+    Simulated P-800 without bus latency, recording the writes that reach it.
+    fail[dde_nr] makes the writes of a parameter return that value (False:
+    not acknowledged) or raise it (an exception).
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('latency', 0.0)
+        kwargs.setdefault('latency_jitter', 0.0)
+        super().__init__('SIM', **kwargs)
+        self.writes = []
+        self.fail = {}
+
+    def writeParameter(self, dde_nr, data, channel=None):
+        self.writes.append((dde_nr, data))
+        if dde_nr in self.fail:
+            outcome = self.fail[dde_nr]
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+        return super().writeParameter(dde_nr, data, channel)
+
+
+@pytest.fixture
+def instrument():
+    return RecordingInstrument(seed=1)
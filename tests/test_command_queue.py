@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""CommandQueue rules that decide whether a write reaches the bus."""
+import time
+
+import pytest
+
+from acquisition import CommandQueue
+
+
+def test_safety_runs_before_routine_past_the_deadline(instrument):
+    commands = CommandQueue()
+    routine = commands.submit([('write', 9, 16000)])
+    safety = commands.submit([('write', 12, 3)], CommandQueue.SAFETY)
+
+    # The next tick is already due: only the SAFETY command may start
+    commands.run_ready(instrument, deadline=time.monotonic() - 1.0)
+    assert instrument.writes == [(12, 3)]
+    assert safety.result(0) == [True]
+    assert not routine.done()
+
+    commands.run_ready(instrument)
+    assert instrument.writes == [(12, 3), (9, 16000)]
+    assert routine.result(0) == [True]
+
+
+def test_safety_write_replaces_queued_routine_write(instrument):
+    commands = CommandQueue()
+    routine = commands.submit([('write', 12, 0), ('write', 9, 16000)])
+    commands.submit([('write', 12, 3)], CommandQueue.SAFETY)
+
+    commands.run_ready(instrument)
+    # The routine "back to PID" is dropped, its setpoint write still goes out
+    assert instrument.writes == [(12, 3), (9, 16000)]
+    assert routine.result(0) == [None, True]
+    assert instrument.parameters[12] == 3
+
+
+def test_wait_requeues_without_blocking(instrument):
+    commands = CommandQueue()
+    pulse = commands.submit([('write', 114, 0), ('wait', 0.2), ('write', 114, 2)])
+
+    start = time.monotonic()
+    commands.run_ready(instrument)
+    assert time.monotonic() - start < 0.1
+    assert instrument.writes == [(114, 0)]
+    assert not pulse.done()
+    assert commands.pending() == 1
+    assert commands.next_delay() > 0.1
+
+    # Other commands run during the pause
+    other = commands.submit([('write', 9, 8000)])
+    commands.run_ready(instrument)
+    assert other.result(0) == [True]
+    assert not pulse.done()
+
+    commands.drain(instrument)
+    assert pulse.result(0) == [True, None, True]
+    assert instrument.writes == [(114, 0), (9, 8000), (114, 2)]
+
+
+def test_shadow_drops_unchanged_writes_unless_forced(instrument):
+    commands = CommandQueue()
+    for steps in ([('write', 12, 3)], [('write', 12, 3)], [('write', 12, 3, True)]):
+        commands.submit(steps)
+        commands.run_ready(instrument)
+
+    assert instrument.writes == [(12, 3), (12, 3)]
+    assert commands.shadow.skipped == 1
+
+
+def test_unacknowledged_write_invalidates_shadow(instrument):
+    commands = CommandQueue()
+    commands.submit([('write', 9, 16000)])
+    commands.run_ready(instrument)
+    assert commands.shadow.values[9] == 16000
+
+    instrument.fail[9] = False
+    failed = commands.submit([('write', 9, 8000)])
+    commands.run_ready(instrument)
+    assert failed.result(0) == [False]
+    assert 9 not in commands.shadow.values
+
+    # The value is unknown again, so the next write is sent
+    del instrument.fail[9]
+    commands.submit([('write', 9, 16000)])
+    commands.run_ready(instrument)
+    assert instrument.writes[-1] == (9, 16000)
+
+
+def test_write_exception_invalidates_shadow(instrument):
+    commands = CommandQueue()
+    commands.submit([('write', 9, 16000)])
+    commands.run_ready(instrument)
+
+    instrument.fail[9] = OSError("port closed")
+    failed = commands.submit([('write', 9, 16000, True)])
+    commands.run_ready(instrument)
+    with pytest.raises(OSError):
+        failed.result(0)
+    assert 9 not in commands.shadow.values
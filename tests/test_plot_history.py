@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""TieredHistory: which store draws the live trace, at startup and once the raw samples wrap."""
+import numpy as np
+import pytest
+
+from plot_history import AggregateTier, TieredHistory, parse_tiers
+
+# Not on a period boundary, as a real session start
+T0 = 1000.37
+RATE = 10.0
+
+
+def feed(history, seconds, start=T0, batch=4):
+    """Samples at RATE Hz from `start`, appended a frame (batch) at a time; returns their times."""
+    times = start + np.arange(int(seconds * RATE)) / RATE
+    for first in range(0, len(times), batch):
+        chunk = times[first:first + batch]
+        history.extend(chunk, pressure=np.sin(chunk))
+    return times
+
+
+def viewport(history, duration):
+    """x range of update_plot_viewport: the last `duration` seconds, clipped to the oldest data."""
+    x_max = history.last('time')
+    return max(x_max - duration, history.oldest_time()), x_max
+
+
+@pytest.fixture
+def history():
+    # 500 raw samples (50 s at 10 Hz), plus the tiers of the shipped config
+    return TieredHistory(500, tiers=parse_tiers('1:86400, 60:43200'))
+
+
+@pytest.mark.parametrize('seconds', [1, 10, 30, 49])
+def test_startup_is_drawn_from_the_raw_samples(history, seconds):
+    times = feed(history, seconds)
+
+    assert history.oldest_time() == times[0]
+    x_min, x_max = viewport(history, 50.0)
+    assert x_min == times[0]
+    x, y = history.envelope('pressure', x_min, x_max, 1000)
+    np.testing.assert_array_equal(x, times)
+
+
+def test_raw_samples_are_used_before_they_wrap_whatever_x_min(history):
+    times = feed(history, 30)
+
+    x, _ = history.envelope('pressure', T0 - 600.0, times[-1], 1000)
+    np.testing.assert_array_equal(x, times)
+
+
+def test_tier_oldest_time_is_the_first_sample_not_the_period_start():
+    tier = AggregateTier(60.0, 10, ('pressure',))
+    tier.extend(np.array([T0, T0 + 0.1]), pressure=np.array([1.0, 2.0]))
+    assert tier.oldest_time() == T0
+
+    # Finished periods stored, the first one still held
+    times = T0 + np.arange(0, 300, 0.5)
+    tier.extend(times[1:], pressure=np.ones(len(times) - 1))
+    assert tier.oldest_time() == T0
+
+
+def test_tier_oldest_time_once_its_first_period_is_dropped():
+    tier = AggregateTier(1.0, 10, ('pressure',))
+    times = T0 + np.arange(int(30 * RATE)) / RATE
+    tier.extend(times, pressure=np.ones(len(times)))
+    assert tier.oldest_time() == tier.buffer.first('time')
+    assert tier.oldest_time() > T0
+
+
+def test_after_wrapping_older_ranges_come_from_the_tiers(history):
+    times = feed(history, 120)
+    first_raw = history.first('time')
+    assert first_raw > T0
+    assert history.oldest_time() == T0
+
+    # The live window falls inside the raw samples (from the one before x_min)
+    x, _ = history.envelope('pressure', times[-1] - 40.0, times[-1], 1000)
+    assert x[0] <= times[-1] - 40.0 and x[-1] == times[-1]
+    np.testing.assert_allclose(np.diff(x), 1.0 / RATE)
+
+    # A longer one is drawn from the 1 s tier, one min/max pair per second
+    x, _ = history.envelope('pressure', T0 + 10.0, times[-1], 1000)
+    assert x[0] < first_raw
+    np.testing.assert_allclose(x % 1.0, 0.0, atol=1e-9)
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""SafetySupervisor: the over-pressure chain run by the acquisition loop."""
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from acquisition import CommandQueue, SafetySupervisor, bar_to_propar
+
+CAPACITY = 100.0
+TARGET_BAR = 5.0
+
+
+class FakeCommands:
+    """Records the submitted commands; the test decides when each one completes."""
+
+    def __init__(self):
+        self.submitted = []   # [steps, priority, future]
+
+    def submit(self, steps, priority=CommandQueue.ROUTINE):
+        future = Future()
+        future.set_running_or_notify_cancel()
+        self.submitted.append((list(steps), priority, future))
+        return future
+
+    def complete(self, index):
+        """Resolves a command as CommandQueue would: writes acknowledged, 'time' steps stamped."""
+        steps, _, future = self.submitted[index]
+        results = []
+        for step in steps:
+            results.append(True if step[0] == 'write' else time.perf_counter() if step[0] == 'time' else None)
+        future.set_result(results)
+
+    def complete_all(self):
+        for index, (_, _, future) in enumerate(self.submitted):
+            if not future.done():
+                self.complete(index)
+
+
+def writes(steps):
+    return [(step[1], step[2]) for step in steps if step[0] == 'write']
+
+
+@pytest.fixture
+def commands():
+    return FakeCommands()
+
+
+@pytest.fixture
+def events():
+    return []
+
+
+@pytest.fixture
+def supervisor(commands, events):
+    return SafetySupervisor(commands, CAPACITY, lambda kind, value: events.append((kind, value)),
+                            target_bar=TARGET_BAR, timeout=10.0, tolerance_bar=1.5, rearm_delay=3.0)
+
+
+def of_kind(events, kind):
+    return [value for k, value in events if k == kind]
+
+
+def start_alarm(supervisor, commands, read_time=None):
+    supervisor.on_status(32, time.perf_counter() if read_time is None else read_time)
+    commands.complete_all()
+
+
+def test_alarm_queues_the_purge_and_the_reset_pulse(supervisor, commands, events):
+    supervisor.on_status(32, time.perf_counter())
+
+    (purge, purge_priority, _), (reset, reset_priority, _) = commands.submitted
+    assert purge_priority == reset_priority == CommandQueue.SAFETY
+    assert writes(purge) == [(118, 0), (9, bar_to_propar(TARGET_BAR, CAPACITY)), (12, 0)]
+    assert writes(reset) == [(114, 0), (114, 2), (114, 0)]
+
+    commands.complete_all()
+    started, = of_kind(events, 'purge')
+    assert started['state'] == 'started' and started['reason'] == 'alarm' and started['code'] == 32
+
+
+def test_status_without_alarm_bits_does_nothing(supervisor, commands):
+    supervisor.on_status(1 | 2, time.perf_counter())
+    assert commands.submitted == []
+
+
+def test_target_reached_closes_the_valve(supervisor, commands, events):
+    start_alarm(supervisor, commands)
+
+    supervisor.on_pressure(30.0, time.perf_counter())
+    assert len(commands.submitted) == 2
+    supervisor.on_pressure(TARGET_BAR + 1.0, time.perf_counter())
+
+    close, priority, _ = commands.submitted[-1]
+    assert priority == CommandQueue.SAFETY
+    assert ('write', 12, 3, True) in close
+    assert of_kind(events, 'purge')[-1]['reason'] == 'target'
+    assert supervisor.purge is None
+
+
+def test_timeout_closes_the_valve(supervisor, commands, events):
+    start_alarm(supervisor, commands)
+
+    supervisor.on_pressure(30.0, time.perf_counter() + 11.0)
+
+    close, priority, _ = commands.submitted[-1]
+    assert priority == CommandQueue.SAFETY
+    assert ('write', 12, 3, True) in close
+    assert of_kind(events, 'purge')[-1]['reason'] == 'timeout'
+
+
+def test_purge_is_not_finished_before_its_writes_are_acknowledged(supervisor, commands):
+    supervisor.on_status(32, time.perf_counter())
+    supervisor.on_pressure(TARGET_BAR, time.perf_counter())
+    assert len(commands.submitted) == 2
+    assert supervisor.purge is not None
+
+
+def test_alarms_within_the_rearm_delay_are_ignored(supervisor, commands):
+    t0 = time.perf_counter()
+    start_alarm(supervisor, commands, t0)
+    supervisor.on_pressure(TARGET_BAR, t0 + 0.5)
+    submitted = len(commands.submitted)
+
+    # The reset takes a few reads to show
+    supervisor.on_status(32, t0 + 1.0)
+    assert len(commands.submitted) == submitted
+    assert supervisor.alarms == 1
+
+    supervisor.on_status(32, t0 + 3.5)
+    assert len(commands.submitted) > submitted
+    assert supervisor.alarms == 2
+
+
+def test_cancel_sends_one_trace_once_the_commands_are_done(supervisor, commands, events):
+    supervisor.on_status(32, time.perf_counter())
+    supervisor.cancel_purge()
+    assert of_kind(events, 'purge')[-1]['reason'] == 'cancelled'
+    assert of_kind(events, 'trace') == []
+
+    # Purge writes acknowledged, reset pulse still running
+    commands.complete(0)
+    assert of_kind(events, 'trace') == []
+
+    commands.complete(1)
+    supervisor.cancel_purge()
+    trace, = of_kind(events, 'trace')
+    assert trace['end'] == 'cancelled'
+    assert set(trace['stages']) == {'detection', 'setpoint_write', 'pid_switch', 'alarm_reset'}
+    assert 'pending' not in trace